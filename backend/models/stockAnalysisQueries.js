@@ -36,16 +36,16 @@ const getStockAnalysisBySymbolAndDate = async (stockSymbol, analysisDate) => {
     return rows;
 };
 
+// Reads the precomputed stock_screener table (db/migrations/001_stock_screener.sql),
+// where a page is a range of breakout_rank on the primary key
 const getTopStocks = async (date, limit, offset) => {
     const query = `
-    SELECT s.stock_symbol, s.stock_name, sa.*
-    FROM stock_analysis sa
-    JOIN stocks s ON sa.stock_id = s.stock_id
-    WHERE sa.analysis_date = $1
-    AND sa.breakout_percentage IS NOT NULL
-    AND sa.breakout_percentage > 0
-    ORDER BY sa.breakout_percentage DESC
-    LIMIT $2 OFFSET $3;
+    SELECT *
+    FROM stock_screener
+    WHERE analysis_date = $1
+    AND breakout_rank > $3
+    ORDER BY breakout_rank
+    LIMIT $2;
   `;
     const { rows } = await pool.query(query, [date, limit, offset]);
     return rows;
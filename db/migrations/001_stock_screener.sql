@@ -0,0 +1,64 @@
+-- Precomputed top-breakout screener for the /top endpoint.
+--
+-- Holds one row per stock_analysis row with a positive breakout, ranked per
+-- analysis_date by breakout_percentage and joined with its max-price
+-- outcomes, so pages are read straight off the primary key. The Python
+-- writer keeps it current through StockAnalysisDatabase.refresh_screener.
+-- Safe to run more than once.
+
+CREATE TABLE IF NOT EXISTS stock_screener (
+    LIKE stock_analysis,                    -- Same columns, in the same order, as stock_analysis
+    breakout_rank INTEGER NOT NULL,         -- 1 for the highest breakout_percentage on the day
+    stock_symbol TEXT NOT NULL,             -- Copied from stocks so pages need no join
+    stock_name TEXT,
+    max_price_1_day NUMERIC,                -- Copied from stock_analysis_max_price, NULL until known
+    max_price_2_days NUMERIC,
+    max_price_5_days NUMERIC,
+    max_price_10_days NUMERIC,
+    max_price_15_days NUMERIC,
+    max_price_20_days NUMERIC,
+    PRIMARY KEY (analysis_date, breakout_rank)
+);
+
+-- Per-stock lookups and the max-price refresh
+CREATE INDEX IF NOT EXISTS idx_stock_screener_stock_date
+    ON stock_screener (stock_id, analysis_date);
+
+-- Covers the screener refresh: positive breakouts of a day, already sorted
+CREATE INDEX IF NOT EXISTS idx_stock_analysis_breakouts
+    ON stock_analysis (analysis_date, breakout_percentage DESC)
+    INCLUDE (stock_id)
+    WHERE breakout_percentage > 0;
+
+-- Covers fetch_breakout_data_with_max_prices: first-day breakouts of one stock
+CREATE INDEX IF NOT EXISTS idx_stock_analysis_stock_breakouts
+    ON stock_analysis (stock_id, analysis_date)
+    WHERE breakout_percentage > 0 AND consecutive_days_above_trendline = 1;
+
+-- Backfill every analysed day
+BEGIN;
+DELETE FROM stock_screener;
+INSERT INTO stock_screener
+SELECT
+    sa.*,
+    ROW_NUMBER() OVER (
+        PARTITION BY sa.analysis_date
+        ORDER BY sa.breakout_percentage DESC, sa.stock_id
+    ),
+    s.stock_symbol,
+    s.stock_name,
+    mp.max_price_1_day,
+    mp.max_price_2_days,
+    mp.max_price_5_days,
+    mp.max_price_10_days,
+    mp.max_price_15_days,
+    mp.max_price_20_days
+FROM stock_analysis sa
+JOIN stocks s ON sa.stock_id = s.stock_id
+LEFT JOIN stock_analysis_max_price mp
+    ON sa.stock_id = mp.stock_id
+    AND sa.analysis_date = mp.analysis_date
+WHERE sa.breakout_percentage > 0;
+COMMIT;
+
+ANALYZE stock_screener;
@@ -0,0 +1,225 @@
+-- Monthly range partitioning of stock_analysis and stock_analysis_max_price by analysis_date.
+--
+-- Existing rows are moved into the new partitioned tables. From then on
+-- StockAnalysisDatabase creates the partitions a write needs through
+-- create_monthly_partitions, and old months can be removed with
+-- drop_monthly_partitions instead of a large DELETE. Unique keys of a
+-- partitioned table must include analysis_date, so the analysis_id primary
+-- key becomes (analysis_id, analysis_date); the ON CONFLICT keys used by the
+-- writer already include it. Run after 001_stock_screener.sql, in one go,
+-- on PostgreSQL 11 or later.
+--
+-- The new tables copy everything LIKE ... INCLUDING ALL can carry (NOT NULL
+-- and CHECK constraints, defaults, identity, statistics, storage and
+-- comments). Indexes are excluded there because the old primary key cannot
+-- be copied, and are recreated after the rows are moved, together with the
+-- foreign keys and unique constraints, which LIKE never copies. A unique
+-- constraint or index without analysis_date cannot exist on a partitioned
+-- table, so one makes the migration fail rather than be dropped. Foreign
+-- keys from other tables to stock_analysis.analysis_id cannot be kept
+-- either; DROP TABLE fails on them, and they have to be removed (or pointed
+-- at (analysis_id, analysis_date)) first. Triggers, policies and grants on
+-- the old tables are not copied.
+
+-- Create the partitions of `parent` for every month from from_date to to_date
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent TEXT, from_date DATE, to_date DATE)
+RETURNS VOID AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_date)::DATE;
+BEGIN
+    WHILE month_start <= to_date LOOP
+        BEGIN
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                parent || to_char(month_start, '"_y"YYYY"m"MM'),
+                parent,
+                month_start,
+                (month_start + INTERVAL '1 month')::DATE
+            );
+        EXCEPTION WHEN duplicate_table OR unique_violation THEN
+            NULL;  -- Created by a concurrent writer
+        END;
+        month_start := (month_start + INTERVAL '1 month')::DATE;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Drop the partitions of `parent` that end on or before `before`, returning their names
+CREATE OR REPLACE FUNCTION drop_monthly_partitions(parent TEXT, before DATE)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    partition_name TEXT;
+BEGIN
+    FOR partition_name IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = parent::regclass
+        AND c.relname ~ '_y[0-9]{4}m[0-9]{2}$'
+        AND to_date(right(c.relname, 8), '"y"YYYY"m"MM') + INTERVAL '1 month' <= before
+    LOOP
+        EXECUTE format('DROP TABLE %I', partition_name);
+        RETURN NEXT partition_name;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+BEGIN;
+
+ALTER TABLE stock_analysis RENAME TO stock_analysis_unpartitioned;
+ALTER TABLE stock_analysis_max_price RENAME TO stock_analysis_max_price_unpartitioned;
+
+-- Free the index and constraint names for the new tables
+DO $$
+DECLARE
+    index_name TEXT;
+BEGIN
+    FOR index_name IN
+        SELECT c.relname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid IN (
+            'stock_analysis_unpartitioned'::regclass,
+            'stock_analysis_max_price_unpartitioned'::regclass
+        )
+    LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', index_name, index_name || '_old');
+    END LOOP;
+END;
+$$;
+
+CREATE TABLE stock_analysis (
+    LIKE stock_analysis_unpartitioned INCLUDING ALL EXCLUDING INDEXES,
+    PRIMARY KEY (analysis_id, analysis_date),
+    UNIQUE (stock_id, analysis_date, analysis_period)
+) PARTITION BY RANGE (analysis_date);
+
+CREATE TABLE stock_analysis_max_price (
+    LIKE stock_analysis_max_price_unpartitioned INCLUDING ALL EXCLUDING INDEXES,
+    PRIMARY KEY (stock_id, analysis_date)
+) PARTITION BY RANGE (analysis_date);
+
+-- Keep the analysis_id sequence when the old table is dropped: a serial
+-- column's sequence moves to the new table, an identity column (which LIKE
+-- gives a fresh sequence) continues from the old one
+DO $$
+DECLARE
+    old_sequence TEXT := pg_get_serial_sequence('stock_analysis_unpartitioned', 'analysis_id');
+    new_sequence TEXT := pg_get_serial_sequence('stock_analysis', 'analysis_id');
+BEGIN
+    IF old_sequence IS NULL THEN
+        RETURN;
+    ELSIF new_sequence IS NULL THEN
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY stock_analysis.analysis_id', old_sequence);
+    ELSIF new_sequence <> old_sequence THEN
+        EXECUTE format(
+            'SELECT setval(%L, last_value, is_called) FROM %s', new_sequence, old_sequence
+        );
+    END IF;
+END;
+$$;
+
+SELECT create_monthly_partitions(
+    'stock_analysis',
+    COALESCE(MIN(analysis_date), CURRENT_DATE),
+    GREATEST(COALESCE(MAX(analysis_date), CURRENT_DATE), CURRENT_DATE)
+)
+FROM stock_analysis_unpartitioned;
+
+SELECT create_monthly_partitions(
+    'stock_analysis_max_price',
+    COALESCE(MIN(analysis_date), CURRENT_DATE),
+    GREATEST(COALESCE(MAX(analysis_date), CURRENT_DATE), CURRENT_DATE)
+)
+FROM stock_analysis_max_price_unpartitioned;
+
+INSERT INTO stock_analysis OVERRIDING SYSTEM VALUE
+SELECT * FROM stock_analysis_unpartitioned;
+INSERT INTO stock_analysis_max_price OVERRIDING SYSTEM VALUE
+SELECT * FROM stock_analysis_max_price_unpartitioned;
+
+-- Recreate the foreign keys, unique constraints and indexes of the old tables
+-- under their original names
+DO $$
+DECLARE
+    new_table TEXT;
+    old_table TEXT;
+    date_column SMALLINT;
+    item RECORD;
+BEGIN
+    FOREACH new_table IN ARRAY ARRAY['stock_analysis', 'stock_analysis_max_price'] LOOP
+        old_table := new_table || '_unpartitioned';
+        SELECT attnum INTO date_column
+        FROM pg_attribute
+        WHERE attrelid = old_table::regclass AND attname = 'analysis_date';
+
+        -- The primary keys are declared above
+        FOR item IN
+            SELECT conname, contype, conkey, pg_get_constraintdef(oid) AS definition
+            FROM pg_constraint
+            WHERE conrelid = old_table::regclass AND contype IN ('f', 'u')
+        LOOP
+            CONTINUE WHEN EXISTS (
+                SELECT 1
+                FROM pg_constraint
+                WHERE conrelid = new_table::regclass
+                AND pg_get_constraintdef(oid) = item.definition
+            );
+            IF item.contype = 'u' AND NOT date_column = ANY(item.conkey) THEN
+                RAISE EXCEPTION 'Unique constraint % on % does not include analysis_date',
+                    item.conname, old_table;
+            END IF;
+            -- Partitioned tables do not take NOT VALID foreign keys, so validate them now
+            EXECUTE format(
+                'ALTER TABLE %I ADD CONSTRAINT %I %s',
+                new_table,
+                regexp_replace(item.conname, '_old$', ''),
+                regexp_replace(item.definition, ' NOT VALID$', '')
+            );
+        END LOOP;
+
+        FOR item IN
+            SELECT c.relname, i.indisunique, i.indkey, pg_get_indexdef(i.indexrelid) AS definition
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = old_table::regclass
+            AND NOT EXISTS (
+                SELECT 1
+                FROM pg_constraint
+                WHERE conrelid = old_table::regclass AND conindid = i.indexrelid
+            )
+        LOOP
+            IF item.indisunique AND NOT date_column = ANY(item.indkey) THEN
+                RAISE EXCEPTION 'Unique index % on % does not include analysis_date',
+                    item.relname, old_table;
+            END IF;
+            EXECUTE format(
+                'CREATE %sINDEX IF NOT EXISTS %I ON %I%s',
+                CASE WHEN item.indisunique THEN 'UNIQUE ' ELSE '' END,
+                regexp_replace(item.relname, '_old$', ''),
+                new_table,
+                substring(item.definition FROM ' USING .*$')
+            );
+        END LOOP;
+    END LOOP;
+END;
+$$;
+
+DROP TABLE stock_analysis_unpartitioned;
+DROP TABLE stock_analysis_max_price_unpartitioned;
+
+-- Indexes from 001_stock_screener.sql, if the old table did not have them yet;
+-- indexes on a partitioned table are created on every partition
+CREATE INDEX IF NOT EXISTS idx_stock_analysis_breakouts
+    ON stock_analysis (analysis_date, breakout_percentage DESC)
+    INCLUDE (stock_id)
+    WHERE breakout_percentage > 0;
+
+CREATE INDEX IF NOT EXISTS idx_stock_analysis_stock_breakouts
+    ON stock_analysis (stock_id, analysis_date)
+    WHERE breakout_percentage > 0 AND consecutive_days_above_trendline = 1;
+
+COMMIT;
+
+ANALYZE stock_analysis;
+ANALYZE stock_analysis_max_price;
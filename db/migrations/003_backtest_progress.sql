@@ -0,0 +1,23 @@
+-- Per-symbol checkpoints for StockAnalysisDatabase.backtest_stocks.
+--
+-- A stock is marked 'done' once all of its analysis and max price rows for
+-- the backtest's period and date range are committed. A rerun of the same
+-- backtest skips those stocks and only computes the days still missing for
+-- the rest. Safe to run more than once.
+
+CREATE TABLE IF NOT EXISTS backtest_progress (
+    stock_id INTEGER NOT NULL,              -- References the stocks table
+    analysis_period INTEGER NOT NULL,       -- Analysis window in days (period * 30)
+    start_date DATE NOT NULL,               -- Backtest date range
+    end_date DATE NOT NULL,
+    status VARCHAR(10) NOT NULL,            -- 'done' or 'failed'
+    completed_through DATE,                 -- Last analysis date written for the stock
+    days_written INTEGER NOT NULL DEFAULT 0,-- Analysis days written across runs
+    error TEXT,                             -- Last error for a failed stock
+    updated_at TIMESTAMP DEFAULT NOW(),     -- Timestamp for when the progress was last saved
+    PRIMARY KEY (stock_id, analysis_period, start_date, end_date),
+    CONSTRAINT fk_stock FOREIGN KEY (stock_id)
+        REFERENCES stocks (stock_id)
+        ON DELETE CASCADE
+        ON UPDATE CASCADE
+);
@@ -21,3 +21,58 @@ CREATE TABLE trades (
 
 -- Optional: Index for faster querying by stock_id
 CREATE INDEX idx_trades_stock_id ON trades (stock_id);
+
+
+-- Per-symbol indicator state so the daily run only has to fold in the newest bars
+CREATE TABLE stock_indicator_state (
+    stock_id INTEGER NOT NULL,              -- References the stocks table
+    analysis_period INTEGER NOT NULL,       -- Analysis window in days (period * 30)
+    as_of_date DATE NOT NULL,               -- Date of the last bar folded into the state
+    state JSONB NOT NULL,                   -- Serialised IndicatorState
+    updated_at TIMESTAMP DEFAULT NOW(),     -- Timestamp for when the state was last saved
+    PRIMARY KEY (stock_id, analysis_period),
+    CONSTRAINT fk_stock FOREIGN KEY (stock_id)
+        REFERENCES stocks (stock_id)
+        ON DELETE CASCADE
+        ON UPDATE CASCADE
+);
+
+
+-- Positive breakouts ranked per day with their max-price outcomes, read by the /top endpoint.
+-- Rebuilt per analysis date by StockAnalysisDatabase.refresh_screener; see db/migrations/001_stock_screener.sql
+-- for the supporting indexes on stock_analysis.
+CREATE TABLE stock_screener (
+    LIKE stock_analysis,                    -- Same columns, in the same order, as stock_analysis
+    breakout_rank INTEGER NOT NULL,         -- 1 for the highest breakout_percentage on the day
+    stock_symbol TEXT NOT NULL,             -- Copied from stocks so pages need no join
+    stock_name TEXT,
+    max_price_1_day NUMERIC,                -- Copied from stock_analysis_max_price, NULL until known
+    max_price_2_days NUMERIC,
+    max_price_5_days NUMERIC,
+    max_price_10_days NUMERIC,
+    max_price_15_days NUMERIC,
+    max_price_20_days NUMERIC,
+    PRIMARY KEY (analysis_date, breakout_rank)
+);
+
+CREATE INDEX idx_stock_screener_stock_date ON stock_screener (stock_id, analysis_date);
+
+
+-- Per-symbol progress of backtest runs, so an interrupted run can resume where it stopped.
+-- Written by StockAnalysisDatabase.backtest_stocks; see db/migrations/003_backtest_progress.sql
+CREATE TABLE backtest_progress (
+    stock_id INTEGER NOT NULL,              -- References the stocks table
+    analysis_period INTEGER NOT NULL,       -- Analysis window in days (period * 30)
+    start_date DATE NOT NULL,               -- Backtest date range
+    end_date DATE NOT NULL,
+    status VARCHAR(10) NOT NULL,            -- 'done' or 'failed'
+    completed_through DATE,                 -- Last analysis date written for the stock
+    days_written INTEGER NOT NULL DEFAULT 0,-- Analysis days written across runs
+    error TEXT,                             -- Last error for a failed stock
+    updated_at TIMESTAMP DEFAULT NOW(),     -- Timestamp for when the progress was last saved
+    PRIMARY KEY (stock_id, analysis_period, start_date, end_date),
+    CONSTRAINT fk_stock FOREIGN KEY (stock_id)
+        REFERENCES stocks (stock_id)
+        ON DELETE CASCADE
+        ON UPDATE CASCADE
+);
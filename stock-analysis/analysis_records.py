@@ -0,0 +1,190 @@
+from typing import Mapping, Optional
+
+import numpy as np
+
+# analyse_stock result keys and the stock_analysis columns they are stored in
+RESULT_COLUMNS = {
+    "close_price": "close_price",
+    "breakout_percentage": "breakout_percentage",
+    "consecutive_days_above": "consecutive_days_above_trendline",
+    "trendline_accuracy": "trendline_accuracy",
+    "rsi": "rsi_value",
+    "macd_value": "macd_value",
+    "macd_signal": "macd_signal",
+    "bollinger_upper": "upper_bollinger_band",
+    "bollinger_middle": "middle_bollinger_band",
+    "bollinger_lower": "lower_bollinger_band",
+    "volume": "volume",
+    "volume_ratio": "volume_ratio",
+    "9EMA": "nine_ema",
+    "12EMA": "twelve_ema",
+    "21EMA": "twenty_one_ema",
+    "50EMA": "fifty_ema",
+}
+
+# Integer columns that are NULL without a trendline; held as float32 with NaN
+NULLABLE_INTEGER_COLUMNS = ("consecutive_days_above_trendline",)
+
+# One stock_analysis row per record, fields in INSERT_ANALYSIS_QUERY order
+ANALYSIS_DTYPE = np.dtype(
+    [
+        ("stock_id", np.int32),
+        ("analysis_date", "datetime64[D]"),
+        ("analysis_period", np.int16),
+    ]
+    + [
+        (
+            column,
+            (
+                np.float32
+                if column in NULLABLE_INTEGER_COLUMNS
+                else np.int64 if column == "volume" else np.float64
+            ),
+        )
+        for column in RESULT_COLUMNS.values()
+    ]
+)
+
+MAX_PRICE_COLUMNS = (
+    "max_price_1_day",
+    "max_price_2_days",
+    "max_price_5_days",
+    "max_price_10_days",
+    "max_price_15_days",
+    "max_price_20_days",
+)
+
+# One stock_analysis_max_price row per record, fields in INSERT_MAX_PRICE_QUERY order
+MAX_PRICE_DTYPE = np.dtype(
+    [("stock_id", np.int32), ("analysis_date", "datetime64[D]")]
+    + [(column, np.float64) for column in MAX_PRICE_COLUMNS]
+)
+
+
+def analysis_records(
+    stock_id, dates, columns: Mapping[str, np.ndarray], period: int = 3
+) -> np.ndarray:
+    """
+    Fill ANALYSIS_DTYPE records from result columns keyed like analyse_stock.
+    stock_id is one ID or one per date; missing trendline fields are NaN.
+    """
+    records = np.empty(len(dates), ANALYSIS_DTYPE)
+    records["stock_id"] = stock_id
+    records["analysis_date"] = dates
+    records["analysis_period"] = period * 30
+    for key, column in RESULT_COLUMNS.items():
+        records[column] = columns[key]
+    return records
+
+
+def max_price_records(stock_id, dates, max_prices: np.ndarray) -> np.ndarray:
+    """Fill MAX_PRICE_DTYPE records from a (dates x horizons) array of max prices."""
+    records = np.empty(len(dates), MAX_PRICE_DTYPE)
+    records["stock_id"] = stock_id
+    records["analysis_date"] = dates
+    for i, column in enumerate(MAX_PRICE_COLUMNS):
+        records[column] = max_prices[:, i]
+    return records
+
+
+def records_csv(records: np.ndarray, decimals: Optional[int] = None) -> str:
+    """
+    Records as COPY ... WITH (FORMAT csv) input, in field order, formatted a
+    column at a time. NaN becomes NULL, as analysis_row and max_price_row
+    send it; floats are rounded to decimals if given (analysis_row rounds
+    to 3).
+    """
+    rows = len(records)
+    if not rows:
+        return ""
+    parts = []
+    for name in records.dtype.names:
+        parts += [_csv_field(name, records[name], decimals), _column(rows, b",")]
+    parts[-1] = _column(rows, b"\n")
+    # Each field is padded with NUL bytes to the width of its column
+    text = np.hstack(parts).ravel()
+    return text[text != 0].tobytes().decode()
+
+
+def _column(rows: int, char: bytes) -> np.ndarray:
+    return np.full((rows, 1), ord(char), dtype=np.uint8)
+
+
+def _as_bytes(values: np.ndarray) -> np.ndarray:
+    """Values as text through numpy, one NUL-padded row of bytes per value."""
+    text = values.astype("S")
+    return text.view(np.uint8).reshape(len(values), text.itemsize)
+
+
+def _digits(values: np.ndarray, width: Optional[int] = None) -> np.ndarray:
+    """
+    Non-negative integers as rows of ASCII digits, computed arithmetically
+    rather than through a string conversion per value. Without width the
+    leading zeros are NUL bytes, with width they are zero-padded to it.
+    """
+    values = values.astype(np.int64)
+    padded = width is not None
+    if not padded:
+        width = len(str(int(values.max()))) if len(values) else 1
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    shifted = values[:, None] // powers
+    digits = (shifted % 10 + ord("0")).astype(np.uint8)
+    if not padded:
+        leading = shifted == 0
+        leading[:, -1] = False
+        digits[leading] = 0
+    return digits
+
+
+def _integers(values: np.ndarray) -> np.ndarray:
+    signs = np.where(values < 0, ord("-"), 0).astype(np.uint8)[:, None]
+    return np.hstack([signs, _digits(np.abs(values))])
+
+
+def _dates(values: np.ndarray) -> np.ndarray:
+    """datetime64[D] values as YYYY-MM-DD."""
+    months = values.astype("datetime64[M]")
+    years = months.astype("datetime64[Y]")
+    rows = len(values)
+    return np.hstack(
+        [
+            _digits(years.astype(np.int64) + 1970, 4),
+            _column(rows, b"-"),
+            _digits((months - years).astype(np.int64) + 1, 2),
+            _column(rows, b"-"),
+            _digits((values - months).astype(np.int64) + 1, 2),
+        ]
+    )
+
+
+def _csv_field(name: str, values: np.ndarray, decimals: Optional[int]) -> np.ndarray:
+    """One record field as CSV bytes."""
+    kind = values.dtype.kind
+    if kind in "iu":
+        return _integers(values)
+    if kind == "M":
+        return _dates(values)
+    if kind != "f":
+        return _as_bytes(values)
+    missing = np.isnan(values)
+    if name in NULLABLE_INTEGER_COLUMNS:
+        field = _integers(np.where(missing, 0, values))
+    elif decimals is None or np.isinf(values).any():
+        field = _as_bytes(values if decimals is None else np.round(values, decimals))
+    else:
+        field = _fixed_point(np.where(missing, 0.0, values), decimals)
+    field[missing] = 0
+    return field
+
+
+def _fixed_point(values: np.ndarray, decimals: int) -> np.ndarray:
+    """Finite values rounded like np.round, written with `decimals` decimals."""
+    scale = 10**decimals
+    scaled = np.rint(np.abs(values) * scale).astype(np.int64)
+    parts = [
+        np.where(np.signbit(values), ord("-"), 0).astype(np.uint8)[:, None],
+        _digits(scaled // scale),
+    ]
+    if decimals:
+        parts += [_column(len(values), b"."), _digits(scaled % scale, decimals)]
+    return np.hstack(parts)
@@ -0,0 +1,398 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime
+from time import monotonic, perf_counter
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from db_client import DOWNLOAD_BATCH_SIZE, StockAnalysisDatabase, analysis_row
+from instrumentation import configure_logging, metrics
+from stock_analysis import (
+    analyse_stock,
+    analysis_window_start,
+    fetch_stock_data_batch,
+)
+from trading_calendar import default_calendar
+
+logger = logging.getLogger(__name__)
+
+# yfinance fetches the symbols of one multi-ticker request in parallel, but
+# yf.download itself is not thread-safe and fetch_stock_data_batch makes one
+# request at a time, so further requests would only queue on its lock
+YFINANCE_DOWNLOADS = 1
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` acquisitions per second, in bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class StageStats:
+    """Item counts, failures and per-item latencies of one pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.failed = 0
+        self.timed_out = 0
+
+    def summary(self, wall_seconds: float) -> Dict[str, Any]:
+        latencies = np.array(self.latencies)
+        p50, p95, p99 = (
+            np.percentile(latencies, [50, 95, 99]) if len(latencies) else (np.nan,) * 3
+        )
+        return {
+            "stage": self.name,
+            "completed": len(latencies),
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "per_second": len(latencies) / wall_seconds if wall_seconds else 0.0,
+            "p50_ms": p50 * 1000,
+            "p95_ms": p95 * 1000,
+            "p99_ms": p99 * 1000,
+        }
+
+
+class AnalysisPipeline:
+    """
+    asyncio version of StockAnalysisDatabase.analyse_and_store_stocks.
+
+    Stocks flow through four stages connected by bounded queues: the symbol
+    list in batches, rate-limited multi-ticker downloads of a batch each on
+    threads, analysis in a process pool and batched writes. A full queue
+    blocks the stage feeding it, so at most a few queue lengths of price
+    data are held at once, and a download or analysis that exceeds
+    symbol_timeout only drops that batch or stock. Cancelling run() stops
+    all stages and still writes the rows analysed so far.
+    """
+
+    def __init__(
+        self,
+        db: StockAnalysisDatabase,
+        downloads: Optional[int] = None,
+        requests_per_second: float = 5.0,
+        workers: Optional[int] = None,
+        queue_size: int = 32,
+        symbol_timeout: Optional[float] = 60.0,
+        batch_size: int = 1000,
+        flush_interval: float = 5.0,
+        download: Callable[..., Any] = fetch_stock_data_batch,
+        download_batch_size: int = DOWNLOAD_BATCH_SIZE,
+    ):
+        """
+        Parameters:
+        - db: Database to read the stock list from and write results to.
+        - downloads: Download requests running at the same time. Defaults
+          to 8 for a custom download; with the default
+          fetch_stock_data_batch it is capped at YFINANCE_DOWNLOADS.
+        - requests_per_second: Rate limit on starting download requests.
+        - workers: Analysis processes (ProcessPoolExecutor default if None).
+        - queue_size: Capacity of each queue between stages.
+        - symbol_timeout: Seconds a single download request or analysis may
+          take. A timed-out download thread cannot be interrupted: its batch
+          is dropped, and its worker waits for the thread before starting
+          the next request, so that request is not timed while it waits.
+        - batch_size, flush_interval: Write once this many rows are queued
+          or this many seconds have passed since the last write.
+        - download: Called like fetch_stock_data_batch(symbols, start, end),
+          returning the frames by symbol and the symbols without data.
+        - download_batch_size: Symbols per download request.
+        """
+        if download is fetch_stock_data_batch:
+            if downloads is not None and downloads > YFINANCE_DOWNLOADS:
+                logger.warning(
+                    "yfinance downloads cannot run concurrently; using %d "
+                    "download worker(s) instead of %d",
+                    YFINANCE_DOWNLOADS,
+                    downloads,
+                )
+            downloads = min(downloads or YFINANCE_DOWNLOADS, YFINANCE_DOWNLOADS)
+        self.db = db
+        self.downloads = downloads or 8
+        self.requests_per_second = requests_per_second
+        self.workers = workers
+        self.queue_size = queue_size
+        self.symbol_timeout = symbol_timeout
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.download = download
+        self.download_batch_size = download_batch_size
+        self.stats = {
+            name: StageStats(name) for name in ("download", "analysis", "write")
+        }
+        # A cancelled write keeps running on its thread, so the final flush
+        # has to wait for it
+        self._write_lock = threading.Lock()
+
+    async def _timed_stage(self, stage: str, label: str, call, items: int = 1):
+        """
+        Await call() under the per-symbol timeout and return its result and
+        latency, or None if it timed out or failed, which is counted for
+        `items` stocks.
+        """
+        started = perf_counter()
+        try:
+            result = await asyncio.wait_for(call(), self.symbol_timeout)
+        except asyncio.TimeoutError:
+            self.stats[stage].timed_out += items
+            logger.warning("Timed out in %s for %s", stage, label)
+            return None
+        except Exception as e:
+            self.stats[stage].failed += items
+            logger.error("Error analyzing %s: %s", label, e)
+            return None
+        elapsed = perf_counter() - started
+        metrics.observe(f"pipeline.{stage}", elapsed)
+        return result, elapsed
+
+    async def _download_worker(
+        self,
+        batches: asyncio.Queue,
+        downloaded: asyncio.Queue,
+        limiter: RateLimiter,
+        start_date: str,
+        analysis_date: str,
+    ):
+        loop = asyncio.get_running_loop()
+        stats = self.stats["download"]
+        while True:
+            batch = await batches.get()
+            try:
+                await limiter.acquire()
+                request = loop.run_in_executor(
+                    None,
+                    self.download,
+                    [stock["stock_symbol"] for stock in batch],
+                    start_date,
+                    analysis_date,
+                )
+                timed = await self._timed_stage(
+                    "download",
+                    f"{len(batch)} stocks",
+                    lambda: asyncio.shield(request),
+                    items=len(batch),
+                )
+                if timed is None:
+                    # Hold this worker until a timed-out request's thread
+                    # returns, as the next request would only wait behind it
+                    await asyncio.gather(request, return_exceptions=True)
+                    continue
+                (frames, _), elapsed = timed
+                for stock in batch:
+                    data = frames.get(stock["stock_symbol"])
+                    if data is None:
+                        stats.failed += 1
+                        logger.error(
+                            "Error analyzing %s: No data found for %s. "
+                            "Check the symbol or dates.",
+                            stock["stock_symbol"],
+                            stock["stock_symbol"],
+                        )
+                        continue
+                    stats.latencies.append(elapsed)
+                    await downloaded.put((stock, data))
+            finally:
+                batches.task_done()
+
+    async def _analysis_worker(
+        self,
+        downloaded: asyncio.Queue,
+        analysed: asyncio.Queue,
+        executor: Executor,
+        analysis_date: str,
+        period: int,
+    ):
+        loop = asyncio.get_running_loop()
+        while True:
+            stock, data = await downloaded.get()
+            try:
+                timed = await self._timed_stage(
+                    "analysis",
+                    stock["stock_symbol"],
+                    lambda: loop.run_in_executor(
+                        executor,
+                        analyse_stock,
+                        stock["stock_symbol"],
+                        analysis_date,
+                        period,
+                        data,
+                    ),
+                )
+                if timed is not None:
+                    result, elapsed = timed
+                    self.stats["analysis"].latencies.append(elapsed)
+                    await analysed.put(analysis_row(stock["stock_id"], result))
+            finally:
+                downloaded.task_done()
+
+    async def _write_worker(self, analysed: asyncio.Queue, pending: List[tuple]):
+        loop = asyncio.get_running_loop()
+        last_flush = monotonic()
+        while True:
+            timeout = None
+            if pending:
+                timeout = max(0.0, self.flush_interval - (monotonic() - last_flush))
+            try:
+                pending.append(await asyncio.wait_for(analysed.get(), timeout))
+                analysed.task_done()
+            except asyncio.TimeoutError:
+                pass
+            if len(pending) >= self.batch_size or (
+                pending and monotonic() - last_flush >= self.flush_interval
+            ):
+                await loop.run_in_executor(None, self._write, pending)
+                last_flush = monotonic()
+
+    def _write(self, pending: List[tuple]):
+        """Write and clear the pending rows; runs on an executor thread."""
+        with self._write_lock:
+            rows = list(pending)
+            if not rows:
+                return
+            started = perf_counter()
+            try:
+                for row in rows:
+                    self.writer.add(row)
+                self.writer.flush()
+            except Exception as e:
+                self.stats["write"].failed += len(rows)
+                self.writer.rows.clear()
+                logger.error("Error writing %d analysis rows: %s", len(rows), e)
+            else:
+                # Every row of a batch waits for the same statement
+                self.stats["write"].latencies.extend(
+                    [perf_counter() - started] * len(rows)
+                )
+            del pending[: len(rows)]
+
+    async def run(
+        self, analysis_date: Optional[str] = None, period: int = 3
+    ) -> Dict[str, Any]:
+        """Analyse and store all stocks, returning the run summary."""
+        if analysis_date is None:
+            analysis_date = datetime.today().strftime("%Y-%m-%d")
+        if not default_calendar().is_session(analysis_date):
+            logger.warning(
+                "Your chosen date (%s) is not a trading session (weekend or "
+                "market holiday). No analysis will be performed.",
+                analysis_date,
+            )
+            return {}
+        start_date = analysis_window_start(analysis_date, period)
+        loop = asyncio.get_running_loop()
+        started = perf_counter()
+
+        # One batch waiting per download worker is enough to keep it busy
+        batches: asyncio.Queue = asyncio.Queue(self.downloads)
+        downloaded: asyncio.Queue = asyncio.Queue(self.queue_size)
+        analysed: asyncio.Queue = asyncio.Queue(self.queue_size)
+        pending: List[tuple] = []
+        limiter = RateLimiter(self.requests_per_second, burst=self.downloads)
+        self.writer = self.db.analysis_writer(self.batch_size, None)
+
+        analysis_workers = self.workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(analysis_workers) as executor:
+            workers = [
+                asyncio.create_task(
+                    self._download_worker(
+                        batches, downloaded, limiter, start_date, analysis_date
+                    )
+                )
+                for _ in range(self.downloads)
+            ]
+            workers += [
+                asyncio.create_task(
+                    self._analysis_worker(
+                        downloaded, analysed, executor, analysis_date, period
+                    )
+                )
+                for _ in range(analysis_workers)
+            ]
+            workers.append(asyncio.create_task(self._write_worker(analysed, pending)))
+            try:
+                stocks = await loop.run_in_executor(None, self.db.fetch_all_stocks)
+                for batch_start in range(0, len(stocks), self.download_batch_size):
+                    await batches.put(
+                        stocks[batch_start : batch_start + self.download_batch_size]
+                    )
+                # Each queue is drained only after everything upstream is done
+                for queue in (batches, downloaded, analysed):
+                    await queue.join()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                if pending:
+                    await loop.run_in_executor(None, self._write, pending)
+            if self.writer.rows_written:
+                await loop.run_in_executor(
+                    None, self.db.refresh_screener, analysis_date
+                )
+
+        wall_seconds = perf_counter() - started
+        summary = {
+            "stocks": len(stocks),
+            "stored": len(self.stats["write"].latencies),
+            "wall_seconds": wall_seconds,
+            "stages": [stats.summary(wall_seconds) for stats in self.stats.values()],
+        }
+        log_summary(summary)
+        return summary
+
+
+def log_summary(summary: Dict[str, Any]):
+    stocks = summary["stocks"]
+    stored = summary["stored"]
+    logger.info(
+        "%d out of %d successfully analysed (%.2f%%) in %.2fs",
+        stored,
+        stocks,
+        stored / stocks * 100 if stocks else 0,
+        summary["wall_seconds"],
+    )
+    for stage in summary["stages"]:
+        logger.info(
+            "%8s: %d done, %d failed, %d timed out, %.1f/s, "
+            "p50 %.0fms p95 %.0fms p99 %.0fms",
+            stage["stage"],
+            stage["completed"],
+            stage["failed"],
+            stage["timed_out"],
+            stage["per_second"],
+            stage["p50_ms"],
+            stage["p95_ms"],
+            stage["p99_ms"],
+        )
+
+
+if __name__ == "__main__":
+    configure_logging()
+    db = StockAnalysisDatabase()
+    try:
+        with metrics.run("pipeline"):
+            asyncio.run(AnalysisPipeline(db).run(period=3))
+    finally:
+        db.close_connection()
@@ -0,0 +1,73 @@
+"""
+Microbenchmark of indicator_kernel against the per-indicator pandas path.
+
+Runs on synthetic prices, so no network or database is needed:
+
+    python bench_indicators.py [--repeat N]
+"""
+
+import argparse
+from timeit import repeat
+
+from stock_analysis import (
+    calculate_bollinger_bands,
+    calculate_emas,
+    calculate_macd,
+    calculate_rsi,
+    calculate_trendline,
+    calculate_trendline_accuracy,
+    breakout_percentage,
+    consecutive_days_above_trendline,
+    get_peak_indices,
+    indicator_kernel,
+    volume_spike,
+)
+from synthetic_data import synthetic_ohlcv
+
+# Trading days in a 90-calendar-day window and in five years
+WINDOWS = {"90 days": 63, "5 years": 1260}
+
+
+def per_indicator(data):
+    """The calls analyse_stock made before indicator_kernel."""
+    peaks, highest_peak = get_peak_indices(data)
+    trendline = calculate_trendline(data, peaks, highest_peak)
+    calculate_trendline_accuracy(data, peaks, trendline)
+    breakout_percentage(data, trendline)
+    consecutive_days_above_trendline(data, trendline)
+    calculate_emas(data)
+    calculate_rsi(data)
+    calculate_macd(data)
+    calculate_macd(data)
+    calculate_bollinger_bands(data)
+    calculate_bollinger_bands(data)
+    calculate_bollinger_bands(data)
+    volume_spike(data)
+
+
+def fused(data):
+    indicator_kernel(
+        data["Close"].to_numpy(), data["High"].to_numpy(), data["Volume"].to_numpy()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'window':<10}{'bars':>6}{'pandas µs':>12}{'kernel µs':>12}{'speedup':>9}")
+    for name, bars in WINDOWS.items():
+        data = synthetic_ohlcv(bars)
+        timings = []
+        for func in (per_indicator, fused):
+            best = min(repeat(lambda: func(data), number=1, repeat=args.repeat))
+            timings.append(best * 1e6)
+        print(
+            f"{name:<10}{bars:>6}{timings[0]:>12.0f}{timings[1]:>12.0f}"
+            f"{timings[0] / timings[1]:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Memory benchmark of backtest results held as dicts and tuples per row against
+structured record arrays (see analysis_records).
+
+Both paths analyse the same synthetic universe and keep every result ready
+for the writers: analysis_row and max_price_row tuples on one side,
+ANALYSIS_DTYPE and MAX_PRICE_DTYPE arrays on the other. Reports the bytes
+still held afterwards, the peak while building and the time taken:
+
+    python bench_memory.py [--symbols 50] [--bars 1260]
+"""
+
+import argparse
+import gc
+import tracemalloc
+from time import perf_counter
+from typing import Any, Callable, Dict
+
+import numpy as np
+
+from db_client import analysis_row, max_price_row
+from stock_analysis import (
+    analyse_history_records,
+    analyse_stock_history,
+    forward_max_prices,
+    history_to_results,
+)
+from synthetic_data import TRADING_DAYS, synthetic_universe
+
+
+def dict_rows(frames: Dict[str, Any]) -> list:
+    """Per-row results as the backtest built them before record arrays."""
+    rows = []
+    for stock_id, (symbol, data) in enumerate(frames.items(), 1):
+        history = analyse_stock_history(symbol, data)
+        max_prices = forward_max_prices(data).loc[history.index]
+        for result, day_max_prices in zip(
+            history_to_results(history), max_prices.to_dict("records")
+        ):
+            rows.append(
+                (
+                    analysis_row(stock_id, result),
+                    max_price_row(stock_id, result["date"], day_max_prices),
+                )
+            )
+    return rows
+
+
+def record_arrays(frames: Dict[str, Any]) -> tuple:
+    """The same results as two concatenated record arrays."""
+    records = [
+        analyse_history_records(stock_id, data)
+        for stock_id, data in enumerate(frames.values(), 1)
+    ]
+    return (
+        np.concatenate([analysis for analysis, _ in records]),
+        np.concatenate([max_prices for _, max_prices in records]),
+    )
+
+
+def measure_memory(build: Callable[[], Any]) -> Dict[str, float]:
+    """Retained and peak traced bytes and seconds of one call of build."""
+    gc.collect()
+    tracemalloc.start()
+    started = perf_counter()
+    result = build()
+    seconds = perf_counter() - started
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {"retained": retained, "peak": peak, "seconds": seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--bars", type=int, default=5 * TRADING_DAYS)
+    args = parser.parse_args()
+
+    frames = synthetic_universe(args.symbols, args.bars)
+    rows = len(record_arrays(frames)[0])
+    print(f"{args.symbols} symbols x {args.bars} bars, {rows} result rows\n")
+    print(
+        f"{'path':<16}{'retained MB':>12}{'bytes/row':>11}{'peak MB':>10}"
+        f"{'seconds':>9}"
+    )
+    for name, build in (("dict per row", dict_rows), ("record arrays", record_arrays)):
+        result = measure_memory(lambda: build(frames))
+        print(
+            f"{name:<16}{result['retained'] / 1e6:>12.1f}"
+            f"{result['retained'] / rows:>11.0f}{result['peak'] / 1e6:>10.1f}"
+            f"{result['seconds']:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Benchmark of the /top query on stock_analysis against the stock_screener table.
+
+Seeds synthetic analysis rows into a scratch schema of the configured
+database (DB_* settings), applies db/migrations/001_stock_screener.sql there
+and times page reads both ways. The scratch schema is dropped afterwards:
+
+    python bench_screener.py [--stocks 5000] [--days 250] [--keep]
+"""
+
+import argparse
+import os
+from time import perf_counter
+
+from dotenv import load_dotenv
+
+from connection_pool import ConnectionPool
+
+SCHEMA = "screener_bench"
+MIGRATION = os.path.join(
+    os.path.dirname(__file__), "..", "db", "migrations", "001_stock_screener.sql"
+)
+
+# Minimal versions of the tables the Python writer fills
+CREATE_TABLES = """
+    CREATE TABLE stocks (
+        stock_id SERIAL PRIMARY KEY,
+        stock_symbol VARCHAR(10) NOT NULL UNIQUE,
+        stock_name VARCHAR(100)
+    );
+    CREATE TABLE stock_analysis (
+        analysis_id SERIAL PRIMARY KEY,
+        stock_id INTEGER NOT NULL REFERENCES stocks (stock_id),
+        analysis_date DATE NOT NULL,
+        analysis_period INTEGER NOT NULL,
+        close_price NUMERIC(12, 3),
+        breakout_percentage NUMERIC(12, 3),
+        consecutive_days_above_trendline INTEGER,
+        trendline_accuracy NUMERIC(12, 3),
+        rsi_value NUMERIC(12, 3),
+        macd_value NUMERIC(12, 3),
+        macd_signal NUMERIC(12, 3),
+        upper_bollinger_band NUMERIC(12, 3),
+        middle_bollinger_band NUMERIC(12, 3),
+        lower_bollinger_band NUMERIC(12, 3),
+        volume BIGINT,
+        volume_ratio NUMERIC(12, 3),
+        nine_ema NUMERIC(12, 3),
+        twelve_ema NUMERIC(12, 3),
+        twenty_one_ema NUMERIC(12, 3),
+        fifty_ema NUMERIC(12, 3),
+        created_at TIMESTAMP DEFAULT NOW(),
+        UNIQUE (stock_id, analysis_date, analysis_period)
+    );
+    CREATE TABLE stock_analysis_max_price (
+        stock_id INTEGER NOT NULL REFERENCES stocks (stock_id),
+        analysis_date DATE NOT NULL,
+        max_price_1_day NUMERIC(12, 3),
+        max_price_2_days NUMERIC(12, 3),
+        max_price_5_days NUMERIC(12, 3),
+        max_price_10_days NUMERIC(12, 3),
+        max_price_15_days NUMERIC(12, 3),
+        max_price_20_days NUMERIC(12, 3),
+        PRIMARY KEY (stock_id, analysis_date)
+    );
+"""
+
+# About a third of the rows get a positive breakout, as on a typical day
+SEED = """
+    INSERT INTO stocks (stock_symbol, stock_name)
+    SELECT 'S' || i, 'Synthetic ' || i FROM generate_series(1, %(stocks)s) i;
+
+    INSERT INTO stock_analysis (
+        stock_id, analysis_date, analysis_period, close_price, breakout_percentage,
+        consecutive_days_above_trendline, trendline_accuracy, rsi_value,
+        macd_value, macd_signal, upper_bollinger_band,
+        middle_bollinger_band, lower_bollinger_band, volume, volume_ratio,
+        nine_ema, twelve_ema, twenty_one_ema, fifty_ema
+    )
+    SELECT
+        s.stock_id, d::date, 90, 100 * random(), 20 * random() - 13,
+        (random() * 5)::int, 100 * random(), 100 * random(),
+        random() - 0.5, random() - 0.5, 110, 100, 90,
+        (1e6 * random())::bigint, 3 * random(), 100, 100, 100, 100
+    FROM stocks s
+    CROSS JOIN generate_series(
+        CURRENT_DATE - %(days)s + 1, CURRENT_DATE, interval '1 day'
+    ) d;
+
+    INSERT INTO stock_analysis_max_price
+    SELECT stock_id, analysis_date, close_price * 1.01, close_price * 1.02,
+        close_price * 1.05, close_price * 1.1, close_price * 1.15, close_price * 1.2
+    FROM stock_analysis;
+
+    ANALYZE;
+"""
+
+# The original getTopStocks query
+BASE_QUERY = """
+    SELECT s.stock_symbol, s.stock_name, sa.*
+    FROM stock_analysis sa
+    JOIN stocks s ON sa.stock_id = s.stock_id
+    WHERE sa.analysis_date = %(date)s
+    AND sa.breakout_percentage IS NOT NULL
+    AND sa.breakout_percentage > 0
+    ORDER BY sa.breakout_percentage DESC
+    LIMIT %(limit)s OFFSET %(offset)s;
+"""
+
+SCREENER_QUERY = """
+    SELECT *
+    FROM stock_screener
+    WHERE analysis_date = %(date)s
+    AND breakout_rank > %(offset)s
+    ORDER BY breakout_rank
+    LIMIT %(limit)s;
+"""
+
+PAGES = (1, 10, 50)
+PAGE_SIZE = 20
+
+
+def time_pages(cursor, query: str, repeat: int) -> dict:
+    """Best-of-repeat milliseconds per page number on the latest date."""
+    cursor.execute("SELECT MAX(analysis_date) FROM stock_analysis;")
+    (date,) = cursor.fetchone()
+    timings = {}
+    for page in PAGES:
+        params = {
+            "date": date,
+            "limit": PAGE_SIZE + 1,
+            "offset": (page - 1) * PAGE_SIZE,
+        }
+        best = float("inf")
+        for _ in range(repeat):
+            started = perf_counter()
+            cursor.execute(query, params)
+            cursor.fetchall()
+            best = min(best, perf_counter() - started)
+        timings[page] = best * 1000
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stocks", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=250)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch schema")
+    args = parser.parse_args()
+
+    load_dotenv()
+    pool = ConnectionPool.from_env(1, 1)
+    with pool.connection() as conn, conn.cursor() as cursor:
+        try:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+            cursor.execute(f"CREATE SCHEMA {SCHEMA};")
+            cursor.execute(f"SET search_path TO {SCHEMA};")
+            cursor.execute(CREATE_TABLES)
+            started = perf_counter()
+            cursor.execute(SEED, {"stocks": args.stocks, "days": args.days})
+            conn.commit()
+            print(
+                f"Seeded {args.stocks} stocks x {args.days} days "
+                f"in {perf_counter() - started:.1f}s"
+            )
+
+            base = time_pages(cursor, BASE_QUERY, args.repeat)
+
+            started = perf_counter()
+            with open(MIGRATION) as migration:
+                cursor.execute(migration.read())
+            conn.commit()
+            print(f"Migration and backfill took {perf_counter() - started:.1f}s")
+
+            indexed = time_pages(cursor, BASE_QUERY, args.repeat)
+            screener = time_pages(cursor, SCREENER_QUERY, args.repeat)
+
+            print(f"{'page':>5}{'base ms':>10}{'indexed ms':>12}{'screener ms':>13}")
+            for page in PAGES:
+                print(
+                    f"{page:>5}{base[page]:>10.2f}{indexed[page]:>12.2f}"
+                    f"{screener[page]:>13.2f}"
+                )
+        finally:
+            conn.rollback()
+            if not args.keep:
+                cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+                conn.commit()
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
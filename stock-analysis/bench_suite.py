@@ -0,0 +1,303 @@
+"""
+Benchmark suite for the indicators, the analysis entry points and the writers.
+
+Everything runs on synthetic prices: backtests read from a temporary price
+cache and write to an in-memory fake database, so no network or Postgres is
+needed. Results are saved as JSON; pass an earlier file to --compare to flag
+regressions:
+
+    python bench_suite.py [--profile quick|full] [--output results.json]
+                          [--compare baseline.json] [--threshold 1.25]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+from datetime import datetime
+from time import perf_counter
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+import scipy
+
+from db_client import analysis_row, max_price_row
+from fake_db import fake_database
+from panel import analyse_panel
+from price_cache import PriceCache
+from stock_analysis import (
+    analyse_history_records,
+    analyse_stock,
+    analyse_stock_history,
+    calculate_bollinger_bands,
+    calculate_emas,
+    calculate_macd,
+    calculate_rsi,
+    calculate_trendline,
+    calculate_trendline_accuracy,
+    forward_max_prices,
+    get_peak_indices,
+    history_to_results,
+    indicator_kernel,
+    volume_spike,
+)
+from synthetic_data import (
+    TRADING_DAYS,
+    synthetic_ohlcv,
+    synthetic_panel,
+    synthetic_universe,
+)
+
+PROFILES = {
+    "quick": {
+        "bars": (90, 1260),
+        "panels": ((100, 90), (1000, 90)),
+        "backtest": (10, 2 * TRADING_DAYS),
+        "rows": 10_000,
+    },
+    "full": {
+        "bars": (90, TRADING_DAYS, 5 * TRADING_DAYS, 20 * TRADING_DAYS),
+        "panels": ((100, 90), (1000, 90), (5000, 90), (5000, 20 * TRADING_DAYS)),
+        "backtest": (100, 5 * TRADING_DAYS),
+        "rows": 100_000,
+    },
+}
+
+
+def measure(func: Callable[[], Any], min_time: float = 0.2, max_repeat: int = 100):
+    """Run func until min_time has passed (at least once) and summarise the timings."""
+    timings: List[float] = []
+    while not timings or (sum(timings) < min_time and len(timings) < max_repeat):
+        started = perf_counter()
+        func()
+        timings.append(perf_counter() - started)
+    return {
+        "best": min(timings),
+        "median": float(np.median(timings)),
+        "repeat": len(timings),
+    }
+
+
+class Suite:
+    def __init__(self, min_time: float):
+        self.min_time = min_time
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def run(self, name: str, func: Callable[[], Any], items: int = 1):
+        """Time one case; items is the number of bars/rows/symbols it processes."""
+        result = measure(func, self.min_time)
+        result["items"] = items
+        result["per_item"] = result["best"] / items
+        self.results[name] = result
+        print(
+            f"{name:<48}{result['best'] * 1000:>12.3f} ms"
+            f"{result['per_item'] * 1e6:>12.2f} µs/item"
+        )
+
+
+def bench_indicators(suite: Suite, bars: int):
+    data = synthetic_ohlcv(bars)
+    peaks, highest_peak = get_peak_indices(data)
+    trendline = calculate_trendline(data, peaks, highest_peak)
+    close, high, volume = (data[c].to_numpy() for c in ("Close", "High", "Volume"))
+    cases = {
+        "get_peak_indices": lambda: get_peak_indices(data),
+        "calculate_trendline": lambda: calculate_trendline(data, peaks, highest_peak),
+        "calculate_trendline_accuracy": lambda: calculate_trendline_accuracy(
+            data, peaks, trendline
+        ),
+        "calculate_rsi": lambda: calculate_rsi(data),
+        "calculate_macd": lambda: calculate_macd(data),
+        "calculate_bollinger_bands": lambda: calculate_bollinger_bands(data),
+        "calculate_emas": lambda: calculate_emas(data),
+        "volume_spike": lambda: volume_spike(data),
+        "indicator_kernel": lambda: indicator_kernel(close, high, volume),
+        "analyse_stock": lambda: analyse_stock("S0", "2024-01-01", data=data),
+        "forward_max_prices": lambda: forward_max_prices(data),
+    }
+    for name, func in cases.items():
+        suite.run(f"indicators/{name}[{bars}]", func, bars)
+    suite.run(
+        f"history/analyse_stock_history[{bars}]",
+        lambda: analyse_stock_history("S0", data),
+        bars,
+    )
+
+
+def bench_panel(suite: Suite, symbols: int, bars: int):
+    close, high, volume = synthetic_panel(symbols, bars)
+    suite.run(
+        f"panel/analyse_panel[{symbols}x{bars}]",
+        lambda: analyse_panel(close, high, volume),
+        symbols,
+    )
+    if bars <= 90:
+        # The same analysis one symbol at a time, for comparison
+        frames = {
+            symbol: pd.DataFrame(
+                {"Close": close[symbol], "High": high[symbol], "Volume": volume[symbol]}
+            ).loc[close.index[-1] - pd.Timedelta(days=90) :]
+            for symbol in close.columns
+        }
+
+        def per_symbol():
+            for symbol, frame in frames.items():
+                try:
+                    analyse_stock(symbol, data=frame)
+                except ValueError:
+                    pass
+
+        suite.run(f"panel/analyse_stock_loop[{symbols}x{bars}]", per_symbol, symbols)
+
+
+def bench_backtest(suite: Suite, symbols: int, bars: int):
+    universe = synthetic_universe(symbols, bars, start="2010-01-04")
+    first = universe["S0"].index[0]
+    last = universe["S0"].index[-1] + pd.Timedelta(days=1)
+    start, end = first.strftime("%Y-%m-%d"), last.strftime("%Y-%m-%d")
+    days = (last - first).days
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = PriceCache(directory)
+        for symbol, data in universe.items():
+            cache.store(symbol, data, start, end)
+        assert not any(cache.missing_ranges(s, start, end) for s in universe)
+        previous = os.environ.get("PRICE_CACHE_DIR")
+        os.environ["PRICE_CACHE_DIR"] = directory
+        try:
+            db, _ = fake_database(list(universe))
+
+            def backtest():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    db.backtest_stocks(list(universe), start, days)
+
+            suite.run(f"backtest/backtest_stocks[{symbols}x{bars}]", backtest, symbols)
+        finally:
+            if previous is None:
+                del os.environ["PRICE_CACHE_DIR"]
+            else:
+                os.environ["PRICE_CACHE_DIR"] = previous
+
+
+def bench_inserts(suite: Suite, rows: int):
+    data = synthetic_ohlcv(TRADING_DAYS * 2)
+    history = analyse_stock_history("S0", data)
+    results = history_to_results(history)
+    max_prices = forward_max_prices(data).loc[history.index].to_dict("records")
+    symbols = [f"S{i}" for i in range(rows // len(results) + 1)]
+    db, _ = fake_database(symbols)
+    analysis_rows = [
+        (stock_id, result)
+        for stock_id in range(1, len(symbols) + 1)
+        for result in results
+    ][:rows]
+
+    single = analysis_rows[: min(rows, 2000)]
+
+    def insert_one_by_one():
+        for stock_id, result in single:
+            db.insert_analysis(stock_id, result)
+
+    def analysis_writer():
+        with db.analysis_writer() as writer:
+            for stock_id, result in analysis_rows:
+                writer.add(analysis_row(stock_id, result))
+
+    def max_price_writer():
+        with db.max_price_writer() as writer:
+            for i, (stock_id, result) in enumerate(analysis_rows):
+                writer.add(
+                    max_price_row(
+                        stock_id, result["date"], max_prices[i % len(max_prices)]
+                    )
+                )
+
+    analysis, max_price = analyse_history_records(0, data)
+    per_symbol = [(np.copy(analysis), np.copy(max_price)) for _ in range(len(symbols))]
+    for stock_id, (analysis, max_price) in enumerate(per_symbol, 1):
+        analysis["stock_id"] = max_price["stock_id"] = stock_id
+
+    def record_writers():
+        with db.analysis_record_writer() as analysis_writer, db.max_price_record_writer() as max_price_writer:
+            for analysis, max_price in per_symbol:
+                analysis_writer.add(analysis)
+                max_price_writer.add(max_price)
+
+    suite.run(f"insert/insert_analysis[{len(single)}]", insert_one_by_one, len(single))
+    suite.run(f"insert/analysis_writer[{rows}]", analysis_writer, rows)
+    suite.run(f"insert/max_price_writer[{rows}]", max_price_writer, rows)
+    suite.run(
+        f"insert/record_writers[{len(symbols) * len(results)}]",
+        record_writers,
+        len(symbols) * len(results),
+    )
+
+
+def compare(results: Dict[str, Any], baseline_path: str, threshold: float) -> bool:
+    """Print per-case ratios against a baseline file; True if nothing regressed."""
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+    ok = True
+    print(f"\n{'case':<48}{'ratio':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["best"] / baseline[name]["best"]
+        flag = ""
+        if ratio > threshold:
+            flag, ok = "  REGRESSION", False
+        print(f"{name:<48}{ratio:>8.2f}{flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--profile", choices=PROFILES, default="quick")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Earlier results file to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="Slowdown ratio counted as a regression",
+    )
+    parser.add_argument("--min-time", type=float, default=0.2)
+    args = parser.parse_args()
+    profile = PROFILES[args.profile]
+
+    suite = Suite(args.min_time)
+    for bars in profile["bars"]:
+        bench_indicators(suite, bars)
+    for symbols, bars in profile["panels"]:
+        bench_panel(suite, symbols, bars)
+    bench_backtest(suite, *profile["backtest"])
+    bench_inserts(suite, profile["rows"])
+
+    report = {
+        "meta": {
+            "profile": args.profile,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "scipy": scipy.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+        },
+        "results": suite.results,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Saved {len(suite.results)} results to {args.output}")
+
+    if args.compare and not compare(suite.results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Hit rates, forward return distributions and expectancy of stored breakouts.
+
+Streams every breakout row with its max price outcomes from the database in
+chunks and aggregates them by RSI, volume ratio and trendline accuracy
+bucket, so memory does not grow with the history:
+
+    python breakout_analytics.py [--start 2020-01-01] [--end 2024-12-31]
+                                 [--all-breakouts] [--horizon 5]
+"""
+
+import argparse
+import logging
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from analysis_records import RESULT_COLUMNS
+from instrumentation import configure_logging, metrics, timed
+from stock_analysis import MAX_PRICE_HORIZONS
+
+logger = logging.getLogger(__name__)
+
+# Bucket edges per dimension; values below the first edge get bucket 0 and
+# values at or above the last edge the last bucket
+BUCKET_EDGES = {
+    "rsi": (30.0, 40.0, 50.0, 60.0, 70.0, 80.0),
+    "volume_ratio": (0.5, 1.0, 1.5, 2.0, 3.0, 5.0),
+    "trendline_accuracy": (20.0, 40.0, 60.0, 80.0, 100.0),
+}
+
+# Forward return histogram: RETURN_BINS bins of RETURN_BIN_WIDTH from 0, plus
+# one bin below and one above
+RETURN_BIN_WIDTH = 0.005
+RETURN_BINS = 100
+
+# Rows streamed per round trip of the server-side cursor
+CHUNK_ROWS = 50_000
+
+MAX_PRICE_COLUMNS = tuple(
+    f"max_price_{horizon}_day" + ("s" if horizon > 1 else "")
+    for horizon in MAX_PRICE_HORIZONS
+)
+
+# Numeric columns are cast to float8 so they arrive as floats, not Decimals
+BREAKOUTS_QUERY = f"""
+    SELECT
+        sa.rsi_value::float8,
+        sa.volume_ratio::float8,
+        sa.trendline_accuracy::float8,
+        sa.close_price::float8,
+        {", ".join(f"mp.{column}::float8" for column in MAX_PRICE_COLUMNS)}
+    FROM stock_analysis sa
+    JOIN stock_analysis_max_price mp
+        ON sa.stock_id = mp.stock_id
+        AND sa.analysis_date = mp.analysis_date
+    WHERE sa.analysis_date BETWEEN %(start_date)s AND %(end_date)s
+    AND sa.breakout_percentage > 0
+    AND (NOT %(fresh_only)s OR sa.consecutive_days_above_trendline = 1);
+"""
+
+
+def bucket_labels(edges: Sequence[float]) -> list:
+    return (
+        [f"<{edges[0]:g}"]
+        + [f"[{low:g}, {high:g})" for low, high in zip(edges, edges[1:])]
+        + [f">={edges[-1]:g}"]
+    )
+
+
+class BreakoutStats:
+    """
+    Outcome sums per (RSI, volume ratio, trendline accuracy) bucket and
+    horizon, filled chunk by chunk with np.bincount.
+
+    A breakout is a hit for a horizon if its max price over it is at least
+    target above the close. Expectancy is the mean return when selling at
+    the target once reached and at the horizon's max price otherwise; only
+    max prices are stored, so it is an upper bound on what a real exit gets.
+    """
+
+    def __init__(
+        self,
+        target: float = 0.02,
+        horizons: Sequence[int] = MAX_PRICE_HORIZONS,
+        edges: Optional[Dict[str, Sequence[float]]] = None,
+    ):
+        self.target = target
+        self.horizons = tuple(horizons)
+        self.edges = {
+            name: np.asarray(values, dtype=np.float64)
+            for name, values in (edges or BUCKET_EDGES).items()
+        }
+        self.shape = tuple(len(values) + 1 for values in self.edges.values())
+        buckets = int(np.prod(self.shape))
+        self.rows = 0
+        self.skipped = 0
+        self.breakouts = np.zeros(buckets, dtype=np.int64)
+        self.outcomes = np.zeros((buckets, len(self.horizons)), dtype=np.int64)
+        self.hits = np.zeros((buckets, len(self.horizons)))
+        self.return_sums = np.zeros((buckets, len(self.horizons)))
+        self.return_squares = np.zeros((buckets, len(self.horizons)))
+        self.capped_sums = np.zeros((buckets, len(self.horizons)))
+        self.histogram = np.zeros(
+            (buckets, len(self.horizons), RETURN_BINS + 2), dtype=np.int64
+        )
+
+    @timed("analytics.update")
+    def update(self, chunk: np.ndarray):
+        """
+        Add a chunk of rows laid out like BREAKOUTS_QUERY: RSI, volume ratio,
+        trendline accuracy, close and one max price per horizon. Rows missing
+        a bucket value or the close are skipped.
+        """
+        features = chunk[:, : len(self.edges)]
+        close = chunk[:, len(self.edges)]
+        usable = ~(np.isnan(features).any(axis=1) | np.isnan(close))
+        self.rows += len(chunk)
+        self.skipped += int((~usable).sum())
+        features, close = features[usable], close[usable]
+        max_prices = chunk[usable, len(self.edges) + 1 :]
+
+        bucket = np.ravel_multi_index(
+            tuple(
+                np.digitize(features[:, i], edges)
+                for i, edges in enumerate(self.edges.values())
+            ),
+            self.shape,
+        )
+        buckets = len(self.breakouts)
+        self.breakouts += np.bincount(bucket, minlength=buckets)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns = max_prices / close[:, None] - 1
+        return_bins = np.clip(
+            np.floor(returns / RETURN_BIN_WIDTH) + 1, 0, RETURN_BINS + 1
+        )
+        for h in range(len(self.horizons)):
+            known = ~np.isnan(returns[:, h])
+            b = bucket[known]
+            r = returns[known, h]
+            self.outcomes[:, h] += np.bincount(b, minlength=buckets)
+            self.hits[:, h] += np.bincount(
+                b, weights=r >= self.target, minlength=buckets
+            )
+            self.return_sums[:, h] += np.bincount(b, weights=r, minlength=buckets)
+            self.return_squares[:, h] += np.bincount(
+                b, weights=r * r, minlength=buckets
+            )
+            self.capped_sums[:, h] += np.bincount(
+                b, weights=np.minimum(r, self.target), minlength=buckets
+            )
+            cells = b * (RETURN_BINS + 2) + return_bins[known, h].astype(np.int64)
+            self.histogram[:, h] += np.bincount(
+                cells, minlength=buckets * (RETURN_BINS + 2)
+            ).reshape(buckets, RETURN_BINS + 2)
+
+    def update_records(
+        self, analysis: np.ndarray, max_prices: np.ndarray, fresh_only: bool = True
+    ):
+        """
+        Add the breakouts among ANALYSIS_DTYPE records, with the MAX_PRICE_DTYPE
+        records of the same days (as analyse_history_records returns them),
+        selecting rows like BREAKOUTS_QUERY.
+        """
+        breakout = analysis["breakout_percentage"] > 0
+        if fresh_only:
+            breakout &= analysis["consecutive_days_above_trendline"] == 1
+        fields = [RESULT_COLUMNS.get(name, name) for name in self.edges]
+        columns = [analysis[field][breakout] for field in fields + ["close_price"]]
+        columns += [
+            max_prices[f"max_price_{horizon}_day" + ("s" if horizon > 1 else "")][
+                breakout
+            ]
+            for horizon in self.horizons
+        ]
+        self.update(np.column_stack(columns).astype(np.float64, copy=False))
+
+    def table(self, by: Sequence[str] = ("rsi",), horizon: int = 5) -> pd.DataFrame:
+        """
+        Statistics over one horizon per bucket of the `by` dimensions, summed
+        over the others: breakouts, hit rate, mean and standard deviation of
+        the forward max return, expectancy and return quartiles.
+        """
+        h = self.horizons.index(horizon)
+        names = list(self.edges)
+        other_axes = tuple(i for i, name in enumerate(names) if name not in by)
+        order = [names.index(name) for name in by]
+
+        def collapse(values: np.ndarray) -> np.ndarray:
+            cube = values.reshape(self.shape + values.shape[1:]).sum(axis=other_axes)
+            kept = [i for i in range(len(names)) if i not in other_axes]
+            cube = np.moveaxis(cube, [kept.index(i) for i in order], range(len(by)))
+            return cube.reshape((-1,) + values.shape[1:])
+
+        outcomes = collapse(self.outcomes[:, h])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = collapse(self.return_sums[:, h]) / outcomes
+            variance = collapse(self.return_squares[:, h]) / outcomes - mean**2
+            frame = pd.DataFrame(
+                {
+                    "breakouts": collapse(self.breakouts),
+                    "outcomes": outcomes,
+                    "hit_rate": collapse(self.hits[:, h]) / outcomes,
+                    "mean_return": mean,
+                    "return_std": np.sqrt(np.maximum(variance, 0.0)),
+                    "expectancy": collapse(self.capped_sums[:, h]) / outcomes,
+                },
+                index=pd.MultiIndex.from_product(
+                    [bucket_labels(self.edges[name]) for name in by], names=by
+                ),
+            )
+        histogram = collapse(self.histogram[:, h])
+        for q in (0.25, 0.5, 0.75):
+            frame[f"p{round(q * 100)}_return"] = _histogram_quantile(histogram, q)
+        return frame
+
+
+def _histogram_quantile(histogram: np.ndarray, q: float) -> np.ndarray:
+    """Upper edge of the return bin holding the q-quantile of each histogram row."""
+    cumulative = np.cumsum(histogram, axis=1)
+    totals = cumulative[:, -1]
+    rank = np.maximum(np.ceil(q * totals), 1)
+    bins = (cumulative < rank[:, None]).sum(axis=1)
+    # Bin 0 holds returns below zero; the last bin is open-ended
+    edges = np.minimum(bins, RETURN_BINS) * RETURN_BIN_WIDTH
+    return np.where(totals > 0, edges, np.nan)
+
+
+@timed("analytics.breakout_outcomes")
+def breakout_outcomes(
+    db,
+    start_date: str = "2020-01-01",
+    end_date: Optional[str] = None,
+    fresh_only: bool = True,
+    target: float = 0.02,
+    chunk_rows: int = CHUNK_ROWS,
+) -> BreakoutStats:
+    """
+    Aggregate the outcomes of every breakout between start_date and end_date
+    (default today) across all stocks.
+
+    Rows are read through a server-side cursor chunk_rows at a time, so only
+    one chunk and the bucket sums are held in memory. fresh_only keeps the
+    first day of each breakout, as fetch_breakout_data_with_max_prices does.
+    A dropped connection restarts the stream from scratch.
+    """
+    params = {
+        "start_date": start_date,
+        "end_date": end_date or pd.Timestamp.today().strftime("%Y-%m-%d"),
+        "fresh_only": fresh_only,
+    }
+
+    def collect(conn) -> BreakoutStats:
+        stats = BreakoutStats(target)
+        with conn.cursor(name="breakout_outcomes") as cursor:
+            cursor.itersize = chunk_rows
+            cursor.execute(BREAKOUTS_QUERY, params)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                stats.update(np.array(rows, dtype=np.float64))
+                metrics.count("analytics.rows", len(rows))
+        conn.rollback()
+        return stats
+
+    stats = db.pool.run_idempotent(collect)
+    logger.info(
+        "Aggregated %d breakouts from %s to %s (%d skipped for missing values)",
+        stats.rows,
+        params["start_date"],
+        params["end_date"],
+        stats.skipped,
+    )
+    return stats
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--start", default="2020-01-01")
+    parser.add_argument("--end")
+    parser.add_argument(
+        "--all-breakouts",
+        action="store_true",
+        help="Count every day above the trendline, not just the first",
+    )
+    parser.add_argument("--target", type=float, default=0.02)
+    parser.add_argument("--horizon", type=int, choices=MAX_PRICE_HORIZONS, default=5)
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    from db_client import StockAnalysisDatabase
+
+    db = StockAnalysisDatabase(1, 1)
+    try:
+        stats = breakout_outcomes(
+            db, args.start, args.end, not args.all_breakouts, args.target
+        )
+    finally:
+        db.close_connection()
+    with pd.option_context("display.width", 160, "display.max_columns", None):
+        for name in BUCKET_EDGES:
+            logger.info(
+                "%d-day outcomes by %s:\n%s",
+                args.horizon,
+                name,
+                stats.table((name,), args.horizon).to_string(float_format="%.3f"),
+            )
+
+
+if __name__ == "__main__":
+    main()
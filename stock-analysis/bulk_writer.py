@@ -0,0 +1,220 @@
+import io
+from time import monotonic, perf_counter
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from analysis_records import records_csv
+from connection_pool import ConnectionPool
+from instrumentation import metrics
+
+
+class BulkWriter:
+    """
+    Buffer rows for one INSERT statement and write them in batches.
+
+    Rows are flushed through execute_values once max_rows are buffered or
+    max_interval seconds have passed since the last flush, and on close().
+    The statement keeps its own ON CONFLICT clause, so batched writes behave
+    like the single-row inserts they replace.
+    """
+
+    def __init__(
+        self,
+        conn,
+        query: str,
+        key_columns: int = 0,
+        max_rows: int = 1000,
+        max_interval: Optional[float] = 5.0,
+        prepare: Optional[Callable[[List[Sequence[Any]]], None]] = None,
+    ):
+        """
+        Parameters:
+        - conn: psycopg2 connection to write through, or a ConnectionPool.
+          Through a pool each flush checks out a connection and is retried
+          on a new one if the connection drops.
+        - query: INSERT statement with a single "VALUES %s" placeholder.
+        - key_columns: Number of leading columns forming the conflict key. A
+          later row with the same key replaces the buffered one, since
+          Postgres rejects DO UPDATE touching a row twice in one statement.
+        - max_rows: Flush once this many rows are buffered.
+        - max_interval: Flush on add() once this many seconds have passed
+          since the last flush. None disables time-based flushing.
+        - prepare: Called with the rows before each write, e.g. to create the
+          partitions they go into.
+        """
+        self.conn = conn
+        self.query = query
+        self.key_columns = key_columns
+        self.max_rows = max_rows
+        self.max_interval = max_interval
+        self.prepare = prepare
+        self.rows: Dict[Any, Sequence[Any]] = {}
+        self.rows_written = 0
+        self.flushes = 0
+        self.flush_seconds = 0.0
+        self._last_flush = monotonic()
+
+    def add(self, row: Sequence[Any]):
+        """Buffer one row, flushing if the size or time limit is reached."""
+        key = tuple(row[: self.key_columns]) if self.key_columns else len(self.rows)
+        self.rows[key] = row
+        if len(self.rows) >= self.max_rows or (
+            self.max_interval is not None
+            and monotonic() - self._last_flush >= self.max_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """Write all buffered rows in one statement and commit."""
+        self._last_flush = monotonic()
+        if not self.rows:
+            return
+        rows = list(self.rows.values())
+        started = perf_counter()
+        if self.prepare is not None:
+            self.prepare(rows)
+
+        def write(conn):
+            with conn.cursor() as cursor:
+                execute_values(cursor, self.query, rows, page_size=len(rows))
+            conn.commit()
+
+        if isinstance(self.conn, ConnectionPool):
+            self.conn.run_idempotent(write)
+        else:
+            try:
+                write(self.conn)
+            except Exception:
+                self.conn.rollback()
+                raise
+        elapsed = perf_counter() - started
+        metrics.observe("db.flush", elapsed)
+        metrics.count("db.rows_written", len(rows))
+        self.flush_seconds += elapsed
+        self.flushes += 1
+        self.rows_written += len(rows)
+        self.rows.clear()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self) -> "BulkWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.flush_seconds == 0:
+            return 0.0
+        return self.rows_written / self.flush_seconds
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            "rows_written": self.rows_written,
+            "flushes": self.flushes,
+            "flush_seconds": self.flush_seconds,
+            "rows_per_second": self.rows_per_second,
+        }
+
+
+class RecordWriter(BulkWriter):
+    """
+    BulkWriter for structured record arrays (see analysis_records).
+
+    Buffered arrays are concatenated and sent with COPY into a temporary
+    staging table, then moved into the table by the INSERT statement with its
+    VALUES list swapped for a SELECT from staging, so the ON CONFLICT clause
+    behaves as in BulkWriter without building a tuple per row.
+    """
+
+    def __init__(
+        self,
+        conn,
+        table: str,
+        query: str,
+        key_columns: int = 0,
+        max_rows: int = 1000,
+        max_interval: Optional[float] = 5.0,
+        prepare: Optional[Callable[[np.ndarray], None]] = None,
+        decimals: Optional[int] = None,
+    ):
+        """
+        Parameters as for BulkWriter, plus:
+        - table: Table the query inserts into; the staging table copies its
+          columns.
+        - decimals: Round floats to this many decimals when sending.
+        Record fields must be named like the table columns, in query order.
+        """
+        super().__init__(conn, query, key_columns, max_rows, max_interval, prepare)
+        self.table = table
+        self.decimals = decimals
+        self.chunks: List[np.ndarray] = []
+        self.buffered = 0
+
+    def add(self, records: np.ndarray):
+        """Buffer an array of records, flushing if the size or time limit is reached."""
+        self.chunks.append(records)
+        self.buffered += len(records)
+        if self.buffered >= self.max_rows or (
+            self.max_interval is not None
+            and monotonic() - self._last_flush >= self.max_interval
+        ):
+            self.flush()
+
+    def _buffered_records(self) -> np.ndarray:
+        records = np.concatenate(self.chunks)
+        if self.key_columns:
+            # Keep the last record per key, like BulkWriter.add
+            keys = records[list(records.dtype.names[: self.key_columns])]
+            _, last = np.unique(keys[::-1], return_index=True)
+            records = records[np.sort(len(records) - 1 - last)]
+        return records
+
+    def flush(self):
+        """COPY all buffered records through a staging table in one transaction."""
+        self._last_flush = monotonic()
+        if not self.buffered:
+            return
+        records = self._buffered_records()
+        started = perf_counter()
+        if self.prepare is not None:
+            self.prepare(records)
+        columns = ", ".join(records.dtype.names)
+        data = records_csv(records, self.decimals)
+        staging = f"{self.table}_staging"
+
+        def write(conn):
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+                    f"SELECT {columns} FROM {self.table} WITH NO DATA;"
+                )
+                cursor.copy_expert(
+                    f"COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv);",
+                    io.StringIO(data),
+                )
+                cursor.execute(
+                    self.query.replace("VALUES %s", f"SELECT {columns} FROM {staging}")
+                )
+            conn.commit()
+
+        if isinstance(self.conn, ConnectionPool):
+            self.conn.run_idempotent(write)
+        else:
+            try:
+                write(self.conn)
+            except Exception:
+                self.conn.rollback()
+                raise
+        elapsed = perf_counter() - started
+        metrics.observe("db.flush", elapsed)
+        metrics.count("db.rows_written", len(records))
+        self.flush_seconds += elapsed
+        self.flushes += 1
+        self.rows_written += len(records)
+        self.chunks.clear()
+        self.buffered = 0
@@ -0,0 +1,353 @@
+"""
+Headless breakout charts for many stocks at once.
+
+Renders the plot_breakout_and_max_prices chart of every candidate (by
+default the top fresh breakouts of the latest screener day) to PNG or SVG
+with the Agg backend in a pool of worker processes, and writes an index.html
+linking them:
+
+    python chart_report.py [--date 2024-06-03] [--top 200] [--start 2020-01-01]
+                           [--output reports] [--format png|svg] [--workers 4]
+"""
+
+import argparse
+import html
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import groupby
+from time import perf_counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from analysis_records import MAX_PRICE_COLUMNS
+from instrumentation import configure_logging, metrics, timed
+
+logger = logging.getLogger(__name__)
+
+# One breakout day of one stock
+CHART_DTYPE = np.dtype(
+    [
+        ("analysis_date", "datetime64[D]"),
+        ("breakout_percentage", np.float64),
+        ("close_price", np.float64),
+    ]
+    + [(column, np.float64) for column in MAX_PRICE_COLUMNS]
+)
+
+# Days plotted per chart at most; longer series are decimated
+MAX_POINTS = 600
+
+# Extra savefig options per image format; fast zlib settings matter more
+# than file size for a nightly report
+SAVE_OPTIONS = {"png": {"pil_kwargs": {"compress_level": 1}}, "svg": {}}
+
+# Markers are dropped above this many points, where they only add clutter
+MARKER_POINTS = 150
+
+CANDIDATES_QUERY = """
+    SELECT stock_symbol
+    FROM stock_screener
+    WHERE analysis_date = COALESCE(
+        %(date)s::date, (SELECT max(analysis_date) FROM stock_screener)
+    )
+    AND consecutive_days_above_trendline = 1
+    ORDER BY breakout_rank
+    LIMIT %(top)s;
+"""
+
+# Missing max prices come back as NaN so rows fit CHART_DTYPE as they are
+SERIES_QUERY = f"""
+    SELECT
+        s.stock_symbol,
+        sa.analysis_date,
+        sa.breakout_percentage::float8,
+        sa.close_price::float8,
+        {", ".join(f"COALESCE(mp.{column}::float8, 'NaN')" for column in MAX_PRICE_COLUMNS)}
+    FROM stock_analysis sa
+    JOIN stocks s ON sa.stock_id = s.stock_id
+    LEFT JOIN stock_analysis_max_price mp
+        ON sa.stock_id = mp.stock_id
+        AND sa.analysis_date = mp.analysis_date
+    WHERE s.stock_symbol = ANY(%(symbols)s)
+    AND sa.analysis_date BETWEEN %(start_date)s AND %(end_date)s
+    AND sa.breakout_percentage > 0
+    AND sa.consecutive_days_above_trendline = 1
+    ORDER BY s.stock_symbol, sa.analysis_date;
+"""
+
+
+def fetch_chart_series(
+    db,
+    symbols: Optional[Sequence[str]] = None,
+    date: Optional[str] = None,
+    top: int = 200,
+    start_date: str = "2020-01-01",
+    end_date: Optional[str] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Fresh breakout days with their max prices per stock, as CHART_DTYPE
+    arrays, read in one query. symbols defaults to the top fresh breakouts
+    on date (default the latest day in the screener).
+    """
+    params = {
+        "date": date,
+        "top": top,
+        "start_date": start_date,
+        "end_date": end_date or datetime.today().strftime("%Y-%m-%d"),
+    }
+
+    def read(conn):
+        with conn.cursor() as cursor:
+            if symbols is None:
+                cursor.execute(CANDIDATES_QUERY, params)
+                params["symbols"] = [row[0] for row in cursor.fetchall()]
+            else:
+                params["symbols"] = list(symbols)
+            cursor.execute(SERIES_QUERY, params)
+            rows = cursor.fetchall()
+        conn.rollback()
+        return rows
+
+    rows = db.pool.run_idempotent(read)
+    return {
+        symbol: np.array([row[1:] for row in symbol_rows], dtype=CHART_DTYPE)
+        for symbol, symbol_rows in groupby(rows, key=lambda row: row[0])
+    }
+
+
+def decimate(values: np.ndarray, max_points: int = MAX_POINTS) -> np.ndarray:
+    """
+    Positions of at most max_points of values to plot: the lowest and highest
+    value of each of max_points / 2 equal runs, plus the last point, so
+    spikes survive where plain striding would skip them.
+    """
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+    buckets = max_points // 2
+    bucket = np.arange(n) * buckets // n
+    order = np.lexsort((values, bucket))
+    starts = np.searchsorted(bucket, np.arange(buckets))
+    ends = np.append(starts[1:], n)
+    return np.unique(np.concatenate([order[starts], order[ends - 1], [n - 1]]))
+
+
+class ChartTemplate:
+    """
+    The breakout chart built once and redrawn per stock.
+
+    Axes, lines, the breakout bars, legend and date axis are created up front;
+    render() only swaps in a stock's data, limits and title before saving, so
+    a worker pays for building a figure once rather than per chart.
+    """
+
+    def __init__(self, width: float = 14, height: float = 8, dpi: int = 80):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.collections import LineCollection
+        from matplotlib.dates import AutoDateLocator, ConciseDateFormatter
+        from matplotlib.figure import Figure
+
+        self.dpi = dpi
+        self.figure = Figure(figsize=(width, height), dpi=dpi)
+        FigureCanvasAgg(self.figure)
+        self.figure.subplots_adjust(left=0.07, right=0.93, bottom=0.08, top=0.94)
+        self.prices = self.figure.add_subplot()
+        self.breakouts = self.prices.twinx()
+
+        self.bars = LineCollection(
+            [], colors="skyblue", alpha=0.6, label="Breakout Percentage"
+        )
+        self.breakouts.add_collection(self.bars)
+        self.breakouts.set_ylabel("Breakout Percentage", color="skyblue")
+        self.breakouts.tick_params(axis="y", labelcolor="skyblue")
+        # Keep the price lines above the bars
+        self.prices.set_zorder(self.breakouts.get_zorder() + 1)
+        self.prices.patch.set_visible(False)
+
+        (self.close,) = self.prices.plot(
+            [], [], label="Close Price", color="purple", linestyle="--", marker="o"
+        )
+        self.max_prices = [
+            self.prices.plot([], [], label=label, marker="o")[0]
+            for label in (
+                "Max Price {} {}".format(*column.split("_")[2:]).title()
+                for column in MAX_PRICE_COLUMNS
+            )
+        ]
+        self.prices.set_xlabel("Analysis Date")
+        self.prices.set_ylabel("Price", color="purple")
+        self.prices.tick_params(axis="y", labelcolor="purple")
+        self.prices.legend(
+            [self.close, *self.max_prices, self.bars],
+            [line.get_label() for line in (self.close, *self.max_prices, self.bars)],
+            loc="upper left",
+        )
+        locator = AutoDateLocator()
+        self.prices.xaxis.set_major_locator(locator)
+        self.prices.xaxis.set_major_formatter(ConciseDateFormatter(locator))
+
+    def render(self, symbol: str, series: np.ndarray, path: str):
+        """Draw one stock's CHART_DTYPE series and save it; format from the extension."""
+        from matplotlib.dates import date2num
+
+        kept = decimate(series["close_price"])
+        series = series[kept]
+        x = date2num(series["analysis_date"])
+        marker = "o" if len(series) <= MARKER_POINTS else "None"
+
+        self.close.set_data(x, series["close_price"])
+        self.close.set_marker(marker)
+        for line, column in zip(self.max_prices, MAX_PRICE_COLUMNS):
+            line.set_data(x, series[column])
+            line.set_marker(marker)
+
+        # Bars as vertical strokes about 60% of the spacing between days
+        heights = series["breakout_percentage"]
+        self.bars.set_segments(
+            np.stack([np.c_[x, np.zeros_like(x)], np.c_[x, heights]], axis=1)
+        )
+        spacing = self.prices.bbox.width / max(len(x), 1)
+        self.bars.set_linewidth(np.clip(spacing * 0.6 * 72 / self.dpi, 1, 12))
+
+        if len(x):
+            margin = max((x[-1] - x[0]) * 0.02, 1.0)
+            self.prices.set_xlim(x[0] - margin, x[-1] + margin)
+            self.breakouts.set_ylim(0, max(np.nanmax(heights), 1e-9) * 1.1)
+        self.prices.relim()
+        self.prices.autoscale_view(scalex=False)
+        self.prices.set_title(f"{symbol} Breakout Percentage and Max Prices Over Time")
+        self.figure.savefig(path, **SAVE_OPTIONS.get(path.rsplit(".", 1)[-1], {}))
+
+
+# Per-worker template, built by _init_worker
+_template: Optional[ChartTemplate] = None
+
+
+def _init_worker(width: float, height: float, dpi: int):
+    global _template
+    _template = ChartTemplate(width, height, dpi)
+
+
+def _render(task: Tuple[str, np.ndarray, str]) -> Tuple[str, float]:
+    symbol, series, path = task
+    started = perf_counter()
+    _template.render(symbol, series, path)
+    return symbol, perf_counter() - started
+
+
+@timed("charts.render_all")
+def render_charts(
+    series: Dict[str, np.ndarray],
+    output_dir: str,
+    image_format: str = "png",
+    workers: Optional[int] = None,
+    size: Tuple[float, float] = (14, 8),
+    dpi: int = 80,
+) -> Dict[str, str]:
+    """
+    Render one chart per stock into output_dir, spread over workers
+    processes (default one per CPU; 1 renders in this process). Returns the
+    file name of each rendered chart by symbol.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    files = {symbol: f"{symbol}.{image_format}" for symbol in series}
+    tasks = [
+        (symbol, rows, os.path.join(output_dir, files[symbol]))
+        for symbol, rows in series.items()
+    ]
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+    if workers == 1:
+        _init_worker(*size, dpi)
+        rendered = map(_render, tasks)
+    else:
+        executor = ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(*size, dpi)
+        )
+        rendered = executor.map(
+            _render, tasks, chunksize=max(len(tasks) // (workers * 4), 1)
+        )
+    try:
+        for symbol, seconds in rendered:
+            # Worker timers are lost, so the parent records them
+            metrics.observe("charts.render", seconds)
+    finally:
+        if workers > 1:
+            executor.shutdown()
+    return files
+
+
+def write_index(
+    path: str,
+    series: Dict[str, np.ndarray],
+    files: Dict[str, str],
+    title: str = "Breakout report",
+):
+    """Write an HTML page showing every chart, with each stock's latest breakout."""
+    cards = []
+    for symbol, rows in series.items():
+        latest = rows[-1]
+        cards.append(
+            f'<figure><a href="{html.escape(files[symbol])}">'
+            f'<img src="{html.escape(files[symbol])}" loading="lazy" '
+            f'alt="{html.escape(symbol)}"></a><figcaption>'
+            f"<b>{html.escape(symbol)}</b> {latest['analysis_date']}: "
+            f"{latest['breakout_percentage']:.2f}% above trendline, "
+            f"close {latest['close_price']:.2f}, {len(rows)} breakouts"
+            "</figcaption></figure>"
+        )
+    with open(path, "w") as output:
+        output.write(
+            f"<!DOCTYPE html>\n<html><head><meta charset='utf-8'>"
+            f"<title>{html.escape(title)}</title><style>"
+            "body{font-family:sans-serif;margin:1em}"
+            "main{display:grid;grid-template-columns:repeat(auto-fill,minmax(560px,1fr));gap:1em}"
+            "figure{margin:0}img{width:100%;height:auto}"
+            f"</style></head><body><h1>{html.escape(title)}</h1>"
+            f"<main>{''.join(cards)}</main></body></html>\n"
+        )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("symbols", nargs="*", help="Default: top breakouts on --date")
+    parser.add_argument("--date", help="Screener day, default the latest")
+    parser.add_argument("--top", type=int, default=200)
+    parser.add_argument("--start", default="2020-01-01")
+    parser.add_argument("--end")
+    parser.add_argument("--output", default="reports")
+    parser.add_argument("--format", choices=("png", "svg"), default="png")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--dpi", type=int, default=80)
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    from db_client import StockAnalysisDatabase
+
+    db = StockAnalysisDatabase(1, 1)
+    try:
+        series = fetch_chart_series(
+            db, args.symbols or None, args.date, args.top, args.start, args.end
+        )
+    finally:
+        db.close_connection()
+    if not series:
+        logger.info("No breakouts to chart.")
+        return
+
+    started = perf_counter()
+    files = render_charts(series, args.output, args.format, args.workers, dpi=args.dpi)
+    index = os.path.join(args.output, "index.html")
+    write_index(index, series, files, f"Breakouts {args.date or 'latest'}")
+    logger.info(
+        "Rendered %d charts in %.1fs; see %s",
+        len(files),
+        perf_counter() - started,
+        index,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Check that fetch_stock_data_batch splits multi-ticker downloads correctly.
+
+Feeds fetch_stock_data_batch a fake download returning frames shaped like
+yf.download(..., group_by="ticker"): a symbol listed after the others, one
+delisted before them, one the provider returned only NaN for, one it left
+out, and a single-symbol chunk without the ticker column level. Each split
+frame must equal the symbol's own bars, and symbols without data must be
+reported missing. Exits with status 1 on a failure:
+
+    python check_batch_download.py
+"""
+
+import argparse
+import os
+import sys
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from stock_analysis import fetch_stock_data_batch
+from synthetic_data import synthetic_universe
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.parse_args()
+    os.environ.pop("PRICE_CACHE_DIR", None)
+
+    frames = synthetic_universe(4, 120, start="2023-01-03")
+    index = frames["S0"].index
+    expected = {
+        "S0": frames["S0"],
+        "LATE": frames["S1"].iloc[40:],
+        "GONE": frames["S2"].iloc[:70],
+        "S3": frames["S3"],
+    }
+    symbols = ["S0", "LATE", "GONE", "NAN", "ABSENT", "S3"]
+    chunks: List[List[str]] = []
+
+    def download(tickers, start, end, group_by=None):
+        chunks.append(list(tickers))
+        if len(tickers) == 1:
+            return expected[tickers[0]]
+        columns = {}
+        for symbol in tickers:
+            if symbol == "ABSENT":
+                continue
+            bars = expected.get(symbol)
+            if bars is None:
+                bars = pd.DataFrame(np.nan, index=index, columns=frames["S0"].columns)
+            columns[symbol] = bars.reindex(index)
+        return pd.concat(columns, axis=1)
+
+    fetched, missing = fetch_stock_data_batch(
+        symbols, "2023-01-03", "2023-07-01", chunk_size=5, download=download
+    )
+
+    failures = []
+    if chunks != [symbols[:5], symbols[5:]]:
+        failures.append(f"downloaded in chunks {chunks}")
+    if sorted(missing) != ["ABSENT", "NAN"]:
+        failures.append(f"missing {missing}, expected ABSENT and NAN")
+    for symbol, bars in expected.items():
+        frame = fetched.get(symbol)
+        if frame is None:
+            failures.append(f"{symbol}: no frame")
+            continue
+        try:
+            pd.testing.assert_frame_equal(
+                frame, bars, check_dtype=False, check_freq=False
+            )
+        except AssertionError as error:
+            failures.append(f"{symbol}: {str(error).splitlines()[0]}")
+
+    for failure in failures:
+        print(failure)
+    print(f"{len(fetched)} symbols split, {len(failures)} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Check that incremental daily analysis gives the numbers of a full recompute.
+
+Replays --days sessions of synthetic bars through analyse_stock_incremental,
+with the indicator state saved in a fake database and prices served from a
+PriceCache, and compares every day with analyse_stock over its full window.
+Also analyses a day the state has already passed. Exits with status 1 on a
+mismatch:
+
+    python check_incremental.py [--symbols 3] [--days 200] [--period 3]
+"""
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+import numpy as np
+
+from fake_db import fake_database
+from price_cache import PriceCache
+from stock_analysis import analyse_stock
+from synthetic_data import synthetic_universe
+from trading_calendar import default_calendar
+
+
+def differences(
+    incremental: Dict[str, Any], full: Dict[str, Any], rel_tol: float = 1e-9
+) -> List[str]:
+    """Keys on which two analyse_stock results disagree."""
+    different = []
+    for key, expected in full.items():
+        value = incremental[key]
+        if value is None or expected is None or isinstance(expected, str):
+            same = value == expected
+        else:
+            same = math.isclose(value, expected, rel_tol=rel_tol, abs_tol=1e-9) or (
+                np.isnan(value) and np.isnan(expected)
+            )
+        if not same:
+            different.append(f"{key} {value!r} != {expected!r}")
+    return different
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=3)
+    parser.add_argument("--days", type=int, default=200)
+    parser.add_argument("--period", type=int, default=3)
+    args = parser.parse_args()
+
+    frames = synthetic_universe(args.symbols, args.days + 100, start="2023-01-03")
+    index = next(iter(frames.values())).index
+    sessions = default_calendar().sessions(index[90], index[-1])[: args.days]
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ["PRICE_CACHE_DIR"] = cache_dir
+        cache = PriceCache(cache_dir)
+        end = str(np.datetime64(index[-1], "D") + 1)
+        for symbol, data in frames.items():
+            cache.store(symbol, data, str(np.datetime64(index[0], "D")), end)
+
+        db, _ = fake_database(list(frames))
+        failures = compared = 0
+        for stock in db.fetch_all_stocks():
+            symbol = stock["stock_symbol"]
+            for day in map(str, sessions):
+                incremental = db.analyse_stock_incremental(stock, day, args.period)
+                try:
+                    full = analyse_stock(symbol, day, args.period)
+                except ValueError:
+                    continue  # No peaks in the window
+                compared += 1
+                different = differences(incremental, full)
+                if different:
+                    failures += 1
+                    print(f"{symbol} {day}: {'; '.join(different)}")
+
+            # A day before the saved state's last bar is recomputed in full
+            day = str(sessions[len(sessions) // 2])
+            if differences(
+                db.analyse_stock_incremental(stock, day, args.period),
+                analyse_stock(symbol, day, args.period),
+            ):
+                failures += 1
+                print(f"{symbol} {day}: past day differs from a full recompute")
+
+    print(f"{compared} days compared, {failures} mismatches")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Check that the price cache only counts ranges it actually received as covered.
+
+Serves synthetic bars through a fake provider that records its requests and
+can be switched to returning nothing, like yf.download on a transient error.
+Checks that a range between two cached ranges is downloaded rather than
+served empty, and that an empty download, single or batched, is retried
+once the provider recovers. Exits with status 1 on a failure:
+
+    python check_price_cache.py
+"""
+
+import argparse
+import sys
+import tempfile
+from typing import List, Tuple
+
+import pandas as pd
+
+from price_cache import PriceCache
+from stock_analysis import fetch_stock_data_batch
+from synthetic_data import synthetic_universe
+
+
+class FakeProvider:
+    """yf.download over fixed histories; returns nothing while `down` is set."""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.down = False
+        self.requests: List[Tuple[str, str]] = []
+
+    def __call__(self, tickers, start, end, group_by=None):
+        self.requests.append((start, end))
+        if self.down:
+            return pd.DataFrame()
+        if isinstance(tickers, str):
+            return self._slice(tickers, start, end)
+        return pd.concat(
+            {symbol: self._slice(symbol, start, end) for symbol in tickers}, axis=1
+        )
+
+    def _slice(self, symbol, start, end):
+        frame = self.frames[symbol]
+        return frame[(frame.index >= start) & (frame.index < end)]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.parse_args()
+
+    frames = synthetic_universe(2, 800, start="2018-01-02")
+    provider = FakeProvider(frames)
+    failures = []
+
+    def expect(condition: bool, message: str):
+        if not condition:
+            failures.append(message)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = PriceCache(cache_dir)
+
+        # Two separate ranges leave the gap between them uncovered
+        cache.get("S0", "2018-02-01", "2018-07-01", provider)
+        cache.get("S0", "2020-01-01", "2020-04-01", provider)
+        expect(
+            cache.missing_ranges("S0", "2018-02-01", "2020-04-01")
+            == [("2018-07-01", "2020-01-01")],
+            "the gap between two cached ranges is reported as covered",
+        )
+        requests = len(provider.requests)
+        gap = cache.get("S0", "2019-01-01", "2019-04-01", provider)
+        expect(
+            len(provider.requests) == requests + 1 and len(gap) > 0,
+            f"a request inside the gap returned {len(gap)} bars without a download",
+        )
+        expect(
+            not cache.missing_ranges("S0", "2019-01-01", "2019-04-01"),
+            "a downloaded range is not covered",
+        )
+
+        # A failed single-symbol download is not cached as an empty range
+        provider.down = True
+        expect(
+            cache.get("S1", "2019-01-01", "2019-04-01", provider).empty,
+            "the provider is down but bars were returned",
+        )
+        provider.down = False
+        recovered = cache.get("S1", "2019-01-01", "2019-04-01", provider)
+        expect(
+            len(recovered) > 0,
+            "an empty download left its range covered after the provider recovered",
+        )
+
+        # Nor is a failed batch download
+        provider.down = True
+        _, missing = fetch_stock_data_batch(
+            ["S0", "S1"], "2021-01-01", "2021-04-01", download=provider, cache=cache
+        )
+        expect(missing == ["S0", "S1"], f"batch while down, missing {missing}")
+        provider.down = False
+        fetched, missing = fetch_stock_data_batch(
+            ["S0", "S1"], "2021-01-01", "2021-04-01", download=provider, cache=cache
+        )
+        expect(
+            sorted(fetched) == ["S0", "S1"] and not missing,
+            f"an empty batch download left its range covered, missing {missing}",
+        )
+
+    for failure in failures:
+        print(failure)
+    print(f"{len(provider.requests)} downloads, {len(failures)} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Check that writes survive a database connection dropped mid-write.
+
+Flushes analysis rows through StockAnalysisDatabase's writers (execute_values
+and COPY) on a ConnectionPool over fake_db.FlakyServer, which drops the
+connection in the middle of the INSERT. Each flush must be retried exactly
+once on a new connection and leave every row stored once; a connection that
+keeps dropping must fail after the configured retries with nothing stored.
+Exits with status 1 on a failure:
+
+    python check_reconnect.py [--bars 300]
+"""
+
+import argparse
+import logging
+import sys
+from typing import Callable, List
+
+import psycopg2
+
+from db_client import StockAnalysisDatabase, analysis_row
+from fake_db import FlakyServer
+from stock_analysis import (
+    analyse_history_records,
+    analyse_stock_history,
+    history_to_results,
+)
+from synthetic_data import synthetic_ohlcv
+
+RETRIES = 3
+
+
+def write_rows(db: StockAnalysisDatabase, data) -> int:
+    """Flush analysis_row tuples through the execute_values writer."""
+    with db.analysis_writer(max_rows=10**6, max_interval=None) as writer:
+        for result in history_to_results(analyse_stock_history("S0", data)):
+            writer.add(analysis_row(1, result))
+    return writer.rows_written
+
+
+def write_records(db: StockAnalysisDatabase, data) -> int:
+    """Flush ANALYSIS_DTYPE records through the COPY writer."""
+    analysis, _ = analyse_history_records(1, data)
+    with db.analysis_record_writer(max_rows=10**6, max_interval=None) as writer:
+        writer.add(analysis)
+    return writer.rows_written
+
+
+def check(name: str, write: Callable, data, drops: int) -> List[str]:
+    """Problems seen writing with the INSERT dropped `drops` times."""
+    server = FlakyServer({"S0": 1})
+    pool = server.pool(retries=RETRIES)
+    db = StockAnalysisDatabase(pool=pool)
+    server.drop_on("INSERT INTO stock_analysis", drops)
+    problems = []
+    try:
+        written = write(db, data)
+    except psycopg2.OperationalError:
+        written = None
+    finally:
+        db.close_connection()
+
+    stored = server.tables["stock_analysis"]
+    if len(set(stored)) != len(stored):
+        problems.append(f"{len(stored) - len(set(stored))} duplicate rows")
+    if drops <= RETRIES:
+        if written is None:
+            problems.append("write failed")
+        elif len(stored) != written:
+            problems.append(f"{len(stored)} rows stored, {written} written")
+        if pool.reconnects != drops:
+            problems.append(f"{pool.reconnects} retries, expected {drops}")
+    else:
+        if written is not None:
+            problems.append("write succeeded on a connection that keeps dropping")
+        if stored:
+            problems.append(f"{len(stored)} rows stored by a failed write")
+    print(
+        f"{name:<8} {drops} drop(s): {pool.reconnects} retries, "
+        f"{len(stored)} rows stored  {'; '.join(problems) or 'ok'}"
+    )
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bars", type=int, default=300)
+    args = parser.parse_args()
+    # The retry warnings are expected here
+    logging.basicConfig(level=logging.ERROR)
+
+    data = synthetic_ohlcv(args.bars, start="2023-01-03")
+    failed = False
+    for name, write in (("values", write_rows), ("copy", write_records)):
+        for drops in (1, RETRIES + 1):
+            failed |= bool(check(name, write, data, drops))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
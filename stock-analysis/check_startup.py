@@ -0,0 +1,74 @@
+"""
+Import-time budget for the CLI and the modules its jobs and workers load.
+
+Each module is imported in fresh interpreters; the median import time must
+stay within its budget and the heavy modules it is not supposed to load must
+stay unloaded. Exits with status 1 on a breach, so it can gate a deploy:
+
+    python check_startup.py [--repeat 5] [--scale 1.0]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, Tuple
+
+# Module: (median seconds, modules it must not load)
+BUDGETS: Dict[str, Tuple[float, Tuple[str, ...]]] = {
+    "cli": (
+        0.05,
+        ("numpy", "pandas", "psycopg2", "scipy", "matplotlib", "yfinance"),
+    ),
+    "stock_analysis": (0.6, ("scipy.signal", "matplotlib", "yfinance", "psycopg2")),
+    "db_client": (0.8, ("scipy.signal", "matplotlib", "yfinance")),
+}
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+print(json.dumps([time.perf_counter() - started, sorted(sys.modules)]))
+"""
+
+
+def import_time(module: str) -> Tuple[float, set]:
+    """Seconds to import module in a new interpreter, and the modules loaded."""
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    seconds, modules = json.loads(output)
+    return seconds, set(modules)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="Multiplier for slower machines"
+    )
+    args = parser.parse_args()
+
+    ok = True
+    print(f"{'module':<16}{'median':>10}{'budget':>10}  unwanted imports")
+    for module, (budget, forbidden) in BUDGETS.items():
+        runs = [import_time(module) for _ in range(args.repeat)]
+        median = statistics.median(seconds for seconds, _ in runs)
+        unwanted = sorted(name for name in forbidden if name in runs[-1][1])
+        within = median <= budget * args.scale and not unwanted
+        ok &= within
+        print(
+            f"{module:<16}{median * 1000:>8.0f}ms{budget * args.scale * 1000:>8.0f}ms"
+            f"  {', '.join(unwanted) or '-'}{'' if within else '  FAIL'}"
+        )
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+Command line entry point for the daily, backtest, report, chart and intraday
+jobs.
+
+    python cli.py daily [--date 2024-06-03] [--period 3] [--workers 8]
+    python cli.py backtest --start 2023-01-01 [--days 365] [SYMBOL ...]
+    python cli.py report [--start 2020-01-01] [--horizon 5] ...
+    python cli.py plot SYMBOL [--start 2020-01-01] [--end 2024-12-31]
+    python cli.py charts [--top 200] [--output reports] [--format png|svg] ...
+    python cli.py intraday SYMBOL --file bars.csv [--intervals 5m 15m 1h] ...
+
+Only the standard library is imported up front. Each subcommand imports what
+it uses when it runs, so cron jobs and --help do not pay for matplotlib,
+yfinance or scipy they never touch; check_startup.py holds the import times
+to a budget.
+"""
+
+import argparse
+from typing import List, Optional
+
+
+def _database(minconn: Optional[int] = None, maxconn: Optional[int] = None):
+    from db_client import StockAnalysisDatabase
+
+    return StockAnalysisDatabase(minconn, maxconn)
+
+
+def daily(args: argparse.Namespace):
+    db = _database()
+    try:
+        db.analyse_and_store_stocks(
+            analysis_date=args.date,
+            period=args.period,
+            incremental=args.incremental,
+            panel=args.panel,
+            workers=args.workers,
+            max_in_flight=args.max_in_flight,
+            batch_size=args.batch_size,
+        )
+    finally:
+        db.close_connection()
+
+
+def backtest(args: argparse.Namespace):
+    db = _database()
+    try:
+        symbols = args.symbols or [
+            stock["stock_symbol"] for stock in db.fetch_all_stocks()
+        ]
+        db.backtest_stocks(
+            symbols,
+            args.start,
+            days=args.days,
+            batch_size=args.batch_size,
+            period=args.period,
+            resume=not args.no_resume,
+        )
+    finally:
+        db.close_connection()
+
+
+def report(args: argparse.Namespace):
+    from breakout_analytics import main as breakout_report
+
+    breakout_report(args.extra)
+
+
+def plot(args: argparse.Namespace):
+    db = _database(1, 1)
+    try:
+        data = db.fetch_breakout_data_with_max_prices(args.symbol, args.start, args.end)
+    finally:
+        db.close_connection()
+    db.plot_breakout_and_max_prices(data, args.symbol)
+
+
+def charts(args: argparse.Namespace):
+    from chart_report import main as chart_report
+
+    chart_report(args.extra)
+
+
+def intraday(args: argparse.Namespace):
+    from intraday import main as intraday_screen
+
+    intraday_screen(args.extra)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--log-level", help="Default: LOG_LEVEL or INFO")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("daily", help="Analyse and store all stocks")
+    command.add_argument("--date", help="Analysis date, default today")
+    command.add_argument("--period", type=int, default=3, help="Window in months")
+    mode = command.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Update from saved indicator state instead of full windows",
+    )
+    mode.add_argument(
+        "--panel", action="store_true", help="Analyse all stocks as one panel"
+    )
+    mode.add_argument("--workers", type=int, help="Analysis processes")
+    command.add_argument("--max-in-flight", type=int)
+    command.add_argument("--batch-size", type=int, default=1000)
+    command.set_defaults(run=daily)
+
+    command = commands.add_parser("backtest", help="Backtest stored analysis")
+    command.add_argument("symbols", nargs="*", help="Default: all stocks in the DB")
+    command.add_argument("--start", required=True, help="Backtest start date")
+    command.add_argument("--days", type=int, default=365)
+    command.add_argument("--period", type=int, default=3, help="Window in months")
+    command.add_argument("--batch-size", type=int, default=1000)
+    command.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Recompute days already stored by an earlier run",
+    )
+    command.set_defaults(run=backtest)
+
+    command = commands.add_parser(
+        "report",
+        help="Breakout outcome statistics; see report --help",
+        add_help=False,
+    )
+    command.set_defaults(run=report)
+
+    command = commands.add_parser(
+        "plot", help="Plot the breakouts and max prices of a stock"
+    )
+    command.add_argument("symbol")
+    command.add_argument("--start", default="2020-01-01")
+    command.add_argument("--end")
+    command.set_defaults(run=plot)
+
+    command = commands.add_parser(
+        "charts",
+        help="Render breakout charts of many stocks headless; see charts --help",
+        add_help=False,
+    )
+    command.set_defaults(run=charts)
+
+    command = commands.add_parser(
+        "intraday",
+        help="Screen intraday bars on several timeframes; see intraday --help",
+        add_help=False,
+    )
+    command.set_defaults(run=intraday)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = build_parser()
+    # Arguments after report, charts and intraday are parsed by their modules
+    args, extra = parser.parse_known_args(argv)
+    if extra and args.command not in ("report", "charts", "intraday"):
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    args.extra = extra
+
+    # .env may set STOCK_METRICS, which instrumentation reads on import
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    from instrumentation import configure_logging
+
+    configure_logging(args.log_level)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from time import monotonic, sleep
+from typing import Callable, Dict, Iterator, Optional, TypeVar
+
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2 import extensions
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+from instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+# Errors after which a connection can no longer be trusted
+DISCONNECT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+T = TypeVar("T")
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of Postgres connections with health checks and retries.
+
+    Connections are checked out with connection(), which blocks while all
+    maxconn connections are in use. A connection that has been idle for
+    longer than health_check_interval is pinged before it is handed out and
+    replaced if the server has gone away. run_idempotent() additionally
+    retries an operation on a fresh connection when the connection drops
+    mid-way, which is safe for reads and ON CONFLICT upserts.
+    """
+
+    def __init__(
+        self,
+        minconn: int = 1,
+        maxconn: int = 4,
+        health_check_interval: float = 30.0,
+        retries: int = 3,
+        retry_delay: float = 0.5,
+        checkout_timeout: Optional[float] = None,
+        **connect_kwargs,
+    ):
+        """
+        Parameters:
+        - minconn: Connections opened up front and kept open while idle.
+        - maxconn: Most connections open at the same time.
+        - health_check_interval: Ping connections idle for longer than this
+          many seconds before handing them out.
+        - retries: Extra attempts run_idempotent makes after a dropped
+          connection, waiting retry_delay seconds and doubling each time.
+        - checkout_timeout: Raise PoolError if no connection frees up within
+          this many seconds. None waits forever.
+        - connect_kwargs: Passed on to psycopg2.connect.
+        """
+        self.maxconn = maxconn
+        self.health_check_interval = health_check_interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.checkout_timeout = checkout_timeout
+        self.reconnects = 0
+        self._pool = ThreadedConnectionPool(minconn, maxconn, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used: Dict[int, float] = {}
+
+    @classmethod
+    def from_env(
+        cls, minconn: Optional[int] = None, maxconn: Optional[int] = None, **kwargs
+    ) -> "ConnectionPool":
+        """
+        Pool for the DB_* settings, sized by DB_POOL_MIN / DB_POOL_MAX if not
+        given. Settings missing from the environment are read from .env.
+        """
+        load_dotenv()
+        return cls(
+            minconn if minconn is not None else int(os.getenv("DB_POOL_MIN", "1")),
+            maxconn if maxconn is not None else int(os.getenv("DB_POOL_MAX", "4")),
+            host=os.getenv("DB_HOST"),
+            port=os.getenv("DB_PORT"),
+            database=os.getenv("DB_NAME"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            **kwargs,
+        )
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        # Connections that were never returned to the pool are brand new
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            conn.rollback()
+        except DISCONNECT_ERRORS:
+            return False
+        return True
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+
+    def _checkout(self):
+        # Stale connections are dropped until a live one turns up; once the
+        # idle ones are used up getconn opens a new connection, which either
+        # works or raises.
+        while True:
+            conn = self._pool.getconn()
+            if self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+            self.reconnects += 1
+            metrics.count("db.reconnects")
+
+    def _release(self, conn, broken: bool):
+        if not broken and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except DISCONNECT_ERRORS:
+                broken = True
+        if broken or conn.closed:
+            self._discard(conn)
+            return
+        self._last_used[id(conn)] = monotonic()
+        self._pool.putconn(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[extensions.connection]:
+        """
+        Check out a connection for the duration of the with block.
+
+        An open transaction left by the block is rolled back when the
+        connection is returned, so commit what should be kept.
+        """
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise PoolError(f"No connection available within {self.checkout_timeout}s")
+        try:
+            conn = self._checkout()
+            broken = False
+            try:
+                yield conn
+            except DISCONNECT_ERRORS:
+                broken = True
+                raise
+            finally:
+                self._release(conn, broken)
+        finally:
+            self._slots.release()
+
+    def run_idempotent(self, operation: Callable[[extensions.connection], T]) -> T:
+        """
+        Run operation(conn) on a pooled connection, retrying on a new one if
+        the connection drops. Only pass operations that are safe to repeat,
+        and commit inside them.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                with self.connection() as conn:
+                    return operation(conn)
+            except DISCONNECT_ERRORS as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.retry_delay * 2**attempt
+                logger.warning(
+                    "Database connection lost (%s), retrying in %.1fs", e, delay
+                )
+                self.reconnects += 1
+                metrics.count("db.reconnects")
+                sleep(delay)
+
+    def close(self):
+        """Close every connection in the pool."""
+        self._pool.closeall()
@@ -1,15 +1,196 @@
-import psycopg2
-from typing import Optional, List, Dict, Any
-from datetime import datetime, timedelta
+import json
+import logging
+from psycopg2.extras import execute_values
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Optional, List, Dict, Any, Iterable, Tuple
+from datetime import date, datetime, timedelta
+from time import perf_counter
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from dotenv import load_dotenv
 import os
 
-# Load environment variables from .env
-load_dotenv()
+from stock_analysis import (
+    analyse_history_records,
+    analyse_stock,
+    analysis_window_start,
+    fetch_stock_data,
+    fetch_stock_data_batch,
+    forward_max_prices,
+    history_to_results,
+    MAX_PRICE_HORIZONS,
+)
+from indicator_state import IndicatorState
+from bulk_writer import BulkWriter, RecordWriter
+from connection_pool import ConnectionPool
+from panel import analyse_panel, build_panel
+from trading_calendar import default_calendar
+from instrumentation import metrics, timed
 
-from stock_analysis import analyse_stock, fetch_stock_data
+logger = logging.getLogger(__name__)
+
+# Symbols requested per multi-ticker download
+DOWNLOAD_BATCH_SIZE = 100
+
+INSERT_ANALYSIS_QUERY = """
+    INSERT INTO stock_analysis (
+        stock_id, analysis_date, analysis_period, close_price, breakout_percentage,
+        consecutive_days_above_trendline, trendline_accuracy, rsi_value,
+        macd_value, macd_signal, upper_bollinger_band,
+        middle_bollinger_band, lower_bollinger_band, volume, volume_ratio,
+        nine_ema, twelve_ema, twenty_one_ema, fifty_ema
+    ) VALUES %s
+    ON CONFLICT (stock_id, analysis_date, analysis_period) DO NOTHING;
+"""
+
+MAX_PRICE_FIELDS = tuple(
+    f"max_price_{horizon}_day" + ("s" if horizon > 1 else "")
+    for horizon in MAX_PRICE_HORIZONS
+)
+
+INSERT_MAX_PRICE_QUERY = """
+    INSERT INTO stock_analysis_max_price (
+        stock_id, analysis_date, max_price_1_day, max_price_2_days, max_price_5_days,
+        max_price_10_days, max_price_15_days, max_price_20_days
+    ) VALUES %s
+    ON CONFLICT (stock_id, analysis_date) DO UPDATE SET
+        max_price_1_day = EXCLUDED.max_price_1_day,
+        max_price_2_days = EXCLUDED.max_price_2_days,
+        max_price_5_days = EXCLUDED.max_price_5_days,
+        max_price_10_days = EXCLUDED.max_price_10_days,
+        max_price_15_days = EXCLUDED.max_price_15_days,
+        max_price_20_days = EXCLUDED.max_price_20_days;
+"""
+
+
+# Tables range-partitioned by month of analysis_date (db/migrations/002_partition_analysis_tables.sql)
+PARTITIONED_TABLES = ("stock_analysis", "stock_analysis_max_price")
+
+# Rebuilds the stock_screener rows of a date range; sa.* lines up with the
+# stock_analysis columns the screener table was created LIKE.
+REFRESH_SCREENER_QUERY = """
+    DELETE FROM stock_screener
+    WHERE analysis_date BETWEEN %(start_date)s AND %(end_date)s;
+
+    INSERT INTO stock_screener
+    SELECT
+        sa.*,
+        ROW_NUMBER() OVER (
+            PARTITION BY sa.analysis_date
+            ORDER BY sa.breakout_percentage DESC, sa.stock_id
+        ),
+        s.stock_symbol,
+        s.stock_name,
+        mp.max_price_1_day,
+        mp.max_price_2_days,
+        mp.max_price_5_days,
+        mp.max_price_10_days,
+        mp.max_price_15_days,
+        mp.max_price_20_days
+    FROM stock_analysis sa
+    JOIN stocks s ON sa.stock_id = s.stock_id
+    LEFT JOIN stock_analysis_max_price mp
+        ON sa.stock_id = mp.stock_id
+        AND sa.analysis_date = mp.analysis_date
+    WHERE sa.analysis_date BETWEEN %(start_date)s AND %(end_date)s
+    AND sa.breakout_percentage > 0;
+"""
+
+# Analysis days a backtest does not have to recompute: both rows are stored
+# and the max prices have the full 20-day horizon behind them
+STORED_BACKTEST_DATES_QUERY = """
+    SELECT sa.stock_id, sa.analysis_date
+    FROM stock_analysis sa
+    JOIN stock_analysis_max_price mp
+        ON sa.stock_id = mp.stock_id
+        AND sa.analysis_date = mp.analysis_date
+    WHERE sa.stock_id = ANY(%s)
+    AND sa.analysis_period = %s
+    AND sa.analysis_date BETWEEN %s AND %s
+    AND mp.max_price_20_days IS NOT NULL;
+"""
+
+SAVE_BACKTEST_PROGRESS_QUERY = """
+    INSERT INTO backtest_progress (
+        stock_id, analysis_period, start_date, end_date, status,
+        completed_through, days_written, error
+    ) VALUES %s
+    ON CONFLICT (stock_id, analysis_period, start_date, end_date) DO UPDATE SET
+        status = EXCLUDED.status,
+        completed_through = COALESCE(
+            EXCLUDED.completed_through, backtest_progress.completed_through
+        ),
+        days_written = backtest_progress.days_written + EXCLUDED.days_written,
+        error = EXCLUDED.error,
+        updated_at = NOW();
+"""
+
+UPDATE_SCREENER_MAX_PRICE_QUERY = """
+    UPDATE stock_screener SET
+        max_price_1_day = %s,
+        max_price_2_days = %s,
+        max_price_5_days = %s,
+        max_price_10_days = %s,
+        max_price_15_days = %s,
+        max_price_20_days = %s
+    WHERE stock_id = %s AND analysis_date = %s;
+"""
+
+
+def _timed(func, *args):
+    """Run func(*args) and return its result with the elapsed seconds."""
+    started = perf_counter()
+    result = func(*args)
+    return result, perf_counter() - started
+
+
+def analysis_row(stock_id: int, analysis: Dict[str, Any]) -> tuple:
+    """
+    Convert an analyse_stock result into a stock_analysis row. Missing and
+    NaN values become NULL, as in the COPY input of records_csv.
+    """
+    return (
+        stock_id,
+        analysis["date"],
+        analysis["analysis_period"],
+        _rounded(analysis["close_price"]),
+        _rounded(analysis["breakout_percentage"]),
+        (
+            None
+            if _is_missing(analysis["consecutive_days_above"])
+            else int(analysis["consecutive_days_above"])
+        ),
+        _rounded(analysis["trendline_accuracy"]),
+        _rounded(analysis["rsi"]),
+        _rounded(analysis["macd_value"]),
+        _rounded(analysis["macd_signal"]),
+        _rounded(analysis["bollinger_upper"]),
+        _rounded(analysis["bollinger_middle"]),
+        _rounded(analysis["bollinger_lower"]),
+        int(analysis["volume"]),
+        _rounded(analysis["volume_ratio"]),
+        _rounded(analysis["9EMA"]),
+        _rounded(analysis["12EMA"]),
+        _rounded(analysis["21EMA"]),
+        _rounded(analysis["50EMA"]),
+    )
+
+
+def _is_missing(value) -> bool:
+    return value is None or pd.isna(value)
+
+
+def _rounded(value) -> Optional[float]:
+    return None if _is_missing(value) else float(round(value, 3))
+
+
+def max_price_row(
+    stock_id: int, analysis_date: str, max_prices: Dict[str, Any]
+) -> tuple:
+    """Convert max prices keyed by MAX_PRICE_FIELDS into a stock_analysis_max_price row."""
+    return (stock_id, analysis_date) + tuple(
+        None if _is_missing(max_prices[field]) else float(max_prices[field])
+        for field in MAX_PRICE_FIELDS
+    )
 
 
 class StockAnalysisDatabase:
@@ -17,303 +198,807 @@ class StockAnalysisDatabase:
 
     def __init__(
         self,
+        minconn: Optional[int] = None,
+        maxconn: Optional[int] = None,
+        pool: Optional[ConnectionPool] = None,
     ):
-        """Initialize the database connection."""
-        self.conn = psycopg2.connect(
-            host=os.getenv("DB_HOST"),
-            port=os.getenv("DB_PORT"),
-            database=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
+        """
+        Initialize the database connection pool.
+
+        minconn and maxconn default to DB_POOL_MIN and DB_POOL_MAX (1 and 4).
+        An existing pool can be passed instead.
+        """
+        self.pool = (
+            pool if pool is not None else ConnectionPool.from_env(minconn, maxconn)
         )
+        # Months whose partitions are known to exist
+        self.partition_months = set()
+
+    def _query(self, query: str, params: Optional[tuple] = None) -> List[tuple]:
+        """Run a read query on a pooled connection and return all rows."""
+
+        def read(conn):
+            with conn.cursor() as cursor:
+                cursor.execute(query, params)
+                return cursor.fetchall()
+
+        return self.pool.run_idempotent(read)
+
+    def _upsert(self, query: str, rows: List[tuple]):
+        """Run an INSERT ... ON CONFLICT for rows, retrying if the connection drops."""
+
+        def write(conn):
+            with conn.cursor() as cursor:
+                execute_values(cursor, query, rows)
+            conn.commit()
+
+        self.pool.run_idempotent(write)
 
     def fetch_all_stocks(self) -> List[Dict[str, Any]]:
         """Fetch all stocks from the database."""
         query = "SELECT stock_id, stock_symbol FROM stocks;"
-        with self.conn.cursor() as cursor:
-            cursor.execute(query)
-            stocks = cursor.fetchall()
+        stocks = self._query(query)
         return [{"stock_id": row[0], "stock_symbol": row[1]} for row in stocks[:]]
 
+    @timed("db.insert_analysis")
     def insert_analysis(self, stock_id: int, analysis: Dict[str, Any]):
         """Insert stock analysis result into the database with proper type conversion."""
+        self.ensure_partitions([analysis["date"]])
+        self._upsert(INSERT_ANALYSIS_QUERY, [analysis_row(stock_id, analysis)])
+
+    def ensure_partitions(self, analysis_dates: Iterable):
+        """Create the monthly partitions of PARTITIONED_TABLES holding analysis_dates."""
+        months = {str(date)[:7] for date in analysis_dates} - self.partition_months
+        if not months:
+            return
+
+        def create(conn):
+            with conn.cursor() as cursor:
+                for table in PARTITIONED_TABLES:
+                    for month in sorted(months):
+                        cursor.execute(
+                            "SELECT create_monthly_partitions(%s, %s, %s);",
+                            (table, f"{month}-01", f"{month}-01"),
+                        )
+            conn.commit()
+
+        with metrics.timer("db.ensure_partitions"):
+            self.pool.run_idempotent(create)
+        self.partition_months |= months
+
+    def _prepare_rows(self, rows: List[tuple]):
+        # analysis_row and max_price_row both put analysis_date second
+        self.ensure_partitions(row[1] for row in rows)
+
+    def drop_analysis_before(self, before_date: str) -> List[str]:
+        """
+        Drop whole months of analysis and max price rows ending on or before
+        before_date, with their screener rows. Returns the dropped partitions.
+        """
+
+        def drop(conn):
+            with conn.cursor() as cursor:
+                dropped = []
+                for table in PARTITIONED_TABLES:
+                    cursor.execute(
+                        "SELECT drop_monthly_partitions(%s, %s);", (table, before_date)
+                    )
+                    dropped += [row[0] for row in cursor.fetchall()]
+                cursor.execute(
+                    "DELETE FROM stock_screener WHERE analysis_date < "
+                    "date_trunc('month', %s::date);",
+                    (before_date,),
+                )
+            conn.commit()
+            return dropped
+
+        dropped = self.pool.run_idempotent(drop)
+        self.partition_months = {
+            month for month in self.partition_months if f"{month}-01" >= before_date
+        }
+        return dropped
+
+    def analysis_writer(
+        self, max_rows: int = 1000, max_interval: Optional[float] = 5.0
+    ) -> BulkWriter:
+        """Buffered writer for stock_analysis rows built with analysis_row."""
+        return BulkWriter(
+            self.pool,
+            INSERT_ANALYSIS_QUERY,
+            0,
+            max_rows,
+            max_interval,
+            prepare=self._prepare_rows,
+        )
+
+    def max_price_writer(
+        self, max_rows: int = 1000, max_interval: Optional[float] = 5.0
+    ) -> BulkWriter:
+        """Buffered writer for stock_analysis_max_price rows built with max_price_row."""
+        return BulkWriter(
+            self.pool,
+            INSERT_MAX_PRICE_QUERY,
+            2,
+            max_rows,
+            max_interval,
+            prepare=self._prepare_rows,
+        )
+
+    def _prepare_records(self, records):
+        self.ensure_partitions(np.unique(records["analysis_date"]).astype(str))
+
+    def analysis_record_writer(
+        self, max_rows: int = 1000, max_interval: Optional[float] = 5.0
+    ) -> RecordWriter:
+        """Buffered COPY writer for ANALYSIS_DTYPE records."""
+        return RecordWriter(
+            self.pool,
+            "stock_analysis",
+            INSERT_ANALYSIS_QUERY,
+            0,
+            max_rows,
+            max_interval,
+            prepare=self._prepare_records,
+            decimals=3,
+        )
+
+    def max_price_record_writer(
+        self, max_rows: int = 1000, max_interval: Optional[float] = 5.0
+    ) -> RecordWriter:
+        """Buffered COPY writer for MAX_PRICE_DTYPE records."""
+        return RecordWriter(
+            self.pool,
+            "stock_analysis_max_price",
+            INSERT_MAX_PRICE_QUERY,
+            2,
+            max_rows,
+            max_interval,
+            prepare=self._prepare_records,
+        )
+
+    @timed("db.refresh_screener")
+    def refresh_screener(self, start_date: str, end_date: Optional[str] = None):
+        """
+        Rebuild the stock_screener rows for analysis dates from start_date to
+        end_date (inclusive, default start_date) in one transaction.
+        """
+        params = {"start_date": start_date, "end_date": end_date or start_date}
+
+        def refresh(conn):
+            with conn.cursor() as cursor:
+                cursor.execute(REFRESH_SCREENER_QUERY, params)
+            conn.commit()
+
+        self.pool.run_idempotent(refresh)
+
+    def fetch_indicator_state(
+        self, stock_id: int, period: int = 3
+    ) -> Optional[IndicatorState]:
+        """Fetch the saved indicator state for a stock, if there is one."""
         query = """
-            INSERT INTO stock_analysis (
-                stock_id, analysis_date, analysis_period, close_price, breakout_percentage, 
-                consecutive_days_above_trendline, trendline_accuracy, rsi_value, 
-                macd_value, macd_signal, upper_bollinger_band, 
-                middle_bollinger_band, lower_bollinger_band, volume, volume_ratio,
-                nine_ema, twelve_ema, twenty_one_ema, fifty_ema
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-            ) ON CONFLICT (stock_id, analysis_date, analysis_period) DO NOTHING;
+            SELECT state FROM stock_indicator_state
+            WHERE stock_id = %s AND analysis_period = %s;
         """
-        with self.conn.cursor() as cursor:
-            data = (
-                stock_id,
-                analysis["date"],
-                analysis["analysis_period"],
-                float(round(analysis["close_price"], 3)),
-                (
-                    float(round(analysis["breakout_percentage"], 3))
-                    if analysis["breakout_percentage"] is not None
-                    else None
-                ),
-                (
-                    int(analysis["consecutive_days_above"])
-                    if analysis["consecutive_days_above"] is not None
-                    else None
-                ),
-                (
-                    float(round(analysis["trendline_accuracy"], 3))
-                    if analysis["trendline_accuracy"] is not None
-                    else None
-                ),
-                float(round(analysis["rsi"], 3)),
-                float(round(analysis["macd_value"], 3)),
-                float(round(analysis["macd_signal"], 3)),
-                float(round(analysis["bollinger_upper"], 3)),
-                float(round(analysis["bollinger_middle"], 3)),
-                float(round(analysis["bollinger_lower"], 3)),
-                int(analysis["volume"]),
-                float(round(analysis["volume_ratio"], 3)),
-                float(round(analysis["9EMA"], 3)),
-                float(round(analysis["12EMA"], 3)),
-                float(round(analysis["21EMA"], 3)),
-                float(round(analysis["50EMA"], 3)),
+        result = self._query(query, (stock_id, period * 30))
+        return IndicatorState.from_dict(result[0][0]) if result else None
+
+    def save_indicator_state(self, stock_id: int, state: IndicatorState):
+        """Insert or replace the saved indicator state for a stock."""
+        query = """
+            INSERT INTO stock_indicator_state (stock_id, analysis_period, as_of_date, state)
+            VALUES (%s, %s, %s, %s::jsonb)
+            ON CONFLICT (stock_id, analysis_period) DO UPDATE SET
+                as_of_date = EXCLUDED.as_of_date,
+                state = EXCLUDED.state,
+                updated_at = NOW();
+        """
+        params = (
+            stock_id,
+            state.window_days,
+            state.last_date,
+            json.dumps(state.to_dict()),
+        )
+
+        def write(conn):
+            with conn.cursor() as cursor:
+                cursor.execute(query, params)
+            conn.commit()
+
+        self.pool.run_idempotent(write)
+
+    def analyse_stock_incremental(
+        self, stock: Dict[str, Any], analysis_date: str, period: int = 3
+    ) -> Dict[str, Any]:
+        """
+        Analyse a stock by folding only the bars since its saved indicator state.
+
+        The first run for a stock downloads the full analysis window and saves
+        the resulting state; later runs download just the missing days. A date
+        the saved state has already moved past is analysed from a full window
+        and leaves the state as it is.
+        """
+        state = self.fetch_indicator_state(stock["stock_id"], period)
+        if state is not None and state.last_date >= date.fromisoformat(analysis_date):
+            return analyse_stock(stock["stock_symbol"], analysis_date, period)
+        if state is None:
+            data = fetch_stock_data(
+                stock["stock_symbol"],
+                analysis_window_start(analysis_date, period),
+                analysis_date,
             )
+            state = IndicatorState.from_history(data, period)
+        else:
+            next_date = (state.last_date + timedelta(days=1)).strftime("%Y-%m-%d")
+            # Only download if a session fell in between
+            if default_calendar().count(next_date, analysis_date) > 0:
+                try:
+                    data = fetch_stock_data(
+                        stock["stock_symbol"], next_date, analysis_date
+                    )
+                except ValueError:
+                    data = None  # No new bars since the last run
+                if data is not None:
+                    days = data.index.date
+                    new_bars = data[
+                        (days > state.last_date)
+                        & (days < date.fromisoformat(analysis_date))
+                    ]
+                    for bar_date, bar in new_bars.iterrows():
+                        state.update(bar_date, bar["Close"], bar["High"], bar["Volume"])
 
-            cursor.execute(query, data)
-            self.conn.commit()
+        self.save_indicator_state(stock["stock_id"], state)
+        return state.result(stock["stock_symbol"], analysis_date)
 
     def analyse_and_store_stocks(
-        self, analysis_date: Optional[str] = None, period: int = 3
+        self,
+        analysis_date: Optional[str] = None,
+        period: int = 3,
+        incremental: bool = False,
+        panel: bool = False,
+        workers: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+        batch_size: int = 1000,
+        flush_interval: Optional[float] = 5.0,
     ):
-        """Run analysis on all stocks and store results in the database."""
+        """
+        Run analysis on all stocks and store results in the database.
+
+        Results are written in batches of up to batch_size rows, at least
+        every flush_interval seconds.
+
+        With incremental=True each stock is analysed from its saved indicator
+        state plus the bars since, instead of re-downloading the whole window.
+
+        With panel=True all stocks are downloaded first and analysed together
+        as one (dates x symbols) panel by analyse_panel.
+
+        With workers set, the analysis runs in a process pool of that size
+        while this thread downloads the next multi-ticker batch, one
+        download at a time, and writes the results.
+        At most max_in_flight stocks (default 2 * workers) are downloaded or
+        analysed at any time.
+        """
+        if incremental and workers:
+            raise ValueError("Incremental analysis cannot be run with workers.")
+        if panel and (incremental or workers):
+            raise ValueError(
+                "Panel analysis cannot be run incrementally or with workers."
+            )
+
         if analysis_date is None:
             analysis_date = datetime.today().strftime("%Y-%m-%d")
-        analysis_date_dt = datetime.strptime(analysis_date, "%Y-%m-%d")
 
-        # Check if the analysis date is a weekend (Saturday or Sunday)
-        if analysis_date_dt.weekday() >= 5:  # 5: Saturday, 6: Sunday
-            print(
-                f"Your chosen date ({analysis_date}) falls on a weekend. No analysis will be performed."
+        if not default_calendar().is_session(analysis_date):
+            logger.warning(
+                "Your chosen date (%s) is not a trading session (weekend or "
+                "market holiday). No analysis will be performed.",
+                analysis_date,
             )
             return
 
+        with metrics.run("daily"):
+            self._analyse_and_store_stocks(
+                analysis_date,
+                period,
+                incremental,
+                panel,
+                workers,
+                max_in_flight,
+                batch_size,
+                flush_interval,
+            )
+
+    def _analyse_and_store_stocks(
+        self,
+        analysis_date: str,
+        period: int,
+        incremental: bool,
+        panel: bool,
+        workers: Optional[int],
+        max_in_flight: Optional[int],
+        batch_size: int,
+        flush_interval: Optional[float],
+    ):
         stocks = self.fetch_all_stocks()
-        successful = 0
-        for stock in stocks:
-            try:
-                print(f"Analyzing {stock['stock_symbol']}...")
-                result = analyse_stock(stock["stock_symbol"], analysis_date, period)
-                self.insert_analysis(stock["stock_id"], result)
-                print(
-                    f"Inserted analysis for {stock['stock_symbol']} on {analysis_date}."
+        with self.analysis_writer(batch_size, flush_interval) as writer:
+            if panel:
+                successful = self._analyse_and_store_panel(
+                    stocks, analysis_date, period, writer
+                )
+            elif workers:
+                successful = self._analyse_and_store_concurrently(
+                    stocks,
+                    analysis_date,
+                    period,
+                    writer,
+                    workers,
+                    max_in_flight or 2 * workers,
+                )
+            else:
+                successful = self._analyse_and_store_serially(
+                    stocks, analysis_date, period, writer, incremental
                 )
-                successful += 1
-            except Exception as e:
-                print(f"Error analyzing {stock['stock_symbol']}: {e}")
+        logger.info(
+            "Wrote %d analysis rows at %.0f rows/s",
+            writer.rows_written,
+            writer.rows_per_second,
+        )
+        if writer.rows_written:
+            self.refresh_screener(analysis_date)
         total = len(stocks)
-        print(
-            f"{successful} out of {total} successfully analysed ({successful / total * 100:.2f}%)"
+        metrics.count("analysis.stored", successful)
+        metrics.count("analysis.failed", total - successful)
+        logger.info(
+            "%d out of %d successfully analysed (%.2f%%)",
+            successful,
+            total,
+            successful / total * 100 if total else 0,
         )
 
+    def _analyse_and_store_serially(
+        self,
+        stocks: List[Dict[str, Any]],
+        analysis_date: str,
+        period: int,
+        writer: BulkWriter,
+        incremental: bool,
+    ) -> int:
+        """
+        Analyse and store stocks one at a time, downloading their price data
+        in multi-ticker batches. Returns the number stored successfully.
+        """
+        start_date = analysis_window_start(analysis_date, period)
+        successful = 0
+        for chunk_start in range(0, len(stocks), DOWNLOAD_BATCH_SIZE):
+            chunk = stocks[chunk_start : chunk_start + DOWNLOAD_BATCH_SIZE]
+            frames = {}
+            if not incremental:
+                try:
+                    frames, _ = fetch_stock_data_batch(
+                        [stock["stock_symbol"] for stock in chunk],
+                        start_date,
+                        analysis_date,
+                        chunk_size=DOWNLOAD_BATCH_SIZE,
+                    )
+                except Exception as e:
+                    logger.error("Error fetching data for %d stocks: %s", len(chunk), e)
+
+            for stock in chunk:
+                try:
+                    logger.debug("Analyzing %s...", stock["stock_symbol"])
+                    if incremental:
+                        result = self.analyse_stock_incremental(
+                            stock, analysis_date, period
+                        )
+                    elif stock["stock_symbol"] in frames:
+                        result = analyse_stock(
+                            stock["stock_symbol"],
+                            analysis_date,
+                            period,
+                            data=frames[stock["stock_symbol"]],
+                        )
+                    else:
+                        raise ValueError(
+                            f"No data found for {stock['stock_symbol']}. Check the symbol or dates."
+                        )
+                    writer.add(analysis_row(stock["stock_id"], result))
+                    logger.info(
+                        "Analysed %s on %s.", stock["stock_symbol"], analysis_date
+                    )
+                    successful += 1
+                except Exception as e:
+                    logger.error("Error analyzing %s: %s", stock["stock_symbol"], e)
+        return successful
+
+    def _analyse_and_store_panel(
+        self,
+        stocks: List[Dict[str, Any]],
+        analysis_date: str,
+        period: int,
+        writer: BulkWriter,
+    ) -> int:
+        """
+        Download all stocks, analyse them as one price panel and store the
+        results. Returns the number stored successfully.
+        """
+        start_date = analysis_window_start(analysis_date, period)
+        stock_ids = {stock["stock_symbol"]: stock["stock_id"] for stock in stocks}
+        try:
+            frames, missing = fetch_stock_data_batch(
+                list(stock_ids), start_date, analysis_date, DOWNLOAD_BATCH_SIZE
+            )
+        except Exception as e:
+            logger.error("Error fetching data for %d stocks: %s", len(stocks), e)
+            return 0
+        for symbol in missing:
+            logger.error(
+                "Error analyzing %s: No data found for %s. Check the symbol or dates.",
+                symbol,
+                symbol,
+            )
+        if not frames:
+            return 0
+
+        results = analyse_panel(*build_panel(frames), analysis_date, period)
+        for symbol in frames.keys() - set(results.index):
+            logger.error("Error analyzing %s: No peaks found in the data.", symbol)
+        for result in history_to_results(results):
+            writer.add(analysis_row(stock_ids[result["stock_symbol"]], result))
+        logger.info(
+            "Analysed %d stocks on %s as one panel.", len(results), analysis_date
+        )
+        return len(results)
+
+    def _analyse_and_store_concurrently(
+        self,
+        stocks: List[Dict[str, Any]],
+        analysis_date: str,
+        period: int,
+        writer: BulkWriter,
+        workers: int,
+        max_in_flight: int,
+    ) -> int:
+        """
+        Pipeline downloads, analysis and inserts.
+
+        Stocks are downloaded from this thread in multi-ticker batches, one
+        batch after another, as yf.download cannot run on several threads at
+        once; yfinance fetches the symbols of a batch in parallel itself.
+        While the next batch downloads, the earlier ones are analysed in a
+        process pool, and finished results are written between downloads.
+
+        Returns the number of stocks analysed and stored successfully, and
+        logs the time spent in each stage.
+        """
+        start_date = analysis_window_start(analysis_date, period)
+        stage_seconds = {"download": 0.0, "analysis": 0.0, "write": 0.0}
+        successful = 0
+        batch_size = max(1, min(DOWNLOAD_BATCH_SIZE, max_in_flight // 2))
+        # Analyses in progress, with the stock each is for
+        in_flight: Dict[Any, Dict[str, Any]] = {}
+        started = perf_counter()
+
+        with ProcessPoolExecutor(max_workers=workers) as analysis_pool:
+
+            def store_finished(block: bool):
+                """Write the finished analyses, waiting for one if block is set."""
+                nonlocal successful
+                done, _ = wait(
+                    in_flight,
+                    timeout=None if block else 0,
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    stock = in_flight.pop(future)
+                    try:
+                        value, elapsed = future.result()
+                        stage_seconds["analysis"] += elapsed
+                        # Timers inside the worker processes are not
+                        # collected, so time the call from here
+                        metrics.observe("analysis.stock", elapsed)
+                        _, elapsed = _timed(
+                            writer.add, analysis_row(stock["stock_id"], value)
+                        )
+                        stage_seconds["write"] += elapsed
+                        logger.info(
+                            "Analysed %s on %s.", stock["stock_symbol"], analysis_date
+                        )
+                        successful += 1
+                    except Exception as e:
+                        logger.error("Error analyzing %s: %s", stock["stock_symbol"], e)
+
+            for batch_start in range(0, len(stocks), batch_size):
+                batch = stocks[batch_start : batch_start + batch_size]
+                while in_flight and len(in_flight) + len(batch) > max_in_flight:
+                    store_finished(block=True)
+                try:
+                    (frames, _), elapsed = _timed(
+                        fetch_stock_data_batch,
+                        [stock["stock_symbol"] for stock in batch],
+                        start_date,
+                        analysis_date,
+                        len(batch),
+                    )
+                    stage_seconds["download"] += elapsed
+                except Exception as e:
+                    logger.error("Error fetching data for %d stocks: %s", len(batch), e)
+                    frames = {}
+                for stock in batch:
+                    data = frames.get(stock["stock_symbol"])
+                    if data is None:
+                        logger.error(
+                            "Error analyzing %s: No data found for %s. "
+                            "Check the symbol or dates.",
+                            stock["stock_symbol"],
+                            stock["stock_symbol"],
+                        )
+                        continue
+                    analysis = analysis_pool.submit(
+                        _timed,
+                        analyse_stock,
+                        stock["stock_symbol"],
+                        analysis_date,
+                        period,
+                        data,
+                    )
+                    in_flight[analysis] = stock
+                store_finished(block=False)
+            while in_flight:
+                store_finished(block=True)
+
+        logger.info(
+            "Wall time %.2fs; %s (summed across workers)",
+            perf_counter() - started,
+            ", ".join(
+                f"{stage} {seconds:.2f}s" for stage, seconds in stage_seconds.items()
+            ),
+        )
+        return successful
+
     def backtest_stocks(
         self,
         stock_symbols: List[str],
         start_date: str,
         days: int = 365,
-        analysis_window: int = 90,
+        batch_size: int = 1000,
+        flush_interval: Optional[float] = 5.0,
+        period: int = 3,
+        resume: bool = True,
     ):
         """
         Backtest the analysis by simulating daily analysis for a 180-day period within a 1-year historical range.
 
+        Progress is checkpointed per symbol in backtest_progress. With
+        resume=True, symbols already done for the same period and date range
+        are skipped, and for the rest only the days without stored analysis
+        and max price rows are computed, so a rerun after a crash picks up
+        where the last one stopped.
+
         Parameters:
         - stock_symbols: List of stock symbols to backtest.
         - start_date: Start date for the backtesting period in "YYYY-MM-DD" format.
         - days: Total number of days for backtesting, default is 365 (1 year).
-        - analysis_window: Number of days for each analysis window, default is 90 days.
+        - batch_size, flush_interval: Flush limits for the buffered result writers.
+        - period: Months in each analysis window, stored as analysis_period
+          (period * 30 days); the windows are the same as analyse_stock's.
+        - resume: Skip work already stored; False recomputes every day.
         """
+        with metrics.run("backtest"):
+            self._backtest_stocks(
+                stock_symbols,
+                start_date,
+                days,
+                batch_size,
+                flush_interval,
+                period,
+                resume,
+            )
+
+    def _backtest_stocks(
+        self,
+        stock_symbols: List[str],
+        start_date: str,
+        days: int,
+        batch_size: int,
+        flush_interval: Optional[float],
+        period: int,
+        resume: bool,
+    ):
         start_date_dt = datetime.strptime(start_date, "%Y-%m-%d")
         end_date_dt = start_date_dt + timedelta(days=days)
+        end_date = end_date_dt.strftime("%Y-%m-%d")
+        analysis_period = period * 30
 
+        stock_ids = self.fetch_stock_ids(stock_symbols)
         for symbol in stock_symbols:
-            print(
-                f"Backtesting for {symbol} from {start_date} to {end_date_dt.strftime('%Y-%m-%d')}"
-            )
-            try:
-                data = fetch_stock_data(
-                    symbol, start_date, end_date_dt.strftime("%Y-%m-%d")
+            if symbol not in stock_ids:
+                logger.warning("Stock ID for %s not found, skipping.", symbol)
+        pending = [symbol for symbol in stock_symbols if symbol in stock_ids]
+        stored_dates: Dict[int, set] = {}
+        if resume:
+            done = self.completed_backtests(analysis_period, start_date, end_date)
+            if done:
+                logger.info(
+                    "Skipping %d symbols already backtested from %s to %s",
+                    sum(stock_ids[symbol] in done for symbol in pending),
+                    start_date,
+                    end_date,
                 )
-                if data.empty:
-                    print(f"No data for {symbol}, skipping.")
-                    continue
+            pending = [symbol for symbol in pending if stock_ids[symbol] not in done]
+            stored_dates = self.stored_backtest_dates(
+                [stock_ids[symbol] for symbol in pending],
+                analysis_period,
+                start_date,
+                end_date,
+            )
+            metrics.count("backtest.skipped_days", sum(map(len, stored_dates.values())))
+        if not pending:
+            return
 
-                stock_id = self.get_stock_id(symbol)
+        try:
+            frames, _ = fetch_stock_data_batch(pending, start_date, end_date)
+        except Exception as e:
+            logger.error("Error fetching data for backtest: %s", e)
+            return
 
-                # Run analysis every day within the backtesting range, focusing on the last 180 days each time
-                for current_date in (
-                    start_date_dt + timedelta(days=i)
-                    for i in range(days - analysis_window + 1)
-                ):
-                    analysis_end_date = current_date + timedelta(days=analysis_window)
+        # backtest_progress rows of symbols whose result rows may still be buffered
+        progress: List[tuple] = []
 
-                    # Skip weekends directly using weekday check (5 = Saturday, 6 = Sunday)
-                    if analysis_end_date.weekday() >= 5:
-                        continue
+        def checkpoint():
+            analysis_writer.flush()
+            max_price_writer.flush()
+            if progress:
+                self.save_backtest_progress(progress)
+                progress.clear()
 
-                    # Check if analysis_end_date is in data to avoid KeyError
-                    if analysis_end_date not in data.index:
-                        print(
-                            f"Skipping {analysis_end_date} for {symbol} as it's missing in data."
-                        )
-                        continue
+        with self.analysis_record_writer(
+            batch_size, flush_interval
+        ) as analysis_writer, self.max_price_record_writer(
+            batch_size, flush_interval
+        ) as max_price_writer:
+            flushes = 0
+            for symbol in pending:
+                logger.debug(
+                    "Backtesting for %s from %s to %s", symbol, start_date, end_date
+                )
+                stock_id = stock_ids[symbol]
+                status, completed_through, days_written, error = "done", None, 0, None
+                try:
+                    data = frames.get(symbol)
+                    if data is None:
+                        raise ValueError(f"No data for {symbol}")
 
-                    window_data = data.loc[
-                        current_date.strftime("%Y-%m-%d") : analysis_end_date.strftime(
-                            "%Y-%m-%d"
-                        )
-                    ]
+                    # Analyse every trading day in one pass, each day looking back over period months
+                    analysis, max_prices = analyse_history_records(
+                        stock_id,
+                        data,
+                        start_date=start_date,
+                        period=period,
+                        skip_dates=stored_dates.get(stock_id),
+                    )
+                    analysis_writer.add(analysis)
+                    max_price_writer.add(max_prices)
+                    if len(analysis):
+                        completed_through = str(analysis["analysis_date"][-1])
+                    days_written = len(analysis)
+                    logger.info("Backtested %s over %d days.", symbol, len(analysis))
+                except Exception as e:
+                    status, error = "failed", str(e)
+                    logger.error("Error backtesting %s: %s", symbol, e)
+                progress.append(
+                    (
+                        stock_id,
+                        analysis_period,
+                        start_date,
+                        end_date,
+                        status,
+                        completed_through,
+                        days_written,
+                        error,
+                    )
+                )
 
-                    try:
-                        result = analyse_stock(
-                            symbol,
-                            analysis_end_date.strftime("%Y-%m-%d"),
-                            data=window_data,
-                        )
-                        # Assuming the stock ID is retrieved or matched based on the stock symbol
-                        if stock_id:
-                            self.insert_analysis(stock_id, result)
-                            print(
-                                f"Inserted backtest analysis for {symbol} on {analysis_end_date.strftime('%Y-%m-%d')}"
-                            )
-                            self.insert_max_price_analysis(
-                                stock_id,
-                                analysis_end_date.strftime("%Y-%m-%d"),
-                                data,
-                            )
-                            print(
-                                f"Inserted max price analysis for {symbol} on {analysis_end_date.strftime('%Y-%m-%d')}."
-                            )
-                        else:
-                            print(f"Stock ID for {symbol} not found, skipping.")
-                    except Exception as e:
-                        print(
-                            f"Error during backtest analysis for {symbol} on {analysis_end_date}: {e}"
-                        )
-            except Exception as e:
-                print(f"Error fetching data for {symbol}: {e}")
+                # Once a writer has flushed part of the buffered rows, flush the
+                # rest too, so progress is only saved for symbols whose rows are
+                # all committed
+                if analysis_writer.flushes + max_price_writer.flushes != flushes:
+                    checkpoint()
+                    flushes = analysis_writer.flushes + max_price_writer.flushes
+            checkpoint()
+
+        for name, writer in (
+            ("analysis", analysis_writer),
+            ("max price", max_price_writer),
+        ):
+            logger.info(
+                "Wrote %d %s rows at %.0f rows/s",
+                writer.rows_written,
+                name,
+                writer.rows_per_second,
+            )
+        if analysis_writer.rows_written or max_price_writer.rows_written:
+            self.refresh_screener(start_date, end_date_dt.strftime("%Y-%m-%d"))
 
     def insert_max_price_analysis(self, stock_id: int, analysis_date: str, data):
         """
-        Calculate and insert max prices for 1, 2, 7, 14, 21, and 30 days following the analysis date.
+        Calculate and insert max prices for 1, 2, 5, 10, 15 and 20 trading days from the analysis date.
 
         Parameters:
         - stock_id: ID of the stock being analyzed.
         - analysis_date: Date of the analysis.
         - data: DataFrame with historical stock data that includes the dates following the analysis date.
         """
-        analysis_date_dt = datetime.strptime(analysis_date, "%Y-%m-%d")
+        max_prices = self.calculate_max_prices(analysis_date, data)
+        row = max_price_row(stock_id, analysis_date, max_prices)
+        self.ensure_partitions([analysis_date])
 
-        # Find the index for the analysis date
+        def write(conn):
+            with conn.cursor() as cursor:
+                execute_values(cursor, INSERT_MAX_PRICE_QUERY, [row])
+                # Keep a screener row for the same day in step
+                cursor.execute(UPDATE_SCREENER_MAX_PRICE_QUERY, row[2:] + row[:2])
+            conn.commit()
+
+        self.pool.run_idempotent(write)
+
+    @staticmethod
+    def calculate_max_prices(analysis_date: str, data) -> Dict[str, Any]:
+        """Max High over the 1, 2, 5, 10, 15 and 20 trading days from analysis_date."""
+        analysis_date_dt = datetime.strptime(analysis_date, "%Y-%m-%d")
         analysis_index = data.index.get_loc(analysis_date_dt)
+        window = data.iloc[analysis_index : analysis_index + MAX_PRICE_HORIZONS[-1]]
+        return forward_max_prices(window).iloc[0].to_dict()
 
-        # Define maximum price fields for different time windows
-        max_prices = {
-            "max_price_1_day": (
-                data["High"].iloc[analysis_index : analysis_index + 1].max()
-                if analysis_index < len(data)
-                else None
-            ),
-            "max_price_2_days": (
-                data["High"].iloc[analysis_index : analysis_index + 2].max()
-                if analysis_index + 1 < len(data)
-                else None
-            ),
-            "max_price_5_days": (
-                data["High"].iloc[analysis_index : analysis_index + 5].max()
-                if analysis_index + 4 < len(data)
-                else None
-            ),
-            "max_price_10_days": (
-                data["High"].iloc[analysis_index : analysis_index + 10].max()
-                if analysis_index + 9 < len(data)
-                else None
-            ),
-            "max_price_15_days": (
-                data["High"].iloc[analysis_index : analysis_index + 15].max()
-                if analysis_index + 14 < len(data)
-                else None
-            ),
-            "max_price_20_days": (
-                data["High"].iloc[analysis_index : analysis_index + 20].max()
-                if analysis_index + 19 < len(data)
-                else None
-            ),
-        }
+    def fetch_stock_ids(self, stock_symbols: List[str]) -> Dict[str, int]:
+        """Map each of stock_symbols that is in the stocks table to its stock ID."""
+        query = (
+            "SELECT stock_symbol, stock_id FROM stocks WHERE stock_symbol = ANY(%s);"
+        )
+        return dict(self._query(query, (list(stock_symbols),)))
 
-        # Insert max prices into the stock_analysis_max_price table
+    def completed_backtests(
+        self, analysis_period: int, start_date: str, end_date: str
+    ) -> set:
+        """Stock IDs whose backtest over the date range finished without errors."""
         query = """
-            INSERT INTO stock_analysis_max_price (
-                stock_id, analysis_date, max_price_1_day, max_price_2_days, max_price_5_days, 
-                max_price_10_days, max_price_15_days, max_price_20_days
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (stock_id, analysis_date) DO UPDATE SET
-                max_price_1_day = EXCLUDED.max_price_1_day,
-                max_price_2_days = EXCLUDED.max_price_2_days,
-                max_price_5_days = EXCLUDED.max_price_5_days,
-                max_price_10_days = EXCLUDED.max_price_10_days,
-                max_price_15_days = EXCLUDED.max_price_15_days,
-                max_price_20_days = EXCLUDED.max_price_20_days;
+            SELECT stock_id FROM backtest_progress
+            WHERE analysis_period = %s AND start_date = %s AND end_date = %s
+            AND status = 'done';
         """
-        with self.conn.cursor() as cursor:
-            cursor.execute(
-                query,
-                (
-                    stock_id,
-                    analysis_date,
-                    (
-                        float(max_prices["max_price_1_day"])
-                        if max_prices["max_price_1_day"]
-                        else None
-                    ),
-                    (
-                        float(max_prices["max_price_2_days"])
-                        if max_prices["max_price_2_days"]
-                        else None
-                    ),
-                    (
-                        float(max_prices["max_price_5_days"])
-                        if max_prices["max_price_5_days"]
-                        else None
-                    ),
-                    (
-                        float(max_prices["max_price_10_days"])
-                        if max_prices["max_price_10_days"]
-                        else None
-                    ),
-                    (
-                        float(max_prices["max_price_15_days"])
-                        if max_prices["max_price_15_days"]
-                        else None
-                    ),
-                    (
-                        float(max_prices["max_price_20_days"])
-                        if max_prices["max_price_20_days"]
-                        else None
-                    ),
-                ),
-            )
-            self.conn.commit()
+        rows = self._query(query, (analysis_period, start_date, end_date))
+        return {row[0] for row in rows}
+
+    def stored_backtest_dates(
+        self,
+        stock_ids: List[int],
+        analysis_period: int,
+        start_date: str,
+        end_date: str,
+    ) -> Dict[int, set]:
+        """Analysis dates per stock ID that a backtest over the range can skip."""
+        if not stock_ids:
+            return {}
+        rows = self._query(
+            STORED_BACKTEST_DATES_QUERY,
+            (list(stock_ids), analysis_period, start_date, end_date),
+        )
+        stored: Dict[int, set] = {}
+        for stock_id, analysis_date in rows:
+            stored.setdefault(stock_id, set()).add(analysis_date)
+        return stored
+
+    def save_backtest_progress(self, rows: List[tuple]):
+        """
+        Record per-symbol backtest progress. Rows are (stock_id, analysis_period,
+        start_date, end_date, status, completed_through, days_written, error).
+        """
+        self._upsert(SAVE_BACKTEST_PROGRESS_QUERY, rows)
 
     def get_stock_id(self, stock_symbol: str) -> Optional[int]:
         """Fetch the stock ID from the database based on the stock symbol."""
         query = "SELECT stock_id FROM stocks WHERE stock_symbol = %s;"
-        with self.conn.cursor() as cursor:
-            cursor.execute(query, (stock_symbol,))
-            result = cursor.fetchone()
-        return result[0] if result else None
+        result = self._query(query, (stock_symbol,))
+        return result[0][0] if result else None
 
     def fetch_breakout_data_with_max_prices(
         self, stock_symbol: str, start_date: str = "2020-01-01", end_date: str = None
@@ -336,7 +1021,7 @@ class StockAnalysisDatabase:
         # Fetch stock ID based on the stock symbol
         stock_id = self.get_stock_id(stock_symbol)
         if not stock_id:
-            print(f"Stock ID for symbol '{stock_symbol}' not found.")
+            logger.warning("Stock ID for symbol '%s' not found.", stock_symbol)
             return None
 
         query = """
@@ -351,26 +1036,32 @@ class StockAnalysisDatabase:
             AND sa.breakout_percentage > 0
             AND sa.consecutive_days_above_trendline = 1;
         """
-        with self.conn.cursor() as cursor:
-            cursor.execute(query, (stock_id, start_date, end_date))
-            data = cursor.fetchall()
-            columns = [desc[0] for desc in cursor.description]
+
+        def read(conn):
+            with conn.cursor() as cursor:
+                cursor.execute(query, (stock_id, start_date, end_date))
+                return cursor.fetchall(), [desc[0] for desc in cursor.description]
+
+        data, columns = self.pool.run_idempotent(read)
 
         # Convert data to a DataFrame for easy analysis
         df = pd.DataFrame(data, columns=columns)
         if df.empty:
-            print("No breakout data found for the specified criteria.")
+            logger.info("No breakout data found for the specified criteria.")
         return df
 
     def plot_breakout_and_max_prices(self, df, stock_symbol):
         # Ensure there are data to plot
         if df.empty:
-            print("No data to plot.")
+            logger.info("No data to plot.")
             return
 
         # Convert analysis_date to datetime for easier plotting
         df["analysis_date"] = pd.to_datetime(df["analysis_date"])
 
+        # Only needed here, so only loaded here
+        import matplotlib.pyplot as plt
+
         fig, ax1 = plt.subplots(figsize=(14, 8))
 
         # Plot breakout percentage as bars on secondary y-axis
@@ -451,13 +1142,13 @@ class StockAnalysisDatabase:
         plt.show()
 
     def close_connection(self):
-        """Close the database connection."""
-        if self.conn:
-            self.conn.close()
-            print("Database connection closed.")
+        """Close all pooled database connections."""
+        if self.pool:
+            self.pool.close()
+            logger.info("Database connection closed.")
 
 
 if __name__ == "__main__":
-    db = StockAnalysisDatabase()
-    db.analyse_and_store_stocks(period=3)
-    db.close_connection()
+    from cli import main
+
+    main(["daily"])
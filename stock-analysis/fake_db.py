@@ -0,0 +1,252 @@
+import csv
+import io
+import json
+import re
+from collections import defaultdict
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extensions import adapt
+
+from connection_pool import ConnectionPool
+from db_client import StockAnalysisDatabase
+
+
+class FakeCursor:
+    """
+    Cursor that records statements instead of sending them.
+
+    mogrify adapts parameters with psycopg2 just like a real cursor, so
+    execute_values does the same client-side work as against a server.
+    """
+
+    def __init__(self, connection: "FakeConnection"):
+        self.connection = connection
+        self.rows: List[tuple] = []
+        self.description: List[tuple] = []
+
+    def __enter__(self) -> "FakeCursor":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def mogrify(self, query, params=None) -> bytes:
+        if isinstance(query, str):
+            query = query.encode()
+        if not params:
+            return query
+        return query % tuple(adapt(value).getquoted() for value in params)
+
+    def execute(self, query, params=None):
+        if isinstance(query, bytes):
+            query = query.decode()
+        self.connection.statements += 1
+        self.connection.bytes_sent += len(query)
+        self.rows = self.connection.answer(query, params)
+
+    def copy_expert(self, sql: str, file):
+        self.execute(sql)
+        self.connection.bytes_sent += len(file.read())
+
+    def fetchone(self) -> Optional[tuple]:
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self) -> List[tuple]:
+        return self.rows
+
+
+class FakeConnection:
+    """
+    In-memory stand-in for a psycopg2 connection that knows the stocks table
+    and keeps saved indicator states.
+    """
+
+    def __init__(self, stocks: Dict[str, int]):
+        self.stocks = stocks
+        self.indicator_states: Dict[Tuple[int, int], dict] = {}
+        self.statements = 0
+        self.bytes_sent = 0
+        self.commits = 0
+        self.closed = 0
+        self.encoding = "UTF8"
+
+    def answer(self, query: str, params) -> List[tuple]:
+        if "FROM stocks WHERE stock_symbol = ANY" in query:
+            return [
+                (symbol, self.stocks[symbol])
+                for symbol in params[0]
+                if symbol in self.stocks
+            ]
+        if "FROM stocks WHERE stock_symbol" in query:
+            stock_id = self.stocks.get(params[0])
+            return [(stock_id,)] if stock_id is not None else []
+        if "INSERT INTO stock_indicator_state" in query:
+            stock_id, analysis_period, _, state = params
+            # Parsed back like a jsonb column
+            self.indicator_states[(stock_id, analysis_period)] = json.loads(state)
+            return []
+        if "FROM stock_indicator_state" in query:
+            state = self.indicator_states.get(tuple(params))
+            return [(state,)] if state is not None else []
+        if "SELECT stock_id, stock_symbol FROM stocks" in query:
+            return [(stock_id, symbol) for symbol, stock_id in self.stocks.items()]
+        return []
+
+    def cursor(self, *args, **kwargs) -> FakeCursor:
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class FakePool(ConnectionPool):
+    """ConnectionPool handing out a single FakeConnection."""
+
+    def __init__(self, stocks: Dict[str, int]):
+        self.conn = FakeConnection(stocks)
+        self.reconnects = 0
+
+    @contextmanager
+    def connection(self) -> Iterator[FakeConnection]:
+        yield self.conn
+
+    def run_idempotent(self, operation):
+        return operation(self.conn)
+
+    def close(self):
+        self.conn.close()
+
+
+def fake_database(
+    symbols: List[str],
+) -> Tuple[StockAnalysisDatabase, FakeConnection]:
+    """StockAnalysisDatabase on a FakePool, with stock ids 1, 2, ... for symbols."""
+    pool = FakePool({symbol: i + 1 for i, symbol in enumerate(symbols)})
+    return StockAnalysisDatabase(pool=pool), pool.conn
+
+
+class FlakyServer:
+    """
+    Postgres stand-in whose connections can be dropped mid-statement.
+
+    Connections are made through psycopg2's connection_factory hook, so a real
+    ConnectionPool (see pool()) checks them out, discards and retries them.
+    Inserted rows only reach `tables` when their transaction commits, like on
+    a server; a dropped connection loses its open transaction.
+    """
+
+    def __init__(self, stocks: Dict[str, int]):
+        self.stocks = stocks
+        self.tables: Dict[str, List[tuple]] = defaultdict(list)
+        self.connections = 0
+        self.drops = 0
+        self._drop_on: List[str] = []
+
+    def drop_on(self, statement: str, times: int = 1):
+        """Drop the connection on the next `times` statements containing statement."""
+        self._drop_on.extend([statement] * times)
+
+    def should_drop(self, query: str) -> bool:
+        for statement in self._drop_on:
+            if statement in query:
+                self._drop_on.remove(statement)
+                self.drops += 1
+                return True
+        return False
+
+    def connect(self, dsn: str, async_: int = 0) -> "FlakyConnection":
+        self.connections += 1
+        return FlakyConnection(self)
+
+    def pool(self, maxconn: int = 2, retries: int = 3) -> ConnectionPool:
+        """ConnectionPool on this server, retrying without delay."""
+        return ConnectionPool(
+            1,
+            maxconn,
+            retries=retries,
+            retry_delay=0.0,
+            connection_factory=self.connect,
+            dbname="stand-in",
+        )
+
+
+class FlakyCursor(FakeCursor):
+    """FakeCursor that hands the rows it inserts to its connection's transaction."""
+
+    def __init__(self, connection: "FlakyConnection"):
+        super().__init__(connection)
+        self.values: List[tuple] = []
+        self.staged: List[tuple] = []
+
+    def mogrify(self, query, params=None) -> bytes:
+        # execute_values mogrifies each row before sending the statement
+        if params:
+            self.values.append(tuple(params))
+        return super().mogrify(query, params)
+
+    def execute(self, query, params=None):
+        connection = self.connection
+        if connection.closed:
+            raise psycopg2.InterfaceError("connection already closed")
+        text = query.decode() if isinstance(query, bytes) else query
+        if connection.server.should_drop(text):
+            connection.closed = 2
+            connection.pending.clear()
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        insert = re.match(r"\s*INSERT INTO (\w+)", text)
+        if insert:
+            # Rows of an execute_values VALUES list, or of a COPY into staging
+            rows = self.values or self.staged
+            connection.pending.extend((insert.group(1), row) for row in rows)
+        self.values = []
+        super().execute(query, params)
+
+    def copy_expert(self, sql: str, file):
+        self.execute(sql)
+        self.staged = [tuple(row) for row in csv.reader(io.StringIO(file.read()))]
+
+
+class FlakyConnection(FakeConnection):
+    """FakeConnection of a FlakyServer, with a transaction of pending rows."""
+
+    def __init__(self, server: FlakyServer):
+        super().__init__(server.stocks)
+        self.server = server
+        self.pending: List[Tuple[str, tuple]] = []
+
+    @property
+    def info(self):
+        status = (
+            extensions.TRANSACTION_STATUS_INTRANS
+            if self.pending
+            else extensions.TRANSACTION_STATUS_IDLE
+        )
+        return SimpleNamespace(transaction_status=status)
+
+    def cursor(self, *args, **kwargs) -> FlakyCursor:
+        return FlakyCursor(self)
+
+    def commit(self):
+        if self.closed:
+            raise psycopg2.InterfaceError("connection already closed")
+        for table, row in self.pending:
+            self.server.tables[table].append(row)
+        self.pending.clear()
+        super().commit()
+
+    def rollback(self):
+        self.pending.clear()
+
+    def close(self):
+        self.pending.clear()
+        super().close()
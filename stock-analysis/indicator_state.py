@@ -0,0 +1,316 @@
+from collections import deque
+from itertools import islice
+from datetime import date, datetime
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import numpy as np
+
+from stock_analysis import (
+    _ewm_alpha,
+    _seeded_ema,
+    _seeded_macd_signal,
+    _trendline_fields,
+)
+from trading_calendar import months_before
+
+EMA_SPANS = (9, 12, 21, 26, 50)
+RSI_PERIOD = 14
+BAND_WINDOW = 20
+
+# Layout of one bar in the analysis window: date, close, high, volume, gain,
+# loss, then the unseeded EMA for every span in EMA_SPANS and the unseeded MACD
+# signal EMA, all as of that bar. The EMA columns are what let the windowed
+# EMAs be recovered in O(1) once the window start moves.
+_DATE, _CLOSE, _HIGH, _VOLUME, _GAIN, _LOSS = range(6)
+_EMA = {span: 6 + i for i, span in enumerate(EMA_SPANS)}
+_SIGNAL = 6 + len(EMA_SPANS)
+
+
+class IndicatorState:
+    """
+    Per-symbol indicator state that is updated one bar at a time.
+
+    The state keeps the unseeded EMA accumulators, rolling RSI gain/loss sums,
+    Bollinger sum and sum of squares, the rolling volume sum and the bars of
+    the current analysis window (period calendar months up to the last bar).
+    result(symbol, analysis_date) then gives the same numbers as a full
+    analyse_stock(symbol, analysis_date, period): the bars from
+    analysis_window_start(analysis_date, period) up to but excluding
+    analysis_date, as fetch_stock_data returns them. Without analysis_date
+    it matches analyse_stock on data.loc[months_before(last_date, period) :
+    last_date].
+
+    With window_bars set the window is instead the last window_bars bars,
+    held in a ring buffer, and bars are keyed by timestamp rather than date,
+    so the state also works on intraday bars.
+    """
+
+    def __init__(self, period: int = 3, window_bars: Optional[int] = None):
+        self.period = period
+        self.window_bars = window_bars
+        self.last_date: Optional[date] = None
+        self.last_close: Optional[float] = None
+        self.ema_unseeded = {span: 0.0 for span in EMA_SPANS}
+        self.signal_unseeded = 0.0
+        self.gains: Deque[Tuple[float, float]] = deque(maxlen=RSI_PERIOD)
+        self.gain_sum = 0.0
+        self.loss_sum = 0.0
+        self.closes: Deque[float] = deque(maxlen=BAND_WINDOW)
+        self.close_sum = 0.0
+        self.close_sum_sq = 0.0
+        self.volumes: Deque[float] = deque(maxlen=BAND_WINDOW)
+        self.volume_sum = 0.0
+        self.window: Deque[tuple] = deque(maxlen=window_bars)
+
+    @property
+    def window_days(self) -> int:
+        # The stored analysis_period of a window of period months
+        return self.period * 30
+
+    def _bar_key(self, bar_date):
+        return (
+            _to_date(bar_date) if self.window_bars is None else _to_datetime(bar_date)
+        )
+
+    @classmethod
+    def from_history(
+        cls, data, period: int = 3, window_bars: Optional[int] = None
+    ) -> "IndicatorState":
+        """Build the state by replaying a price history bar by bar."""
+        state = cls(period, window_bars)
+        for bar_date, close, high, volume in zip(
+            data.index, data["Close"], data["High"], data["Volume"]
+        ):
+            state.update(bar_date, close, high, volume)
+        return state
+
+    def update(self, bar_date, close: float, high: float, volume: float):
+        """Fold one new bar into the state in O(1)."""
+        bar_date = self._bar_key(bar_date)
+        if self.last_date is not None and bar_date <= self.last_date:
+            raise ValueError(
+                f"Bar for {bar_date} is not after the last bar ({self.last_date})."
+            )
+        close, high, volume = float(close), float(high), float(volume)
+
+        change = 0.0 if self.last_close is None else close - self.last_close
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+        if len(self.gains) == RSI_PERIOD:
+            old_gain, old_loss = self.gains[0]
+            self.gain_sum -= old_gain
+            self.loss_sum -= old_loss
+        self.gains.append((gain, loss))
+        self.gain_sum += gain
+        self.loss_sum += loss
+
+        if len(self.closes) == BAND_WINDOW:
+            old_close = self.closes[0]
+            self.close_sum -= old_close
+            self.close_sum_sq -= old_close * old_close
+            self.volume_sum -= self.volumes[0]
+        self.closes.append(close)
+        self.close_sum += close
+        self.close_sum_sq += close * close
+        self.volumes.append(volume)
+        self.volume_sum += volume
+
+        for span in EMA_SPANS:
+            alpha = _ewm_alpha(span)
+            self.ema_unseeded[span] = (
+                alpha * close + (1.0 - alpha) * self.ema_unseeded[span]
+            )
+        signal_alpha = _ewm_alpha(9)
+        self.signal_unseeded = (
+            signal_alpha * (self.ema_unseeded[12] - self.ema_unseeded[26])
+            + (1.0 - signal_alpha) * self.signal_unseeded
+        )
+
+        self.window.append(
+            (bar_date, close, high, volume, gain, loss)
+            + tuple(self.ema_unseeded[span] for span in EMA_SPANS)
+            + (self.signal_unseeded,)
+        )
+        if self.window_bars is None:
+            window_start = months_before(bar_date, self.period).item()
+            while self.window[0][_DATE] < window_start:
+                self.window.popleft()
+
+        self.last_date = bar_date
+        self.last_close = close
+
+    def result(
+        self,
+        stock_symbol: str,
+        analysis_date: Optional[str] = None,
+        trendline: Optional[Tuple] = None,
+    ):
+        """
+        Analysis result for the current window, keyed like analyse_stock.
+
+        With analysis_date given (and no window_bars), the window is the one
+        analyse_stock downloads for that date, which must be after the last
+        bar; for a date the state has already moved past, ValueError is
+        raised and the day has to be analysed from a full window.
+
+        trendline can pass in the trendline_value, breakout_percentage,
+        consecutive_days_above and trendline_accuracy of the same window (e.g.
+        from a TrendlineTracker) instead of fitting it here. With window_bars
+        set, analysis_date is only a label, by default the last bar's
+        timestamp, and analysis_period the window length in bars.
+        """
+        if self.last_date is None:
+            raise ValueError(f"No bars recorded for {stock_symbol}.")
+        skip = 0
+        if analysis_date is None:
+            analysis_date = (
+                self.last_date.strftime("%Y-%m-%d")
+                if self.window_bars is None
+                else self.last_date.isoformat(sep=" ")
+            )
+        elif self.window_bars is None:
+            end = _to_date(analysis_date)
+            if end <= self.last_date:
+                raise ValueError(
+                    f"The state of {stock_symbol} already has bars up to "
+                    f"{self.last_date}, so it cannot be analysed on {analysis_date}."
+                )
+            window_start = months_before(end, self.period).item()
+            while skip < len(self.window) and self.window[skip][_DATE] < window_start:
+                skip += 1
+
+        length = len(self.window) - skip
+        if length == 0:
+            raise ValueError(f"No bars for {stock_symbol} in the analysis window.")
+        first = self.window[skip]
+        steps = length - 1
+
+        # The first bar of a window has no previous close inside the window.
+        rsi = np.nan
+        if length >= RSI_PERIOD:
+            gain_sum, loss_sum = self.gain_sum, self.loss_sum
+            if length == RSI_PERIOD:
+                gain_sum -= first[_GAIN]
+                loss_sum -= first[_LOSS]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                rsi = 100 - (100 / (1 + np.float64(gain_sum) / loss_sum))
+
+        middle = std_dev = volume_ratio = np.nan
+        if length >= BAND_WINDOW:
+            middle = self.close_sum / BAND_WINDOW
+            variance = (self.close_sum_sq - self.close_sum * middle) / (BAND_WINDOW - 1)
+            std_dev = np.sqrt(max(variance, 0.0))
+            volume_ratio = self.last_volume / (self.volume_sum / BAND_WINDOW)
+
+        emas = {
+            span: _seeded_ema(
+                self.ema_unseeded[span], first[_CLOSE], first[_EMA[span]], steps, span
+            )
+            for span in EMA_SPANS
+        }
+        macd_signal = _seeded_macd_signal(
+            self.signal_unseeded,
+            first[_SIGNAL],
+            first[_CLOSE],
+            first[_EMA[12]],
+            first[_EMA[26]],
+            steps,
+        )
+
+        if trendline is None:
+            bars = list(islice(self.window, skip, None))
+            highs = np.fromiter((bar[_HIGH] for bar in bars), float, length)
+            closes = np.fromiter((bar[_CLOSE] for bar in bars), float, length)
+            trendline = _trendline_fields(highs, closes)
+        trendline_value, breakout, consecutive, accuracy = trendline
+
+        return {
+            "stock_symbol": stock_symbol,
+            "date": analysis_date,
+            "close_price": self.last_close,
+            "trendline_value": trendline_value,
+            "breakout_percentage": breakout,
+            "consecutive_days_above": consecutive,
+            "trendline_accuracy": accuracy,
+            "rsi": rsi,
+            "macd_value": emas[12] - emas[26],
+            "macd_signal": macd_signal,
+            "bollinger_upper": middle + 2 * std_dev,
+            "bollinger_middle": middle,
+            "bollinger_lower": middle - 2 * std_dev,
+            "volume": int(self.last_volume),
+            "volume_ratio": volume_ratio,
+            "9EMA": emas[9],
+            "12EMA": emas[12],
+            "21EMA": emas[21],
+            "50EMA": emas[50],
+            "analysis_period": (
+                self.window_days if self.window_bars is None else self.window_bars
+            ),
+        }
+
+    @property
+    def last_volume(self) -> float:
+        return self.volumes[-1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serialisable snapshot of the state."""
+        return {
+            "period": self.period,
+            "window_bars": self.window_bars,
+            "last_date": self.last_date.isoformat() if self.last_date else None,
+            "last_close": self.last_close,
+            "ema_unseeded": {str(span): v for span, v in self.ema_unseeded.items()},
+            "signal_unseeded": self.signal_unseeded,
+            "gains": [list(g) for g in self.gains],
+            "gain_sum": self.gain_sum,
+            "loss_sum": self.loss_sum,
+            "closes": list(self.closes),
+            "close_sum": self.close_sum,
+            "close_sum_sq": self.close_sum_sq,
+            "volumes": list(self.volumes),
+            "volume_sum": self.volume_sum,
+            "window": [[bar[_DATE].isoformat(), *bar[1:]] for bar in self.window],
+        }
+
+    @classmethod
+    def from_dict(cls, snapshot: Dict[str, Any]) -> "IndicatorState":
+        """Restore a state saved with to_dict."""
+        state = cls(snapshot["period"], snapshot.get("window_bars"))
+        if snapshot["last_date"] is not None:
+            state.last_date = state._bar_key(snapshot["last_date"])
+        state.last_close = snapshot["last_close"]
+        state.ema_unseeded = {
+            int(span): v for span, v in snapshot["ema_unseeded"].items()
+        }
+        state.signal_unseeded = snapshot["signal_unseeded"]
+        state.gains.extend(tuple(g) for g in snapshot["gains"])
+        state.gain_sum = snapshot["gain_sum"]
+        state.loss_sum = snapshot["loss_sum"]
+        state.closes.extend(snapshot["closes"])
+        state.close_sum = snapshot["close_sum"]
+        state.close_sum_sq = snapshot["close_sum_sq"]
+        state.volumes.extend(snapshot["volumes"])
+        state.volume_sum = snapshot["volume_sum"]
+        state.window.extend(
+            (state._bar_key(bar[0]), *bar[1:]) for bar in snapshot["window"]
+        )
+        return state
+
+
+def _to_date(value) -> date:
+    if isinstance(value, str):
+        return datetime.strptime(value[:10], "%Y-%m-%d").date()
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def _to_datetime(value) -> datetime:
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    # numpy.datetime64
+    return datetime.fromisoformat(str(np.datetime_as_string(value, unit="us")))
@@ -0,0 +1,271 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets per doubling of the latency; percentiles are read off the
+# bucket bounds, so they are accurate to within about 9%
+BUCKETS_PER_DOUBLING = 8
+
+# Lower bound of the first histogram bucket, in seconds
+RESOLUTION = 1e-7
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+def configure_logging(level: Optional[str] = None):
+    """Log to stderr at level, default LOG_LEVEL or INFO."""
+    logging.basicConfig(
+        level=(level or os.getenv("LOG_LEVEL", "INFO")).upper(), format=LOG_FORMAT
+    )
+
+
+class Histogram:
+    """
+    Latency histogram with logarithmic buckets.
+
+    Memory grows with the spread of the latencies rather than their number,
+    so a timer can observe millions of calls in a run.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets: Dict[int, int] = {}
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        bucket = 0
+        if seconds > RESOLUTION:
+            bucket = int(math.log2(seconds / RESOLUTION) * BUCKETS_PER_DOUBLING)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile, clipped to min/max."""
+        if not self.count:
+            return math.nan
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                break
+        upper = RESOLUTION * 2 ** ((bucket + 1) / BUCKETS_PER_DOUBLING)
+        return min(max(upper, self.min), self.max)
+
+    def summary(self) -> Dict[str, float]:
+        summary = {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.min if self.count else math.nan,
+            "max": self.max,
+        }
+        for q in QUANTILES:
+            summary[f"p{round(q * 100)}"] = self.quantile(q)
+        return summary
+
+
+def _no_lap(name: str):
+    pass
+
+
+class Metrics:
+    """
+    Timers and counters for one run of the analysis, off unless enabled.
+
+    While disabled every hook returns after checking a single attribute, so
+    instrumented code runs at its normal speed. Observations are kept per
+    process: code running in a ProcessPoolExecutor worker is only counted if
+    the parent records it too.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything observed so far."""
+        with self.lock:
+            self.timers: Dict[str, Histogram] = {}
+            self.counters: Dict[str, float] = {}
+            self.started = perf_counter()
+
+    def observe(self, name: str, seconds: float):
+        """Record one duration for timer name."""
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.timers.get(name)
+            if histogram is None:
+                histogram = self.timers[name] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name: str, n: float = 1):
+        """Add n to counter name."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def _timer(self, name: str) -> Iterator[None]:
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - started)
+
+    def timer(self, name: str):
+        """Context manager timing its block as name."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return self._timer(name)
+
+    def stopwatch(self, prefix: str) -> Callable[[str], None]:
+        """
+        Lap timer for consecutive sections of one function: each call
+        lap(name) records the time since the previous lap (or since the
+        stopwatch was started) as prefix.name.
+        """
+        if not self.enabled:
+            return _no_lap
+        last = perf_counter()
+
+        def lap(name: str):
+            nonlocal last
+            now = perf_counter()
+            self.observe(f"{prefix}.{name}", now - last)
+            last = now
+
+        return lap
+
+    def report(self) -> Dict[str, Any]:
+        """Timer summaries (in seconds) and counters observed since the last reset."""
+        with self.lock:
+            return {
+                "wall_seconds": perf_counter() - self.started,
+                "timers": {
+                    name: histogram.summary()
+                    for name, histogram in sorted(self.timers.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def prometheus(self, namespace: str = "stock_analysis") -> str:
+        """The report in the Prometheus text exposition format."""
+        report = self.report()
+        lines = []
+        for name, summary in report["timers"].items():
+            metric = _metric_name(namespace, name, "seconds")
+            lines.append(f"# TYPE {metric} summary")
+            for q in QUANTILES:
+                value = summary[f"p{round(q * 100)}"]
+                lines.append(f'{metric}{{quantile="{q}"}} {value:.9g}')
+            lines.append(f"{metric}_sum {summary['sum']:.9g}")
+            lines.append(f"{metric}_count {summary['count']}")
+        for name, value in report["counters"].items():
+            metric = _metric_name(namespace, name, "total")
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value:.9g}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """Save the report as Prometheus text if path ends in .prom, else as JSON."""
+        with open(path, "w") as output:
+            if path.endswith(".prom"):
+                output.write(self.prometheus())
+            else:
+                json.dump(self.report(), output, indent=2)
+
+    def log_report(self):
+        report = self.report()
+        for name, summary in report["timers"].items():
+            logger.info(
+                "%s: %d calls, %.3fs total, p50 %.3fms p95 %.3fms p99 %.3fms",
+                name,
+                summary["count"],
+                summary["sum"],
+                summary["p50"] * 1000,
+                summary["p95"] * 1000,
+                summary["p99"] * 1000,
+            )
+        for name, value in report["counters"].items():
+            logger.info("%s: %g", name, value)
+
+    @contextmanager
+    def run(self, name: str) -> Iterator["Metrics"]:
+        """
+        Scope of one run: metrics are reset on entry, and on exit logged and,
+        if STOCK_METRICS_DIR is set, saved there as <name>-<timestamp>.json
+        and .prom.
+        """
+        if not self.enabled:
+            yield self
+            return
+        self.reset()
+        try:
+            yield self
+        finally:
+            self.log_report()
+            directory = os.getenv("STOCK_METRICS_DIR")
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+                stem = os.path.join(directory, f"{name}-{datetime.now():%Y%m%dT%H%M%S}")
+                for extension in (".json", ".prom"):
+                    self.write(stem + extension)
+                logger.info("Saved %s metrics to %s.{json,prom}", name, stem)
+
+
+class _NullTimer:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def _metric_name(namespace: str, name: str, unit: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", f"{namespace}_{name}_{unit}")
+
+
+# Process-wide metrics, enabled by setting STOCK_METRICS=1
+metrics = Metrics(enabled=os.getenv("STOCK_METRICS", "0") not in ("", "0"))
+
+
+def timed(name: str):
+    """Decorator timing every call of the function as name in metrics."""
+
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            started = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.observe(name, perf_counter() - started)
+
+        return wrapper
+
+    return decorate
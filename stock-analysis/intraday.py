@@ -0,0 +1,279 @@
+"""
+Intraday breakout screening on several timeframes at once.
+
+Streams 1-minute or 5-minute bars from a CSV file (or a synthetic stand-in
+feed), resamples them into OHLCV bars for each interval as they arrive, and
+runs the incremental indicator and trendline pipeline (IndicatorState and
+TrendlineTracker) per timeframe over the last --window-bars bars. Memory per
+symbol and timeframe is bounded by that window, not by the history:
+
+    python intraday.py SYMBOL --file bars.csv [--intervals 5m 15m 1h]
+                              [--window-bars 120] [--input-interval 1m]
+    python intraday.py SYMBOL --synthetic-days 20
+
+The CSV needs a timestamp (or datetime) column in ISO format and open, high,
+low, close and volume columns, in time order.
+"""
+
+import argparse
+import csv
+import logging
+import re
+from datetime import datetime, time, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+from indicator_state import IndicatorState
+from instrumentation import configure_logging, metrics
+from trendline_tracker import TrendlineTracker
+
+logger = logging.getLogger(__name__)
+
+# Intraday buckets are aligned to the regular session open
+SESSION_OPEN = time(9, 30)
+
+DEFAULT_INTERVALS = ("5m", "15m", "1h")
+
+_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+
+class Bar(NamedTuple):
+    timestamp: datetime
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+
+
+def parse_interval(interval: str) -> timedelta:
+    """'1m', '15m', '1h' or '1d' as a timedelta."""
+    match = re.fullmatch(r"(\d+)([mhd])", interval.strip().lower())
+    if match is None or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid interval {interval!r}; use e.g. 5m, 1h or 1d.")
+    return timedelta(**{_UNITS[match.group(2)]: int(match.group(1))})
+
+
+class Resampler:
+    """
+    Streaming OHLCV resampler: bars go in in time order and completed bars
+    of `interval` come out, so only the bar being built is held.
+
+    Intraday buckets start at the session open of each day and every
+    interval after it; daily and longer buckets start at midnight. Buckets
+    are labelled by their start, like DataFrame.resample. A bucket is emitted
+    when a bar of a later bucket arrives or, with input_interval given, as
+    soon as a bar reaches the bucket's end.
+    """
+
+    def __init__(
+        self,
+        interval: timedelta,
+        input_interval: Optional[timedelta] = None,
+        origin: time = SESSION_OPEN,
+    ):
+        self.interval = interval
+        self.input_interval = input_interval
+        self.origin = origin
+        self.current: Optional[Bar] = None
+
+    def bucket_start(self, timestamp: datetime) -> datetime:
+        if self.interval >= timedelta(days=1):
+            origin = datetime.combine(timestamp.date(), time(), timestamp.tzinfo)
+        else:
+            origin = datetime.combine(timestamp.date(), self.origin, timestamp.tzinfo)
+        return origin + (timestamp - origin) // self.interval * self.interval
+
+    def update(self, bar: Bar) -> Optional[Bar]:
+        """Add a bar; returns the bucket it completes, if any."""
+        start = self.bucket_start(bar.timestamp)
+        completed = None
+        current = self.current
+        if current is not None and start != current.timestamp:
+            if start < current.timestamp:
+                raise ValueError(
+                    f"Bar at {bar.timestamp} is before the current bucket "
+                    f"({current.timestamp})."
+                )
+            completed, current = current, None
+        if current is None:
+            current = Bar(start, bar.open, bar.high, bar.low, bar.close, bar.volume)
+        else:
+            current = Bar(
+                start,
+                current.open,
+                max(current.high, bar.high),
+                min(current.low, bar.low),
+                bar.close,
+                current.volume + bar.volume,
+            )
+        self.current = current
+        if (
+            completed is None
+            and self.input_interval is not None
+            and bar.timestamp + self.input_interval >= start + self.interval
+        ):
+            completed, self.current = current, None
+        return completed
+
+    def flush(self) -> Optional[Bar]:
+        """Emit the bucket being built, e.g. at the end of a feed."""
+        completed, self.current = self.current, None
+        return completed
+
+
+class TimeframeAnalyser:
+    """
+    One symbol on one timeframe: resampled bars feed an IndicatorState and a
+    TrendlineTracker over the last window_bars bars, and every completed bar
+    yields an analyse_stock-style result.
+    """
+
+    def __init__(
+        self,
+        stock_symbol: str,
+        interval: str,
+        window_bars: int = 120,
+        distance: int = 5,
+        input_interval: Optional[str] = None,
+    ):
+        self.stock_symbol = stock_symbol
+        self.interval = interval
+        self.resampler = Resampler(
+            parse_interval(interval),
+            parse_interval(input_interval) if input_interval else None,
+        )
+        self.state = IndicatorState(window_bars=window_bars)
+        self.tracker = TrendlineTracker(distance, window_bars=window_bars)
+
+    def update(self, bar: Bar) -> Optional[Dict[str, Any]]:
+        completed = self.resampler.update(bar)
+        return None if completed is None else self._analyse(completed)
+
+    def flush(self) -> Optional[Dict[str, Any]]:
+        completed = self.resampler.flush()
+        return None if completed is None else self._analyse(completed)
+
+    def _analyse(self, bar: Bar) -> Dict[str, Any]:
+        with metrics.timer("intraday.analyse"):
+            self.state.update(bar.timestamp, bar.close, bar.high, bar.volume)
+            event = self.tracker.update(bar.timestamp, bar.high, bar.close)
+            result = self.state.result(
+                self.stock_symbol,
+                trendline=(
+                    event["trendline_value"],
+                    event["breakout_percentage"],
+                    event["consecutive_days_above"],
+                    event["trendline_accuracy"],
+                ),
+            )
+        result["timeframe"] = self.interval
+        result["breakout"] = event["breakout"]
+        return result
+
+
+class MultiTimeframeAnalyser:
+    """TimeframeAnalysers for several intervals fed from the same bars."""
+
+    def __init__(
+        self,
+        stock_symbol: str,
+        intervals: Sequence[str] = DEFAULT_INTERVALS,
+        window_bars: int = 120,
+        distance: int = 5,
+        input_interval: Optional[str] = None,
+    ):
+        self.timeframes = [
+            TimeframeAnalyser(
+                stock_symbol, interval, window_bars, distance, input_interval
+            )
+            for interval in intervals
+        ]
+
+    def update(self, bar: Bar) -> List[Dict[str, Any]]:
+        """Results of the timeframes whose bar this bar completes."""
+        metrics.count("intraday.bars")
+        results = (timeframe.update(bar) for timeframe in self.timeframes)
+        return [result for result in results if result is not None]
+
+    def flush(self) -> List[Dict[str, Any]]:
+        results = (timeframe.flush() for timeframe in self.timeframes)
+        return [result for result in results if result is not None]
+
+    def run(self, bars: Iterable[Bar]) -> Iterator[Dict[str, Any]]:
+        """Results for a whole feed, finishing with the partial last bars."""
+        for bar in bars:
+            yield from self.update(bar)
+        yield from self.flush()
+
+
+def read_bars(path: str) -> Iterator[Bar]:
+    """Stream bars from a CSV file row by row; column names are case-insensitive."""
+    with open(path, newline="") as bars_file:
+        reader = csv.DictReader(bars_file)
+        columns = {name.strip().lower(): name for name in reader.fieldnames or ()}
+        timestamp = columns.get("timestamp") or columns.get("datetime")
+        if timestamp is None:
+            raise ValueError(f"{path} has no timestamp or datetime column.")
+        fields = [columns[name] for name in Bar._fields[1:]]
+        for row in reader:
+            yield Bar(
+                datetime.fromisoformat(row[timestamp]),
+                *(float(row[field]) for field in fields),
+            )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("symbol")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--file", help="CSV of 1m or 5m bars")
+    source.add_argument(
+        "--synthetic-days", type=int, help="Use a synthetic feed of this many days"
+    )
+    parser.add_argument("--intervals", nargs="+", default=list(DEFAULT_INTERVALS))
+    parser.add_argument("--window-bars", type=int, default=120)
+    parser.add_argument("--distance", type=int, default=5)
+    parser.add_argument(
+        "--input-interval",
+        help="Interval of the input bars, to emit buckets without waiting "
+        "for the next one (e.g. 1m)",
+    )
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    if args.file:
+        bars = read_bars(args.file)
+    else:
+        from synthetic_data import synthetic_intraday
+
+        minutes = parse_interval(args.input_interval or "1m").seconds // 60
+        bars = (Bar(*bar) for bar in synthetic_intraday(args.synthetic_days, minutes))
+    analyser = MultiTimeframeAnalyser(
+        args.symbol,
+        args.intervals,
+        args.window_bars,
+        args.distance,
+        args.input_interval,
+    )
+    counts = {interval: [0, 0] for interval in args.intervals}
+    for result in analyser.run(bars):
+        counts[result["timeframe"]][0] += 1
+        if result["breakout"]:
+            counts[result["timeframe"]][1] += 1
+            logger.info(
+                "%s %s breakout at %s: close %.2f, %.2f%% above trendline, "
+                "RSI %.1f, volume ratio %.2f",
+                args.symbol,
+                result["timeframe"],
+                result["date"],
+                result["close_price"],
+                result["breakout_percentage"],
+                result["rsi"],
+                result["volume_ratio"],
+            )
+    for interval, (bars_seen, breakouts) in counts.items():
+        logger.info("%s: %d bars, %d breakouts", interval, bars_seen, breakouts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+from stock_analysis import _ewm_alpha, _trendline_fields
+from trading_calendar import months_before
+
+EMA_SPANS = (9, 12, 21, 26, 50)
+RSI_PERIOD = 14
+BAND_WINDOW = 20
+
+
+def build_panel(frames: Dict[str, pd.DataFrame]) -> Tuple[pd.DataFrame, ...]:
+    """
+    Align per-symbol price frames into (dates x symbols) Close, High and
+    Volume matrices. Dates a symbol has no bar for are NaN.
+    """
+    return tuple(
+        pd.concat(
+            {symbol: frame[field] for symbol, frame in frames.items()}, axis=1
+        ).sort_index()
+        for field in ("Close", "High", "Volume")
+    )
+
+
+def _right_align(valid: np.ndarray, *matrices: np.ndarray):
+    """
+    Move every column's valid rows to the bottom, keeping their order.
+
+    Afterwards each symbol's last bar is on the last row and its first bar on
+    row len - count, so ragged histories line up for the column-wise kernels.
+    """
+    order = np.argsort(valid, axis=0, kind="stable")
+    return [np.take_along_axis(matrix, order, axis=0) for matrix in matrices]
+
+
+@timed("analysis.panel")
+def analyse_panel(
+    close: pd.DataFrame,
+    high: pd.DataFrame,
+    volume: pd.DataFrame,
+    end_date: Optional[str] = None,
+    period: int = 3,
+) -> pd.DataFrame:
+    """
+    Analyse every symbol of a price panel at once.
+
+    close, high and volume share a date index and one column per symbol. For
+    each symbol the result matches analyse_stock on that symbol's bars in
+    [months_before(end_date, period), end_date]; rows where any of the three
+    values is NaN are treated as missing bars. Indicators are computed for
+    all columns together; only the peak search runs per symbol. Symbols on
+    which analyse_stock would raise (no bars or no peaks) are left out.
+
+    Returns:
+    - DataFrame indexed by symbol with the analyse_stock result keys as
+      columns. Missing trendline fields are NaN; see history_to_results.
+    """
+    if end_date is None:
+        end_date = close.index[-1].strftime("%Y-%m-%d")
+    days = np.asarray(close.index, dtype="datetime64[D]")
+    first = days.searchsorted(months_before(end_date, period), side="left")
+    last = days.searchsorted(np.datetime64(end_date, "D"), side="right")
+
+    closes = close.to_numpy(dtype=np.float64)[first:last]
+    highs = high.to_numpy(dtype=np.float64)[first:last]
+    volumes = volume.to_numpy(dtype=np.float64)[first:last]
+    valid = ~(np.isnan(closes) | np.isnan(highs) | np.isnan(volumes))
+    closes, highs, volumes = _right_align(
+        valid, np.where(valid, closes, 0.0), highs, volumes
+    )
+    counts = valid.sum(axis=0)
+    length, symbols = closes.shape
+    starts = length - counts
+    has_bars = counts > 0
+    bar_offset = np.arange(length)[:, None] - starts  # Bars since each first bar
+    in_window = bar_offset >= 0
+    first_close = closes[np.minimum(starts, length - 1), np.arange(symbols)]
+
+    from scipy.signal import lfilter
+
+    # EMAs: run the recursion from zero over the zero-padded columns, then add
+    # the decayed seed (1 - alpha) * first close, which is what adjust=False
+    # contributes by starting at the first close instead of zero.
+    emas = {}
+    for span in EMA_SPANS:
+        alpha = _ewm_alpha(span)
+        unseeded = lfilter([alpha], [1.0, alpha - 1.0], closes, axis=0)
+        decay = np.where(in_window, (1.0 - alpha) ** np.maximum(bar_offset, 0), 0.0)
+        emas[span] = unseeded + decay * (1.0 - alpha) * first_close
+    macd = emas[12] - emas[26]
+    # MACD is zero up to and including each first bar, so the signal EMA
+    # needs no seed correction
+    signal_alpha = _ewm_alpha(9)
+    macd_signal = lfilter([signal_alpha], [1.0, signal_alpha - 1.0], macd, axis=0)
+
+    # RSI: the first bar of each symbol has no previous close, so its change
+    # counts as zero.
+    delta = np.diff(closes, axis=0)[-RSI_PERIOD:]
+    delta[bar_offset[1:][-RSI_PERIOD:] <= 0] = 0.0
+    gain = np.where(delta > 0, delta, 0.0).sum(axis=0)
+    loss = np.where(delta < 0, -delta, 0.0).sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = np.where(counts >= RSI_PERIOD, 100 - (100 / (1 + gain / loss)), np.nan)
+
+    has_bands = counts >= BAND_WINDOW
+    middle = np.full(symbols, np.nan)
+    std_dev = np.full(symbols, np.nan)
+    volume_ratio = np.full(symbols, np.nan)
+    if length >= BAND_WINDOW:
+        recent = closes[-BAND_WINDOW:, has_bands]
+        middle[has_bands] = recent.mean(axis=0)
+        std_dev[has_bands] = recent.std(axis=0, ddof=1)
+        volume_ratio[has_bands] = volumes[-1, has_bands] / volumes[
+            -BAND_WINDOW:, has_bands
+        ].mean(axis=0)
+
+    # find_peaks and its distance filter are sequential, so the trendline is
+    # still fitted one symbol at a time on contiguous rows of the panel.
+    highs_by_symbol = np.ascontiguousarray(highs.T)
+    closes_by_symbol = np.ascontiguousarray(closes.T)
+    trendline_fields = np.full((symbols, 4), np.nan)
+    analysed = np.zeros(symbols, dtype=bool)
+    for j in np.flatnonzero(has_bars):
+        try:
+            fields = _trendline_fields(
+                highs_by_symbol[j, starts[j] :], closes_by_symbol[j, starts[j] :]
+            )
+        except ValueError:
+            continue
+        analysed[j] = True
+        trendline_fields[j] = [np.nan if f is None else f for f in fields]
+
+    results = pd.DataFrame(
+        {
+            "stock_symbol": close.columns,
+            "date": end_date,
+            "close_price": closes[-1],
+            "trendline_value": trendline_fields[:, 0],
+            "breakout_percentage": trendline_fields[:, 1],
+            "consecutive_days_above": trendline_fields[:, 2],
+            "trendline_accuracy": trendline_fields[:, 3],
+            "rsi": rsi,
+            "macd_value": macd[-1],
+            "macd_signal": macd_signal[-1],
+            "bollinger_upper": middle + 2 * std_dev,
+            "bollinger_middle": middle,
+            "bollinger_lower": middle - 2 * std_dev,
+            "volume": volumes[-1],
+            "volume_ratio": volume_ratio,
+            "9EMA": emas[9][-1],
+            "12EMA": emas[12][-1],
+            "21EMA": emas[21][-1],
+            "50EMA": emas[50][-1],
+            "analysis_period": period * 30,
+        },
+        index=close.columns,
+    )
+    return results[analysed]
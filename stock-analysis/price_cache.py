@@ -0,0 +1,217 @@
+import json
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+PRICE_FIELDS = ("Open", "High", "Low", "Close", "Adj Close", "Volume")
+BAR_DTYPE = np.dtype(
+    [("date", "datetime64[D]")]
+    + [(field, "i8" if field == "Volume" else "f8") for field in PRICE_FIELDS]
+)
+
+
+def _coverage(meta: Optional[dict]) -> List[List[str]]:
+    """Covered [start, end) date ranges of a sidecar, oldest first."""
+    if meta is None:
+        return []
+    if "ranges" in meta:
+        return [list(covered) for covered in meta["ranges"]]
+    # Sidecars written before coverage could have gaps hold a single range
+    return [[meta["start"], meta["end"]]] if meta["start"] < meta["end"] else []
+
+
+class PriceCache:
+    """
+    On-disk daily OHLCV cache with one memory-mappable .npy file per symbol.
+
+    Next to each file a small JSON sidecar records the date ranges that have
+    been fetched from the provider, as sorted disjoint [start, end) ranges,
+    so a later request only downloads the parts of its range outside them.
+    A download that returned no bars (the provider's answer to unknown
+    symbols and transient errors alike) adds no coverage, and coverage never
+    extends past today, so a partial bar for the current session is
+    refreshed on the next top-up.
+    """
+
+    def __init__(self, directory: str, max_age_days: Optional[int] = None):
+        """
+        Parameters:
+        - directory: Folder holding the cache files, created if needed.
+        - max_age_days: Entries not topped up for longer than this are
+          discarded on access and by evict_stale. None keeps them forever.
+        """
+        self.directory = directory
+        self.max_age_days = max_age_days
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional["PriceCache"]:
+        """Cache configured by PRICE_CACHE_DIR / PRICE_CACHE_MAX_AGE_DAYS, if set."""
+        directory = os.getenv("PRICE_CACHE_DIR")
+        if not directory:
+            return None
+        max_age = os.getenv("PRICE_CACHE_MAX_AGE_DAYS")
+        return cls(directory, int(max_age) if max_age else None)
+
+    def _path(self, stock_symbol: str, extension: str) -> str:
+        safe_symbol = stock_symbol.replace(os.sep, "_")
+        return os.path.join(self.directory, f"{safe_symbol}.{extension}")
+
+    def _load_meta(self, stock_symbol: str) -> Optional[dict]:
+        try:
+            with open(self._path(stock_symbol, "json")) as meta_file:
+                meta = json.load(meta_file)
+        except FileNotFoundError:
+            return None
+        if self._is_stale(meta):
+            self.invalidate(stock_symbol)
+            return None
+        return meta
+
+    def _is_stale(self, meta: dict) -> bool:
+        if self.max_age_days is None:
+            return False
+        updated_at = datetime.fromisoformat(meta["updated_at"])
+        return datetime.now() - updated_at > timedelta(days=self.max_age_days)
+
+    def _load_bars(self, stock_symbol: str) -> np.ndarray:
+        try:
+            return np.load(self._path(stock_symbol, "npy"), mmap_mode="r")
+        except FileNotFoundError:
+            return np.empty(0, dtype=BAR_DTYPE)
+
+    def missing_ranges(
+        self, stock_symbol: str, start_date: str, end_date: str
+    ) -> List[Tuple[str, str]]:
+        """Date ranges in [start_date, end_date) not yet fetched for the symbol."""
+        meta = self._load_meta(stock_symbol)
+        ranges = []
+        cursor = start_date
+        for covered_start, covered_end in _coverage(meta):
+            if covered_start >= end_date:
+                break
+            if covered_end <= cursor:
+                continue
+            if covered_start > cursor:
+                ranges.append((cursor, covered_start))
+            cursor = covered_end
+        if cursor < end_date:
+            ranges.append((cursor, end_date))
+        return ranges
+
+    def store(self, stock_symbol: str, data, start_date: str, end_date: str):
+        """
+        Merge freshly downloaded bars for [start_date, end_date) into the cache.
+
+        Downloaded bars replace cached bars on the same dates. An empty
+        download changes nothing, so the range is requested again next time.
+        """
+        if not len(data):
+            return
+        meta = self._load_meta(stock_symbol)
+        existing = self._load_bars(stock_symbol) if meta else None
+
+        fresh = np.empty(len(data), dtype=BAR_DTYPE)
+        fresh["date"] = pd.DatetimeIndex(data.index).values.astype("datetime64[D]")
+        for field in PRICE_FIELDS:
+            values = data[field].to_numpy()
+            if field == "Volume":
+                values = np.nan_to_num(values).astype("i8")
+            fresh[field] = values
+        if existing is not None and len(existing):
+            keep = ~np.isin(existing["date"], fresh["date"])
+            bars = np.concatenate([existing[keep], fresh])
+            bars = bars[np.argsort(bars["date"], kind="stable")]
+        else:
+            bars = fresh
+
+        coverage = _coverage(meta)
+        covered_end = min(end_date, date.today().isoformat())
+        if start_date < covered_end:
+            coverage.append([start_date, covered_end])
+        merged: List[List[str]] = []
+        for covered_start, covered_end in sorted(coverage):
+            if merged and covered_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], covered_end)
+            else:
+                merged.append([covered_start, covered_end])
+        self._write(
+            stock_symbol,
+            bars,
+            {
+                "ranges": merged,
+                "updated_at": datetime.now().isoformat(timespec="seconds"),
+            },
+        )
+
+    def _write(self, stock_symbol: str, bars: np.ndarray, meta: dict):
+        # Write to temporary files first so readers never see a partial file
+        bars_path = self._path(stock_symbol, "npy")
+        meta_path = self._path(stock_symbol, "json")
+        with open(bars_path + ".tmp", "wb") as bars_file:
+            np.save(bars_file, bars)
+        with open(meta_path + ".tmp", "w") as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(bars_path + ".tmp", bars_path)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def read(self, stock_symbol: str, start_date: str, end_date: str):
+        """Cached bars in [start_date, end_date) as a yfinance-style DataFrame."""
+        bars = self._load_bars(stock_symbol)
+        first, last = np.searchsorted(
+            bars["date"],
+            [np.datetime64(start_date, "D"), np.datetime64(end_date, "D")],
+        )
+        window = bars[first:last]
+        index = pd.DatetimeIndex(window["date"].astype("datetime64[ns]"), name="Date")
+        return pd.DataFrame(
+            {field: window[field] for field in PRICE_FIELDS}, index=index, copy=False
+        )
+
+    def get(
+        self,
+        stock_symbol: str,
+        start_date: str,
+        end_date: str,
+        download: Callable[..., Any],
+    ):
+        """
+        Bars in [start_date, end_date), downloading only the uncovered parts.
+
+        download is called like yf.download(symbol, start=..., end=...).
+        """
+        for missing_start, missing_end in self.missing_ranges(
+            stock_symbol, start_date, end_date
+        ):
+            data = download(stock_symbol, start=missing_start, end=missing_end)
+            self.store(stock_symbol, data, missing_start, missing_end)
+        return self.read(stock_symbol, start_date, end_date)
+
+    def invalidate(self, stock_symbol: str):
+        """Drop a symbol from the cache, e.g. after a split rewrote its history."""
+        for extension in ("npy", "json"):
+            try:
+                os.remove(self._path(stock_symbol, extension))
+            except FileNotFoundError:
+                pass
+
+    def evict_stale(self, max_age_days: Optional[int] = None) -> List[str]:
+        """Remove entries not topped up within max_age_days and return their symbols."""
+        max_age_days = self.max_age_days if max_age_days is None else max_age_days
+        if max_age_days is None:
+            return []
+        cutoff = datetime.now() - timedelta(days=max_age_days)
+        evicted = []
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(".json"):
+                continue
+            stock_symbol = file_name[: -len(".json")]
+            with open(os.path.join(self.directory, file_name)) as meta_file:
+                updated_at = datetime.fromisoformat(json.load(meta_file)["updated_at"])
+            if updated_at < cutoff:
+                self.invalidate(stock_symbol)
+                evicted.append(stock_symbol)
+        return evicted
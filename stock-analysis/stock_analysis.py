@@ -1,12 +1,50 @@
-from datetime import datetime, timedelta
-from typing import Tuple, Dict, Any, Optional
-import yfinance as yf
+import logging
+import threading
+from datetime import datetime
+from typing import Tuple, Dict, Any, Optional, List, Callable, Iterable, NamedTuple
 import numpy as np
-from scipy.signal import find_peaks
-
-
-def fetch_stock_data(stock_symbol: str, start_date: str, end_date: str):
-    data = yf.download(stock_symbol, start=start_date, end=end_date)
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from price_cache import PriceCache
+from instrumentation import configure_logging, metrics, timed
+from analysis_records import analysis_records, max_price_records
+from trading_calendar import TradingCalendar, default_calendar, months_before
+
+# yfinance and scipy.signal take about half a second to import, so they are
+# imported in the functions using them and the CLI starts without them
+
+logger = logging.getLogger(__name__)
+
+# yf.download collects its results in the module-global yfinance.shared._DFS,
+# which every call resets, so concurrent calls lose each other's symbols
+_DOWNLOAD_LOCK = threading.Lock()
+
+
+def _download(*args, **kwargs):
+    """yf.download, one call at a time across threads."""
+    import yfinance as yf
+
+    with _DOWNLOAD_LOCK:
+        return yf.download(*args, **kwargs)
+
+
+@timed("fetch.symbol")
+def fetch_stock_data(
+    stock_symbol: str,
+    start_date: str,
+    end_date: str,
+    cache: Optional[PriceCache] = None,
+):
+    """
+    Fetch daily bars, served from the price cache when one is given or
+    configured through PRICE_CACHE_DIR.
+    """
+    if cache is None:
+        cache = PriceCache.from_env()
+    if cache is not None:
+        data = cache.get(stock_symbol, start_date, end_date, _download)
+    else:
+        data = _download(stock_symbol, start=start_date, end=end_date)
     if data.empty:
         raise ValueError(
             f"No data found for {stock_symbol}. Check the symbol or dates."
@@ -14,7 +52,128 @@ def fetch_stock_data(stock_symbol: str, start_date: str, end_date: str):
     return data
 
 
+@timed("fetch.batch")
+def fetch_stock_data_batch(
+    stock_symbols: List[str],
+    start_date: str,
+    end_date: str,
+    chunk_size: int = 100,
+    download: Optional[Callable[..., Any]] = None,
+    cache: Optional[PriceCache] = None,
+) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Fetch several symbols with one multi-ticker download per chunk.
+
+    Parameters:
+    - stock_symbols: Symbols to fetch.
+    - start_date, end_date: Date range in "YYYY-MM-DD" format, as for fetch_stock_data.
+    - chunk_size: Number of symbols requested per download.
+    - download: Callable with the yf.download signature, default yf.download
+      (serialised across threads).
+    - cache: Price cache to serve from; defaults to PriceCache.from_env().
+      Symbols needing the same top-up are downloaded together.
+
+    Returns:
+    - Dict mapping each symbol with data to its own frame, and the list of
+      symbols for which no data was returned. The per-symbol frames are
+      built from views of the combined download (or of the cache files), so
+      the price arrays are not copied.
+    """
+    if download is None:
+        download = _download
+    if cache is None:
+        cache = PriceCache.from_env()
+    if cache is None:
+        return _download_batch(
+            stock_symbols, start_date, end_date, chunk_size, download
+        )
+
+    top_ups: Dict[Tuple[Tuple[str, str], ...], List[str]] = {}
+    for symbol in stock_symbols:
+        ranges = tuple(cache.missing_ranges(symbol, start_date, end_date))
+        if ranges:
+            top_ups.setdefault(ranges, []).append(symbol)
+    for ranges, symbols in top_ups.items():
+        for range_start, range_end in ranges:
+            fetched, _ = _download_batch(
+                symbols, range_start, range_end, chunk_size, download
+            )
+            # Symbols the download had nothing for stay uncovered
+            for symbol, frame in fetched.items():
+                cache.store(symbol, frame, range_start, range_end)
+
+    frames = {}
+    missing = []
+    for symbol in stock_symbols:
+        frame = cache.read(symbol, start_date, end_date)
+        if frame.empty:
+            missing.append(symbol)
+        else:
+            frames[symbol] = frame
+    metrics.count(
+        "fetch.cached_symbols",
+        len(stock_symbols) - sum(len(symbols) for symbols in top_ups.values()),
+    )
+    return frames, missing
+
+
+def _download_batch(
+    stock_symbols: List[str],
+    start_date: str,
+    end_date: str,
+    chunk_size: int,
+    download: Callable[..., Any],
+) -> Tuple[Dict[str, Any], List[str]]:
+    frames = {}
+    missing = []
+    for chunk_start in range(0, len(stock_symbols), chunk_size):
+        chunk = stock_symbols[chunk_start : chunk_start + chunk_size]
+        with metrics.timer("fetch.download"):
+            combined = download(
+                chunk, start=start_date, end=end_date, group_by="ticker"
+            )
+        metrics.count("fetch.downloaded_symbols", len(chunk))
+        for symbol in chunk:
+            frame = _split_symbol_frame(combined, symbol)
+            if frame is None:
+                missing.append(symbol)
+            else:
+                frames[symbol] = frame
+    return frames, missing
+
+
+def _split_symbol_frame(combined, symbol: str):
+    """
+    Take one symbol's columns out of a multi-ticker download without copying,
+    trimmed to the dates on which it traded. Returns None if it has no data.
+    """
+    if combined is None or combined.empty:
+        return None
+    if isinstance(combined.columns, pd.MultiIndex):
+        fields = [field for key, field in combined.columns if key == symbol]
+        if not fields:
+            return None
+        frame = pd.DataFrame(
+            {field: combined[(symbol, field)] for field in fields}, copy=False
+        )
+    else:
+        # A single-ticker download comes back without the symbol level
+        frame = combined
+
+    # Other symbols in the chunk may have traded before this one was listed
+    # or after it was delisted; positional slicing keeps the views intact.
+    traded = frame["Close"].notna().to_numpy()
+    if not traded.any():
+        return None
+    first = int(np.argmax(traded))
+    last = len(traded) - int(np.argmax(traded[::-1]))
+    return frame.iloc[first:last]
+
+
+@timed("trendline.peaks")
 def get_peak_indices(data, distance: int = 5) -> Tuple[np.ndarray, int]:
+    from scipy.signal import find_peaks
+
     highs = data["High"][:-1]  # Exclude the last day for peak calculation
     peaks, _ = find_peaks(highs, distance=distance)
     if len(peaks) == 0:
@@ -23,28 +182,58 @@ def get_peak_indices(data, distance: int = 5) -> Tuple[np.ndarray, int]:
     return peaks, highest_peak
 
 
+def _best_slopes(
+    highs: np.ndarray, peaks: np.ndarray, anchors: np.ndarray
+) -> np.ndarray:
+    """Steepest slope from each anchor peak to any later peak, -inf if there is none."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slopes = (highs[peaks] - highs[anchors][:, None]) / (peaks - anchors[:, None])
+    slopes = np.where(peaks > anchors[:, None], slopes, -np.inf)
+    return slopes.max(axis=1, initial=-np.inf)
+
+
+@timed("trendline.fit")
 def calculate_trendline(
     data, peaks: np.ndarray, highest_peak: int
 ) -> np.ndarray | None:
-    highs = data["High"][:-1]
-    x1, y1 = highest_peak, highs.iloc[highest_peak]
-    best_slope = -np.inf
-
-    for x2 in peaks[peaks > highest_peak]:
-        y2 = highs.iloc[x2]
-        slope = (y2 - y1) / (x2 - x1)
-        if slope > best_slope:
-            best_slope = slope
+    highs = data["High"].to_numpy()[:-1]
+    best_slope = _best_slopes(highs, peaks, np.array([highest_peak]))[0]
 
     if best_slope == -np.inf:
         # raise ValueError("Unable to calculate a valid trendline slope.")
         return None
 
-    b = y1 - best_slope * x1
+    b = highs[highest_peak] - best_slope * highest_peak
     trendline = best_slope * np.arange(len(data)) + b
     return trendline
 
 
+@timed("trendline.fit_top_k")
+def calculate_trendlines(
+    data, peaks: np.ndarray, top_k: int = 3
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fit trendlines anchored at each of the top_k highest peaks in one batch.
+
+    Each anchor gets the steepest line to a later peak, as calculate_trendline
+    does for the highest peak alone.
+
+    Returns:
+    - anchors: Peak positions used as anchors, highest first.
+    - trendlines: Array of shape (len(anchors), len(data)), with a row of NaN
+      for an anchor that has no later peak.
+    """
+    highs = data["High"].to_numpy()[:-1]
+    order = np.argsort(-highs[peaks], kind="stable")
+    anchors = peaks[order[:top_k]]
+    slopes = _best_slopes(highs, peaks, anchors)
+    slopes[np.isneginf(slopes)] = np.nan
+    intercepts = highs[anchors] - slopes * anchors
+    trendlines = slopes[:, None] * np.arange(len(data)) + intercepts[:, None]
+    return anchors, trendlines
+
+
+@timed("trendline.accuracy")
 def calculate_trendline_accuracy(
     data, peaks: np.ndarray, trendline: np.ndarray | None
 ) -> int | None:
@@ -74,6 +263,7 @@ def consecutive_days_above_trendline(data, trendline: np.ndarray) -> int | None:
     return above_trend[::-1].cumprod().sum()
 
 
+@timed("indicators.rsi")
 def calculate_rsi(data, period: int = 14) -> float:
     delta = data["Close"].diff(1)
     gain = delta.where(delta > 0, 0).rolling(window=period).mean()
@@ -83,6 +273,7 @@ def calculate_rsi(data, period: int = 14) -> float:
     return rsi.iloc[-1]
 
 
+@timed("indicators.macd")
 def calculate_macd(data) -> Tuple[float, float]:
     short_ema = data["Close"].ewm(span=12, adjust=False).mean()
     long_ema = data["Close"].ewm(span=26, adjust=False).mean()
@@ -91,6 +282,7 @@ def calculate_macd(data) -> Tuple[float, float]:
     return macd.iloc[-1], signal.iloc[-1]
 
 
+@timed("indicators.bollinger")
 def calculate_bollinger_bands(data, window: int = 20) -> Tuple[float, float, float]:
     middle_band = data["Close"].rolling(window=window).mean()
     std_dev = data["Close"].rolling(window=window).std()
@@ -99,6 +291,7 @@ def calculate_bollinger_bands(data, window: int = 20) -> Tuple[float, float, flo
     return upper_band.iloc[-1], middle_band.iloc[-1], lower_band.iloc[-1]
 
 
+@timed("indicators.ema")
 def calculate_emas(data) -> Dict[str, float]:
     ema_values = {
         "9EMA": data["Close"].ewm(span=9, adjust=False).mean().iloc[-1],
@@ -109,11 +302,125 @@ def calculate_emas(data) -> Dict[str, float]:
     return ema_values
 
 
+@timed("indicators.volume_ratio")
 def volume_spike(data, window: int = 20) -> float:
     avg_volume = data["Volume"].rolling(window=window).mean()
     return data["Volume"].iloc[-1] / avg_volume.iloc[-1]
 
 
+def analysis_window_start(end_date: str, period: int = 3) -> str:
+    """First date of the analysis window of `period` months ending on end_date."""
+    return str(months_before(end_date, period))
+
+
+class IndicatorRecord(NamedTuple):
+    """Indicator values for the last bar of a window, as computed by indicator_kernel."""
+
+    close_price: float
+    trendline_value: Optional[float]
+    breakout_percentage: Optional[float]
+    consecutive_days_above: Optional[int]
+    trendline_accuracy: Optional[int]
+    rsi: float
+    macd_value: float
+    macd_signal: float
+    bollinger_upper: float
+    bollinger_middle: float
+    bollinger_lower: float
+    volume: Any
+    volume_ratio: float
+    ema_9: float
+    ema_12: float
+    ema_21: float
+    ema_50: float
+
+    def as_result(self) -> Dict[str, Any]:
+        """Fields keyed like the analyse_stock result."""
+        result = self._asdict()
+        for span in (9, 12, 21, 50):
+            result[f"{span}EMA"] = result.pop(f"ema_{span}")
+        return result
+
+
+def _ewm_seeded(values: np.ndarray, span: int) -> np.ndarray:
+    """Full adjust=False EMA series of `values`, seeded with the first value."""
+    from scipy.signal import lfilter
+
+    alpha = _ewm_alpha(span)
+    ema, _ = lfilter(
+        [alpha], [1.0, alpha - 1.0], values, zi=[(1.0 - alpha) * values[0]]
+    )
+    return ema
+
+
+@timed("indicators.kernel")
+def indicator_kernel(
+    close: np.ndarray,
+    high: np.ndarray,
+    volume: np.ndarray,
+    rsi_period: int = 14,
+    band_window: int = 20,
+) -> IndicatorRecord:
+    """
+    Every analyse_stock indicator for the last bar of one window in a single pass.
+
+    Works on plain arrays so the columns are read once. Each EMA span is run
+    once and shared between the EMA fields and MACD, and the Bollinger mean
+    and standard deviation come from the same slice of the last band_window
+    closes. Raises ValueError like get_peak_indices when there are no peaks.
+    """
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    high = np.ascontiguousarray(high, dtype=np.float64)
+    trendline_value, breakout, consecutive, accuracy = _trendline_fields(high, close)
+    lap = metrics.stopwatch("indicators")
+
+    # RSI: mean gain and loss over the last rsi_period changes. The first bar
+    # has no previous close, so a window of exactly rsi_period bars counts a
+    # zero change for it.
+    rsi = np.float64(np.nan)
+    if len(close) >= rsi_period:
+        delta = np.diff(close[-(rsi_period + 1) :])
+        gain = delta[delta > 0].sum()
+        loss = -delta[delta < 0].sum()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi = 100 - (100 / (1 + gain / loss))
+    lap("rsi")
+
+    middle = std_dev = volume_ratio = np.float64(np.nan)
+    if len(close) >= band_window:
+        recent = close[-band_window:]
+        middle = recent.mean()
+        std_dev = np.sqrt(((recent - middle) ** 2).sum() / (band_window - 1))
+        volume_ratio = volume[-1] / volume[-band_window:].mean(dtype=np.float64)
+    lap("bollinger_volume")
+
+    emas = {span: _ewm_seeded(close, span) for span in (9, 12, 21, 26, 50)}
+    macd = emas[12] - emas[26]
+    macd_signal = _ewm_seeded(macd, 9)[-1]
+    lap("ema_macd")
+
+    return IndicatorRecord(
+        close_price=float(close[-1]),
+        trendline_value=trendline_value,
+        breakout_percentage=breakout,
+        consecutive_days_above=consecutive,
+        trendline_accuracy=accuracy,
+        rsi=rsi,
+        macd_value=macd[-1],
+        macd_signal=macd_signal,
+        bollinger_upper=middle + 2 * std_dev,
+        bollinger_middle=middle,
+        bollinger_lower=middle - 2 * std_dev,
+        volume=volume[-1],
+        volume_ratio=volume_ratio,
+        ema_9=emas[9][-1],
+        ema_12=emas[12][-1],
+        ema_21=emas[21][-1],
+        ema_50=emas[50][-1],
+    )
+
+
+@timed("analysis.stock")
 def analyse_stock(
     stock_symbol: str, end_date: Optional[str] = None, period: int = 3, data=None
 ) -> Dict[str, Any]:
@@ -122,42 +429,400 @@ def analyse_stock(
         end_date = datetime.today().strftime("%Y-%m-%d")
 
     if data is None:
-        end_date_dt = datetime.strptime(end_date, "%Y-%m-%d")
-        start_date_dt = end_date_dt - timedelta(days=period * 30)
-        start_date = start_date_dt.strftime("%Y-%m-%d")
+        start_date = analysis_window_start(end_date, period)
         data = fetch_stock_data(stock_symbol, start_date, end_date)
 
-    peaks, highest_peak = get_peak_indices(data)
-    trendline = calculate_trendline(data, peaks, highest_peak)
-    accuracy = calculate_trendline_accuracy(data, peaks, trendline)
-    ema_values = calculate_emas(data)
-
-    results = {
-        "stock_symbol": stock_symbol,
-        "date": end_date,
-        "close_price": float(data["Close"].iloc[-1]),
-        "trendline_value": float(trendline[-1]) if trendline is not None else None,
-        "breakout_percentage": breakout_percentage(data, trendline),
-        "consecutive_days_above": consecutive_days_above_trendline(data, trendline),
-        "trendline_accuracy": accuracy,
-        "rsi": calculate_rsi(data),
-        "macd_value": calculate_macd(data)[0],
-        "macd_signal": calculate_macd(data)[1],
-        "bollinger_upper": calculate_bollinger_bands(data)[0],
-        "bollinger_middle": calculate_bollinger_bands(data)[1],
-        "bollinger_lower": calculate_bollinger_bands(data)[2],
-        "volume": data["Volume"].iloc[-1],
-        "volume_ratio": volume_spike(data),
-        "9EMA": ema_values["9EMA"],
-        "12EMA": ema_values["12EMA"],
-        "21EMA": ema_values["21EMA"],
-        "50EMA": ema_values["50EMA"],
-        "analysis_period": period * 30,
+    record = indicator_kernel(
+        data["Close"].to_numpy(), data["High"].to_numpy(), data["Volume"].to_numpy()
+    )
+    results = {"stock_symbol": stock_symbol, "date": end_date}
+    results.update(record.as_result())
+    results["analysis_period"] = period * 30
+    return results
+
+
+# Result fields that are None when no trendline could be fitted for a window.
+TRENDLINE_FIELDS = (
+    "trendline_value",
+    "breakout_percentage",
+    "consecutive_days_above",
+    "trendline_accuracy",
+)
+
+
+def _ewm_alpha(span: int) -> float:
+    return 2.0 / (span + 1.0)
+
+
+def _ewm_unseeded(values: np.ndarray, span: int) -> np.ndarray:
+    """Run the adjust=False EMA recursion over `values` starting from zero."""
+    from scipy.signal import lfilter
+
+    alpha = _ewm_alpha(span)
+    return lfilter([alpha], [1.0, alpha - 1.0], values)
+
+
+def _seeded_ema(unseeded_end, start_value, unseeded_start, steps, span: int):
+    """
+    EMA `steps` bars after a series start, as if the series had been sliced
+    to begin there.
+
+    An adjust=False EMA seeded with the start value differs from the unseeded
+    one by (start_value - unseeded_start) decayed by (1 - alpha) per bar, so
+    any window can be read off a single full-history pass. Works on scalars
+    and arrays alike.
+    """
+    decay = (1.0 - _ewm_alpha(span)) ** steps
+    return unseeded_end + decay * (start_value - unseeded_start)
+
+
+def _seeded_macd_signal(
+    signal_end, signal_start, start_value, short_start, long_start, steps
+):
+    """
+    MACD signal line `steps` bars after a series start.
+
+    `signal_*` are the unseeded 9-span EMA of (short - long unseeded EMAs) and
+    `short_start`/`long_start` the unseeded 12 and 26-span EMAs at the start.
+    The seeded MACD adds two geometric terms to that difference; their
+    contribution to the signal EMA has a closed form.
+    """
+    short_decay = 1.0 - _ewm_alpha(12)
+    long_decay = 1.0 - _ewm_alpha(26)
+    signal_alpha = _ewm_alpha(9)
+    signal_decay = 1.0 - signal_alpha
+
+    def geometric(decay: float):
+        # sum_{j=1..steps} signal_decay**(steps - j) * decay**j
+        return decay * (signal_decay**steps - decay**steps) / (signal_decay - decay)
+
+    return (
+        signal_end
+        - signal_decay**steps * signal_start
+        + signal_alpha
+        * (
+            (start_value - short_start) * geometric(short_decay)
+            - (start_value - long_start) * geometric(long_decay)
+        )
+    )
+
+
+def _fit_trendline(
+    highs: np.ndarray, distance: int = 5
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Peaks of one window and the trendline through its highest peak, on plain
+    arrays as get_peak_indices and calculate_trendline compute them. The
+    trendline is None if no later peak gives it a slope.
+    """
+    from scipy.signal import find_peaks
+
+    peaks, _ = find_peaks(highs[:-1], distance=distance)
+    if len(peaks) == 0:
+        raise ValueError("No peaks found in the data.")
+    highest_peak = peaks[np.argmax(highs[peaks])]
+    best_slope = _best_slopes(highs, peaks, np.array([highest_peak]))[0]
+    if best_slope == -np.inf:
+        return peaks, None
+
+    y1 = highs[highest_peak]
+    trendline = best_slope * np.arange(len(highs)) + (y1 - best_slope * highest_peak)
+    return peaks, trendline
+
+
+def _peak_deviations(
+    highs: np.ndarray, peaks: np.ndarray, trendline: np.ndarray
+) -> np.ndarray:
+    """Relative distance of each peak from the trendline, as judged by the accuracy."""
+    trendline_at_peaks = trendline[peaks]
+    return np.abs((highs[peaks] - trendline_at_peaks) / trendline_at_peaks)
+
+
+@timed("trendline.fit")
+def _trendline_fields(
+    highs: np.ndarray,
+    closes: np.ndarray,
+    distance: int = 5,
+    tolerance: float = 0.02,
+) -> Tuple[Optional[float], Optional[float], Optional[int], Optional[int]]:
+    """
+    Trendline value, breakout percentage, consecutive days above and accuracy
+    for one window, computed on plain arrays. Mirrors get_peak_indices,
+    calculate_trendline and friends.
+    """
+    peaks, trendline = _fit_trendline(highs, distance)
+    if trendline is None:
+        return None, None, None, None
+
+    within_tolerance = _peak_deviations(highs, peaks, trendline) <= tolerance
+    accuracy = int(np.mean(within_tolerance) * 100)
+    breakout = (closes[-1] - trendline[-1]) / trendline[-1] * 100
+    consecutive = np.cumprod((closes > trendline)[::-1]).sum()
+    return float(trendline[-1]), breakout, consecutive, accuracy
+
+
+def analysis_windows(
+    index: pd.DatetimeIndex,
+    period: int = 3,
+    start_date: Optional[str] = None,
+    skip_dates: Optional[Iterable] = None,
+    calendar: Optional[TradingCalendar] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    First and last bar positions of the analysis window of every trading
+    session (per calendar, default default_calendar()) whose window starts
+    on or after start_date (default the first date), leaving out skip_dates.
+    Windows span the same `period` calendar months as analyse_stock's,
+    data.loc[months_before(day, period) : day].
+    """
+    days = np.asarray(index, dtype="datetime64[D]")
+    if calendar is None:
+        calendar = default_calendar()
+    origin = days[0] if start_date is None else np.datetime64(start_date, "D")
+    window_starts = months_before(days, period)
+    analysed_days = (window_starts >= origin) & calendar.is_session(days)
+    if skip_dates is not None:
+        analysed_days &= ~np.isin(days, np.array(list(skip_dates), "datetime64[D]"))
+    ends = np.flatnonzero(analysed_days)
+    starts = days.searchsorted(window_starts[ends], side="left")
+    return starts, ends
+
+
+def window_rsi(
+    close: np.ndarray, starts: np.ndarray, ends: np.ndarray, rsi_period: int = 14
+) -> np.ndarray:
+    """
+    RSI at the end of each window, from rolling rsi_period-bar means of gains
+    and losses. The first bar of each window has no previous close, so its
+    change counts as zero. NaN for windows shorter than rsi_period.
+    """
+    lengths = ends - starts + 1
+    delta = np.diff(close, prepend=np.nan)
+    gains = np.where(delta > 0, delta, 0.0)
+    losses = np.where(delta < 0, -delta, 0.0)
+    rsi = np.full(len(ends), np.nan)
+    has_rsi = (lengths >= rsi_period) & (ends >= rsi_period - 1)
+    if len(close) >= rsi_period:
+        gain_sums = sliding_window_view(gains, rsi_period).sum(axis=1)
+        loss_sums = sliding_window_view(losses, rsi_period).sum(axis=1)
+        rsi_ends = ends[has_rsi]
+        rsi_starts = starts[has_rsi]
+        first_in_window = rsi_starts == rsi_ends - (rsi_period - 1)
+        gain = (
+            gain_sums[rsi_ends - (rsi_period - 1)]
+            - np.where(first_in_window, gains[rsi_starts], 0.0)
+        ) / rsi_period
+        loss = (
+            loss_sums[rsi_ends - (rsi_period - 1)]
+            - np.where(first_in_window, losses[rsi_starts], 0.0)
+        ) / rsi_period
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi[has_rsi] = 100 - (100 / (1 + gain / loss))
+    return rsi
+
+
+def window_bands(
+    close: np.ndarray,
+    volume: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    band_window: int = 20,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Bollinger middle band, standard deviation and average volume over the
+    last band_window bars of each window; NaN for shorter windows. They do
+    not depend on where a window starts once it holds band_window bars.
+    """
+    has_bands = ends - starts + 1 >= band_window
+    middle = np.full(len(ends), np.nan)
+    std_dev = np.full(len(ends), np.nan)
+    avg_volume = np.full(len(ends), np.nan)
+    if len(close) >= band_window:
+        close_windows = sliding_window_view(close, band_window)
+        volume_windows = sliding_window_view(volume.astype(np.float64), band_window)
+        band_ends = ends[has_bands] - (band_window - 1)
+        middle[has_bands] = close_windows[band_ends].mean(axis=1)
+        std_dev[has_bands] = close_windows[band_ends].std(axis=1, ddof=1)
+        avg_volume[has_bands] = volume_windows[band_ends].mean(axis=1)
+    return middle, std_dev, avg_volume
+
+
+def _history_columns(
+    data,
+    period: int,
+    start_date: Optional[str],
+    skip_dates: Optional[Iterable],
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Positions in data of the days analyse_stock_history analyses, and their
+    analyse_stock result keys (bar stock_symbol, date, analysis_period) as
+    columns.
+    """
+    index = pd.DatetimeIndex(data.index)
+    close = data["Close"].to_numpy(dtype=np.float64)
+    high = data["High"].to_numpy(dtype=np.float64)
+    volume = data["Volume"].to_numpy()
+    starts, ends = analysis_windows(index, period, start_date, skip_dates)
+    rsi = window_rsi(close, starts, ends)
+    middle, std_dev, avg_volume = window_bands(close, volume, starts, ends)
+
+    steps = ends - starts
+    emas = {span: _ewm_unseeded(close, span) for span in (9, 12, 21, 26, 50)}
+    ema_values = {
+        span: _seeded_ema(unseeded[ends], close[starts], unseeded[starts], steps, span)
+        for span, unseeded in emas.items()
+    }
+    macd_value = ema_values[12] - ema_values[26]
+    signal = _ewm_unseeded(emas[12] - emas[26], 9)
+    macd_signal = _seeded_macd_signal(
+        signal[ends],
+        signal[starts],
+        close[starts],
+        emas[12][starts],
+        emas[26][starts],
+        steps,
+    )
+
+    trendline_fields = np.full((len(ends), 4), np.nan)
+    analysed = np.zeros(len(ends), dtype=bool)
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        try:
+            fields = _trendline_fields(high[start : end + 1], close[start : end + 1])
+        except ValueError:
+            continue
+        analysed[i] = True
+        trendline_fields[i] = [np.nan if f is None else f for f in fields]
+
+    columns = {
+        "close_price": close[ends],
+        "trendline_value": trendline_fields[:, 0],
+        "breakout_percentage": trendline_fields[:, 1],
+        "consecutive_days_above": trendline_fields[:, 2],
+        "trendline_accuracy": trendline_fields[:, 3],
+        "rsi": rsi,
+        "macd_value": macd_value,
+        "macd_signal": macd_signal,
+        "bollinger_upper": middle + 2 * std_dev,
+        "bollinger_middle": middle,
+        "bollinger_lower": middle - 2 * std_dev,
+        "volume": volume[ends],
+        "volume_ratio": volume[ends] / avg_volume,
+        "9EMA": ema_values[9],
+        "12EMA": ema_values[12],
+        "21EMA": ema_values[21],
+        "50EMA": ema_values[50],
     }
+    return ends[analysed], {key: values[analysed] for key, values in columns.items()}
+
+
+@timed("analysis.history")
+def analyse_stock_history(
+    stock_symbol: str,
+    data,
+    start_date: Optional[str] = None,
+    period: int = 3,
+    skip_dates: Optional[Iterable] = None,
+) -> pd.DataFrame:
+    """
+    Analyse every trading day of `data` in one pass, as backtest_stocks would.
+
+    Each row matches analyse_stock on data.loc[months_before(day, period) : day]
+    for days whose `period`-month window starts on or after `start_date`
+    (defaults to the first date in `data`), so backtest rows cover the same
+    months as daily rows with the same analysis_period. Indicators come from
+    full-history rolling and recursive passes; only the peak search still
+    runs per window. Days on which
+    analyse_stock would raise (no peaks in the window) are left out, as are
+    skip_dates (e.g. days already stored), which then cost no peak search.
+
+    Returns:
+    - DataFrame with one row per analysed day and the analyse_stock result keys
+      as columns. Missing trendline fields are NaN; see history_to_results.
+    """
+    index = pd.DatetimeIndex(data.index)
+    ends, columns = _history_columns(data, period, start_date, skip_dates)
+    return pd.DataFrame(
+        {
+            "stock_symbol": stock_symbol,
+            "date": index[ends].strftime("%Y-%m-%d"),
+            **columns,
+            "analysis_period": period * 30,
+        },
+        index=index[ends],
+    )
+
+
+@timed("analysis.history")
+def analyse_history_records(
+    stock_id: int,
+    data,
+    start_date: Optional[str] = None,
+    period: int = 3,
+    skip_dates: Optional[Iterable] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    analyse_stock_history straight into stock_analysis records, with the
+    forward max prices of the same days, for backtests that store results
+    without a DataFrame or a dict per day.
+
+    Returns:
+    - ANALYSIS_DTYPE and MAX_PRICE_DTYPE arrays (see analysis_records), one
+      record per analysed day in both.
+    """
+    ends, columns = _history_columns(data, period, start_date, skip_dates)
+    # Local calendar dates, as in analyse_stock_history's date column
+    dates = np.array(
+        pd.DatetimeIndex(data.index)[ends].strftime("%Y-%m-%d"), dtype="datetime64[D]"
+    )
+    max_prices = forward_max_prices(data).to_numpy()[ends]
+    return (
+        analysis_records(stock_id, dates, columns, period),
+        max_price_records(stock_id, dates, max_prices),
+    )
+
+
+MAX_PRICE_HORIZONS = (1, 2, 5, 10, 15, 20)
+
+
+@timed("analysis.max_prices")
+def forward_max_prices(data, horizons: Tuple[int, ...] = MAX_PRICE_HORIZONS):
+    """
+    Highest High over the next N trading days (including the day itself) for
+    every date, for each horizon N.
+
+    Returns:
+    - DataFrame aligned with data.index and one column per horizon, named like
+      the stock_analysis_max_price columns. Values are NaN where the horizon
+      runs past the end of the data.
+    """
+    highs = data["High"].to_numpy(dtype=np.float64)
+    columns = {}
+    for horizon in horizons:
+        name = f"max_price_{horizon}_day" + ("s" if horizon > 1 else "")
+        values = np.full(len(highs), np.nan)
+        if len(highs) >= horizon:
+            values[: len(highs) - horizon + 1] = sliding_window_view(
+                highs, horizon
+            ).max(axis=1)
+        columns[name] = values
+    return pd.DataFrame(columns, index=data.index)
+
+
+def history_to_results(history: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Convert analyse_stock_history output into analyse_stock-style dicts."""
+    results = history.to_dict("records")
+    for result in results:
+        for field in TRENDLINE_FIELDS:
+            if pd.isna(result[field]):
+                result[field] = None
+        if result["consecutive_days_above"] is not None:
+            result["consecutive_days_above"] = int(result["consecutive_days_above"])
+            result["trendline_accuracy"] = int(result["trendline_accuracy"])
     return results
 
 
 if __name__ == "__main__":
+    configure_logging()
     result = analyse_stock("TSLA", period=90)
     for key, value in result.items():
-        print(f"{key}: {value}")
+        logger.info("%s: %s", key, value)
@@ -0,0 +1,356 @@
+"""
+Parameter sweep of the breakout analysis over the trendline and indicator settings.
+
+Every combination of find_peaks distance, trendline accuracy tolerance, RSI
+period and Bollinger window in the grid is scored on the same backtest
+windows against the forward max prices:
+
+    python sweep.py --start 2020-01-01 --days 1095 [--symbols AAPL MSFT ...]
+                    [--distance 3 5 8] [--tolerance 0.01 0.02 0.03]
+                    [--rsi-period 7 14 21] [--band-window 10 20 30]
+                    [--workers N] [--output sweep.csv]
+
+Without --symbols every stock in the database is swept.
+"""
+
+import argparse
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import configure_logging, timed
+from stock_analysis import (
+    MAX_PRICE_HORIZONS,
+    _fit_trendline,
+    _peak_deviations,
+    analysis_windows,
+    fetch_stock_data_batch,
+    forward_max_prices,
+    window_bands,
+    window_rsi,
+)
+
+logger = logging.getLogger(__name__)
+
+# Swept parameters, in the order of the result cube axes
+PARAMETERS = ("distance", "tolerance", "rsi_period", "band_window")
+
+DEFAULT_GRID = {
+    "distance": (3, 5, 8, 13),
+    "tolerance": (0.01, 0.02, 0.03, 0.05),
+    "rsi_period": (7, 14, 21),
+    "band_window": (10, 20, 30),
+}
+
+
+class SignalRule(NamedTuple):
+    """
+    Entry signal each configuration is scored on: a fresh breakout (the
+    first close above the trendline, as breakout_percentage > 0 with
+    consecutive_days_above = 1) with at least min_accuracy % of the peaks
+    near the trendline, RSI below max_rsi and the close above the Bollinger
+    middle band. A signal is a hit for a horizon if the max price over it is
+    at least hit_threshold above the close.
+    """
+
+    min_accuracy: int = 50
+    max_rsi: float = 70.0
+    hit_threshold: float = 0.02
+
+
+class SweepResult:
+    """
+    Outcome statistics per configuration and horizon.
+
+    Arrays have one axis per entry of PARAMETERS (in grid order) and, except
+    for signals, a last axis per horizon. Horizons whose max price runs past
+    the end of the data are not counted.
+    """
+
+    def __init__(
+        self,
+        grid: Dict[str, Sequence],
+        horizons: Sequence[int],
+        signals: np.ndarray,
+        outcomes: np.ndarray,
+        hits: np.ndarray,
+        return_sums: np.ndarray,
+        return_squares: np.ndarray,
+    ):
+        self.grid = {name: tuple(grid[name]) for name in PARAMETERS}
+        self.horizons = tuple(horizons)
+        shape = tuple(len(values) for values in self.grid.values())
+        self.signals = signals.reshape(shape)
+        self.outcomes = outcomes.reshape(shape + (len(self.horizons),))
+        self.hits = hits.reshape(self.outcomes.shape)
+        self.return_sums = return_sums.reshape(self.outcomes.shape)
+        self.return_squares = return_squares.reshape(self.outcomes.shape)
+
+    @property
+    def hit_rate(self) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.hits / self.outcomes
+
+    @property
+    def mean_return(self) -> np.ndarray:
+        """Mean return to the forward max price."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.return_sums / self.outcomes
+
+    @property
+    def return_std(self) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            variance = self.return_squares / self.outcomes - self.mean_return**2
+        return np.sqrt(np.maximum(variance, 0.0))
+
+    def to_frame(self) -> pd.DataFrame:
+        """One row per configuration with its signal count and per-horizon statistics."""
+        configurations = pd.MultiIndex.from_product(
+            self.grid.values(), names=PARAMETERS
+        )
+        columns = {"signals": self.signals.ravel()}
+        for h, horizon in enumerate(self.horizons):
+            columns[f"hit_rate_{horizon}d"] = self.hit_rate[..., h].ravel()
+            columns[f"mean_return_{horizon}d"] = self.mean_return[..., h].ravel()
+            columns[f"return_std_{horizon}d"] = self.return_std[..., h].ravel()
+        return pd.DataFrame(columns, index=configurations).reset_index()
+
+    def best(
+        self, horizon: int = 5, min_signals: int = 30, top: int = 10
+    ) -> pd.DataFrame:
+        """Configurations with at least min_signals signals, by hit rate over horizon."""
+        frame = self.to_frame()
+        frame = frame[frame["signals"] >= min_signals]
+        return frame.sort_values(
+            [f"hit_rate_{horizon}d", f"mean_return_{horizon}d"], ascending=False
+        ).head(top)
+
+
+def _trendline_signals(
+    close: np.ndarray,
+    high: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    distances: Sequence[int],
+    tolerances: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fresh breakouts (distances x windows) and trendline accuracy (distances x
+    tolerances x windows, -1 without a trendline). The peaks and trendline of
+    a window are fitted once per distance and scored for every tolerance.
+    """
+    fresh = np.zeros((len(distances), len(ends)), dtype=bool)
+    accuracy = np.full((len(distances), len(tolerances), len(ends)), -1.0)
+    for d, distance in enumerate(distances):
+        for i, (start, end) in enumerate(zip(starts, ends)):
+            highs = high[start : end + 1]
+            closes = close[start : end + 1]
+            try:
+                peaks, trendline = _fit_trendline(highs, distance)
+            except ValueError:
+                continue
+            if trendline is None:
+                continue
+            above = closes[-2:] > trendline[-2:]
+            breakout = (closes[-1] - trendline[-1]) / trendline[-1]
+            fresh[d, i] = breakout > 0 and above[-1] and not above[:-1].any()
+            within = _peak_deviations(highs, peaks, trendline)[:, None] <= tolerances
+            accuracy[d, :, i] = np.floor(within.mean(axis=0) * 100)
+    return fresh, accuracy
+
+
+def _sweep_symbol(
+    index: pd.DatetimeIndex,
+    close: np.ndarray,
+    high: np.ndarray,
+    volume: np.ndarray,
+    grid: Dict[str, Sequence],
+    period: int,
+    start_date: Optional[str],
+    rule: SignalRule,
+    horizons: Sequence[int],
+) -> Tuple[np.ndarray, ...]:
+    """Flat per-configuration sums for one symbol, as taken by SweepResult."""
+    starts, ends = analysis_windows(index, period, start_date)
+    configurations = int(np.prod([len(grid[name]) for name in PARAMETERS]))
+    if len(ends) == 0:
+        empty = np.zeros((configurations, len(horizons)))
+        return (np.zeros(configurations),) + (empty,) * 4
+
+    # Outcomes only depend on the window end
+    forward = forward_max_prices(pd.DataFrame({"High": high}), tuple(horizons))
+    returns = forward.to_numpy()[ends] / close[ends, None] - 1
+    known = ~np.isnan(returns)
+    returns = np.where(known, returns, 0.0)
+    hit = known & (returns >= rule.hit_threshold)
+
+    fresh, accuracy = _trendline_signals(
+        close, high, starts, ends, grid["distance"], np.asarray(grid["tolerance"])
+    )
+    rsi_ok = np.stack(
+        [
+            window_rsi(close, starts, ends, period) < rule.max_rsi
+            for period in grid["rsi_period"]
+        ]
+    )
+    above_middle = np.stack(
+        [
+            close[ends] > window_bands(close, volume, starts, ends, window)[0]
+            for window in grid["band_window"]
+        ]
+    )
+
+    # (distance, tolerance, rsi_period, band_window, window) signal mask
+    signals = (
+        fresh[:, None, None, None, :]
+        & (accuracy >= rule.min_accuracy)[:, :, None, None, :]
+        & rsi_ok[None, None, :, None, :]
+        & above_middle[None, None, None, :, :]
+    ).reshape(configurations, len(ends))
+    signals = signals.astype(np.float64)
+    return (
+        signals.sum(axis=1),
+        signals @ known,
+        signals @ hit,
+        signals @ returns,
+        signals @ returns**2,
+    )
+
+
+def _sweep_frame(arguments) -> Tuple[np.ndarray, ...]:
+    data, grid, period, start_date, rule, horizons = arguments
+    return _sweep_symbol(
+        pd.DatetimeIndex(data.index),
+        data["Close"].to_numpy(dtype=np.float64),
+        data["High"].to_numpy(dtype=np.float64),
+        data["Volume"].to_numpy(),
+        grid,
+        period,
+        start_date,
+        rule,
+        horizons,
+    )
+
+
+@timed("sweep.frames")
+def parameter_sweep(
+    frames: Dict[str, pd.DataFrame],
+    grid: Optional[Dict[str, Sequence]] = None,
+    period: int = 3,
+    start_date: Optional[str] = None,
+    rule: SignalRule = SignalRule(),
+    horizons: Sequence[int] = MAX_PRICE_HORIZONS,
+    workers: Optional[int] = None,
+) -> SweepResult:
+    """
+    Score every configuration of grid on the daily backtest windows of frames.
+
+    The windows, forward max prices and rolling sums of a symbol are shared
+    by all configurations, peaks and trendlines are fitted once per distance
+    and every tolerance is scored on the same fit. Symbols are spread over
+    workers processes (default one per core); workers=1 runs in this process.
+
+    Parameters:
+    - frames: Daily bars per symbol, as returned by fetch_stock_data_batch.
+    - grid: Values per entry of PARAMETERS; missing entries use DEFAULT_GRID.
+    - period, start_date: Backtest windows, as for analyse_stock_history.
+    - rule: Signal and hit definition the configurations are scored on.
+    - horizons: Forward max price horizons in trading days.
+    """
+    grid = {
+        name: tuple((grid or {}).get(name, DEFAULT_GRID[name])) for name in PARAMETERS
+    }
+    tasks = [
+        (data, grid, period, start_date, rule, tuple(horizons))
+        for data in frames.values()
+    ]
+    configurations = int(np.prod([len(values) for values in grid.values()]))
+    totals = [np.zeros(configurations)] + [
+        np.zeros((configurations, len(horizons))) for _ in range(4)
+    ]
+
+    def accumulate(partials: Tuple[np.ndarray, ...]):
+        for total, partial in zip(totals, partials):
+            total += partial
+
+    logger.info(
+        "Sweeping %d configurations over %d symbols", configurations, len(tasks)
+    )
+    if workers == 1:
+        for task in tasks:
+            accumulate(_sweep_frame(task))
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            chunk_size = max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1)))
+            for partials in executor.map(_sweep_frame, tasks, chunksize=chunk_size):
+                accumulate(partials)
+    return SweepResult(grid, horizons, *totals)
+
+
+def sweep_stocks(
+    stock_symbols: List[str],
+    start_date: str,
+    days: int = 365,
+    **kwargs: Any,
+) -> SweepResult:
+    """
+    Fetch the backtest range once, as backtest_stocks would, and sweep it.
+    Keyword arguments are passed on to parameter_sweep.
+    """
+    end_date = (pd.Timestamp(start_date) + pd.Timedelta(days=days)).strftime("%Y-%m-%d")
+    frames, missing = fetch_stock_data_batch(stock_symbols, start_date, end_date)
+    for symbol in missing:
+        logger.warning("No data for %s, skipping.", symbol)
+    return parameter_sweep(frames, start_date=start_date, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--start", required=True, help="Backtest start date")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--symbols", nargs="+", help="Default: all stocks in the DB")
+    parser.add_argument("--period", type=int, default=3, help="Window in months")
+    for name in PARAMETERS:
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            nargs="+",
+            type=float if name == "tolerance" else int,
+            default=DEFAULT_GRID[name],
+        )
+    defaults = SignalRule()
+    parser.add_argument("--min-accuracy", type=int, default=defaults.min_accuracy)
+    parser.add_argument("--max-rsi", type=float, default=defaults.max_rsi)
+    parser.add_argument("--hit-threshold", type=float, default=defaults.hit_threshold)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--output", default="sweep.csv")
+    args = parser.parse_args()
+    configure_logging()
+
+    symbols = args.symbols
+    if not symbols:
+        from db_client import StockAnalysisDatabase
+
+        db = StockAnalysisDatabase(1, 1)
+        symbols = [stock["stock_symbol"] for stock in db.fetch_all_stocks()]
+        db.close_connection()
+
+    result = sweep_stocks(
+        symbols,
+        args.start,
+        args.days,
+        grid={name: getattr(args, name) for name in PARAMETERS},
+        period=args.period,
+        rule=SignalRule(args.min_accuracy, args.max_rsi, args.hit_threshold),
+        workers=args.workers,
+    )
+    result.to_frame().to_csv(args.output, index=False)
+    logger.info("Saved %d configurations to %s", result.signals.size, args.output)
+    logger.info("Best configurations:\n%s", result.best().to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Trading days in a year, for sizing histories
+TRADING_DAYS = 252
+
+
+def synthetic_ohlcv(
+    bars: int, seed: int = 0, start: str = "2000-01-03", volatility: float = 0.02
+) -> pd.DataFrame:
+    """
+    Daily bars shaped like a yf.download result, with closes following a
+    geometric random walk and volume following the size of the moves.
+    """
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0003, volatility, bars)
+    close = 100 * np.exp(np.cumsum(returns))
+    open_ = close * np.exp(-returns * rng.uniform(0, 1, bars))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, volatility / 2, bars)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, volatility / 2, bars)))
+    volume = (
+        rng.lognormal(13, 0.5, bars) * (1 + 20 * np.abs(returns) / volatility)
+    ).astype(np.int64)
+    index = pd.bdate_range(start, periods=bars, name="Date")
+    return pd.DataFrame(
+        {
+            "Open": open_,
+            "High": high,
+            "Low": low,
+            "Close": close,
+            "Adj Close": close,
+            "Volume": volume,
+        },
+        index=index,
+    )
+
+
+def synthetic_universe(
+    symbols: int, bars: int, seed: int = 0, start: str = "2000-01-03"
+) -> Dict[str, pd.DataFrame]:
+    """Independent synthetic histories for symbols S0, S1, ... over the same dates."""
+    return {f"S{i}": synthetic_ohlcv(bars, seed + i, start) for i in range(symbols)}
+
+
+def synthetic_panel(
+    symbols: int, bars: int, seed: int = 0, start: str = "2000-01-03"
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    (dates x symbols) Close, High and Volume frames for symbols S0, S1, ...,
+    generated column-wise without building a frame per symbol.
+    """
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0003, 0.02, (bars, symbols))
+    close = 100 * np.exp(np.cumsum(returns, axis=0))
+    high = close * (1 + np.abs(rng.normal(0, 0.01, (bars, symbols))))
+    volume = rng.lognormal(13, 0.5, (bars, symbols)) * (1 + 1000 * np.abs(returns))
+    index = pd.bdate_range(start, periods=bars, name="Date")
+    columns = [f"S{i}" for i in range(symbols)]
+    return tuple(
+        pd.DataFrame(values, index=index, columns=columns)
+        for values in (close, high, np.floor(volume))
+    )
+
+
+def synthetic_intraday(
+    days: int,
+    interval_minutes: int = 1,
+    seed: int = 0,
+    start: str = "2024-01-02",
+    volatility: float = 0.001,
+) -> Iterator[Tuple[datetime, float, float, float, float, float]]:
+    """
+    Regular-session (9:30 to 16:00) bars of interval_minutes yielded one at a
+    time as (timestamp, open, high, low, close, volume), a stand-in for a
+    live feed.
+    """
+    rng = np.random.default_rng(seed)
+    per_day = 390 // interval_minutes
+    scale = volatility * np.sqrt(interval_minutes)
+    last_close = 100.0
+    for day in pd.bdate_range(start, periods=days):
+        returns = rng.normal(0.0, scale, per_day)
+        close = last_close * np.exp(np.cumsum(returns))
+        open_ = np.r_[last_close, close[:-1]]
+        high = np.maximum(open_, close) * (
+            1 + np.abs(rng.normal(0, scale / 2, per_day))
+        )
+        low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, scale / 2, per_day)))
+        volume = np.floor(
+            rng.lognormal(8, 0.5, per_day) * (1 + 10 * np.abs(returns) / scale)
+        )
+        session_open = day.to_pydatetime() + timedelta(hours=9, minutes=30)
+        for i in range(per_day):
+            yield (
+                session_open + timedelta(minutes=i * interval_minutes),
+                float(open_[i]),
+                float(high[i]),
+                float(low[i]),
+                float(close[i]),
+                float(volume[i]),
+            )
+        last_close = float(close[-1])
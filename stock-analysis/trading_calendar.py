@@ -0,0 +1,160 @@
+"""
+Trading sessions: weekdays that are not exchange holidays.
+
+Holidays are read from a local CSV file with a date column (by default
+market_holidays.csv next to this module, or the file named by
+TRADING_HOLIDAYS), so lookups never need the network. Sessions are numbered
+consecutively, which turns "n sessions back" and window bounds into integer
+arithmetic instead of date parsing and label slicing. Dates after the
+last year in the file are treated as if they had no holidays, so lookups
+that reach past it log a warning.
+"""
+
+import csv
+import logging
+import os
+from datetime import date
+from functools import lru_cache
+from typing import Iterable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HOLIDAYS_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "market_holidays.csv"
+)
+
+# Session positions count from the first session on or after this day
+_EPOCH = np.datetime64("1970-01-01", "D")
+
+
+def load_holidays(path: str) -> np.ndarray:
+    """Dates in the date column of a holiday CSV file, as datetime64[D]."""
+    with open(path, newline="") as holidays_file:
+        days = [row["date"] for row in csv.DictReader(holidays_file) if row["date"]]
+    return np.unique(np.array(days, dtype="datetime64[D]"))
+
+
+def months_before(day, months: int):
+    """
+    The same day of the month `months` calendar months earlier, clipped to
+    the end of shorter months (e.g. 31 May -> 28 or 29 February). Works on
+    scalars and arrays of dates.
+    """
+    day = np.asarray(day, dtype="datetime64[D]")
+    month = day.astype("datetime64[M]")
+    target = month - months
+    days_in_target = (target + 1).astype("datetime64[D]") - target.astype(
+        "datetime64[D]"
+    )
+    day_of_month = day - month.astype("datetime64[D]")
+    result = target.astype("datetime64[D]") + np.minimum(
+        day_of_month, days_in_target - 1
+    )
+    return result if result.ndim else result[()]
+
+
+class TradingCalendar:
+    """
+    Exchange sessions from a Monday-to-Friday week minus holidays.
+
+    Lookups take dates as strings, dates, datetime64 values or arrays of
+    them, and are vectorised through numpy's business day functions. With
+    covered_through set, the first lookup of a later date logs a warning,
+    since its holidays are unknown.
+    """
+
+    def __init__(self, holidays: Iterable = (), covered_through=None):
+        self.holidays = np.unique(np.array(list(holidays), dtype="datetime64[D]"))
+        self.covered_through = (
+            None if covered_through is None else np.datetime64(covered_through, "D")
+        )
+        self._warned = False
+        self._busdays = np.busdaycalendar(weekmask="1111100", holidays=self.holidays)
+        self._origin = np.busday_offset(
+            _EPOCH, 0, roll="forward", busdaycal=self._busdays
+        )
+
+    @classmethod
+    def from_file(cls, path: str) -> "TradingCalendar":
+        """The calendar of a holiday file, covering up to the end of its last year."""
+        holidays = load_holidays(path)
+        if len(holidays) == 0:
+            return cls()
+        last_year = holidays[-1].astype("datetime64[Y]")
+        return cls(holidays, (last_year + 1).astype("datetime64[D]") - 1)
+
+    def is_session(self, days):
+        """Whether each day is a trading session."""
+        return np.is_busday(self._days(days), busdaycal=self._busdays)
+
+    def sessions(self, start, end) -> np.ndarray:
+        """All sessions from start to end, both inclusive, as datetime64[D]."""
+        first = self.position(start, roll="forward")
+        last = self.position(end, roll="backward")
+        return self.session(np.arange(first, last + 1))
+
+    def position(self, days, roll: str = "raise"):
+        """
+        Number of each session counted from a fixed first session, so the
+        distance between two sessions is the difference of their positions.
+        Days that are not sessions raise ValueError, or with roll="forward"
+        or "backward" take the next or previous session's position.
+        """
+        days = self._days(days)
+        if roll != "raise":
+            days = np.busday_offset(days, 0, roll=roll, busdaycal=self._busdays)
+        elif not np.all(self.is_session(days)):
+            raise ValueError(f"Not a trading session: {days}")
+        return np.busday_count(self._origin, days, busdaycal=self._busdays)
+
+    def session(self, positions):
+        """The sessions at the given positions; the inverse of position."""
+        return np.busday_offset(self._origin, positions, busdaycal=self._busdays)
+
+    def offset(self, days, sessions: int, roll: str = "raise"):
+        """The session `sessions` sessions after (or before, if negative) each day."""
+        return np.busday_offset(
+            self._days(days), sessions, roll=roll, busdaycal=self._busdays
+        )
+
+    def count(self, start, end):
+        """Number of sessions from start up to but excluding end."""
+        return np.busday_count(
+            self._days(start), self._days(end), busdaycal=self._busdays
+        )
+
+    def _days(self, days):
+        days = _days(days)
+        if (
+            self.covered_through is not None
+            and not self._warned
+            and days.size
+            and days.max() > self.covered_through
+        ):
+            self._warned = True
+            logger.warning(
+                "Looking up %s, but the holiday calendar ends on %s; later "
+                "holidays are treated as sessions. Update market_holidays.csv "
+                "or the file named by TRADING_HOLIDAYS.",
+                days.max(),
+                self.covered_through,
+            )
+        return days
+
+
+def _days(days):
+    if isinstance(days, (str, date, np.datetime64)):
+        return np.datetime64(days, "D")
+    return np.asarray(days, dtype="datetime64[D]")
+
+
+@lru_cache(maxsize=None)
+def _calendar(path: str) -> TradingCalendar:
+    return TradingCalendar.from_file(path)
+
+
+def default_calendar(path: Optional[str] = None) -> TradingCalendar:
+    """The calendar of path, TRADING_HOLIDAYS or HOLIDAYS_FILE, loaded once."""
+    return _calendar(path or os.getenv("TRADING_HOLIDAYS") or HOLIDAYS_FILE)
@@ -0,0 +1,277 @@
+from collections import deque
+from datetime import date
+from math import ceil
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import numpy as np
+
+from indicator_state import _to_date, _to_datetime
+from trading_calendar import months_before
+
+
+def _select_by_peak_distance(
+    peaks: np.ndarray, priority: np.ndarray, distance: float
+) -> np.ndarray:
+    """
+    Keep the highest-priority peaks at least `distance` apart.
+
+    Same procedure as scipy.signal.find_peaks uses for its distance argument,
+    so a tracker over a window keeps exactly the peaks find_peaks would.
+    """
+    distance_ = ceil(distance)
+    keep = np.ones(len(peaks), dtype=bool)
+    priority_to_position = np.argsort(priority)
+    for i in range(len(peaks) - 1, -1, -1):
+        j = priority_to_position[i]
+        if not keep[j]:
+            continue
+        k = j - 1
+        while 0 <= k and peaks[j] - peaks[k] < distance_:
+            keep[k] = False
+            k -= 1
+        k = j + 1
+        while k < len(peaks) and peaks[k] - peaks[j] < distance_:
+            keep[k] = False
+            k += 1
+    return keep
+
+
+class TrendlineTracker:
+    """
+    Per-symbol trendline state that is updated one bar at a time.
+
+    Local maxima of the highs are detected as bars arrive. When a candidate
+    is added or expires, the distance filter runs once over all candidates
+    in the window, exactly as find_peaks does (so ties between equally high
+    peaks are broken the same way), and the highest peak, best slope and
+    accuracy are refreshed with array operations over the kept peaks. Bars
+    that do not change the candidates only evaluate the trendline at the
+    new bar.
+
+    With period set, the window is the last period calendar months,
+    data.loc[months_before(last_date, period) : last_date], like
+    IndicatorState and analysis_window_start; with window_bars, the last
+    window_bars bars, keyed by timestamp so intraday bars work too; without
+    either, all bars seen so far, in which case the filter slows down as
+    the candidates accumulate.
+    """
+
+    def __init__(
+        self,
+        distance: int = 5,
+        period: Optional[int] = None,
+        window_bars: Optional[int] = None,
+    ):
+        if distance < 1:
+            raise ValueError("`distance` must be greater or equal to 1")
+        if period is not None and window_bars is not None:
+            raise ValueError("Set at most one of period and window_bars")
+        self.distance = distance
+        self.period = period
+        self.window_bars = window_bars
+        self.dates: Deque[date] = deque()
+        self.highs: Deque[float] = deque()
+        self.closes: Deque[float] = deque()
+        self.start = 0  # Position of dates[0] among all bars seen
+        self.count = 0
+        self._plateau_start = 0
+        self._plateau_rising = False
+        self._last_high: Optional[float] = None
+
+        # Local maxima in bar order, held in growable arrays whose live part
+        # is [_head, _tail): left edge of the plateau, peak position and height
+        self._lefts = np.empty(64, dtype=np.intp)
+        self._positions = np.empty(64, dtype=np.intp)
+        self._heights = np.empty(64, dtype=np.float64)
+        self._head = self._tail = 0
+        self._stale = False
+
+        self.peaks = np.empty(0, dtype=np.intp)
+        self._peak_heights = np.empty(0, dtype=np.float64)
+        self.highest_peak: Optional[int] = None
+        self.slope: Optional[float] = None
+        self.accuracy: Optional[int] = None
+        self.consecutive_days_above: Optional[int] = None
+
+    @classmethod
+    def from_history(
+        cls,
+        data,
+        distance: int = 5,
+        period: Optional[int] = None,
+        window_bars: Optional[int] = None,
+    ) -> "TrendlineTracker":
+        """Build a tracker by replaying a price history bar by bar."""
+        tracker = cls(distance, period, window_bars)
+        for bar_date, high, close in zip(data.index, data["High"], data["Close"]):
+            tracker.update(bar_date, high, close)
+        return tracker
+
+    def _add_high(self, position: int, high: float):
+        """Feed the next high of the peak-search series (all bars but the last)."""
+        if self._last_high is None:
+            self._plateau_start, self._plateau_rising = position, False
+        elif high < self._last_high:
+            if self._plateau_rising:
+                left, right = self._plateau_start, position - 1
+                self._append_candidate(left, (left + right) // 2, self._last_high)
+            self._plateau_start, self._plateau_rising = position, False
+        elif high > self._last_high:
+            self._plateau_start, self._plateau_rising = position, True
+        self._last_high = high
+
+    def _append_candidate(self, left: int, position: int, height: float):
+        if self._tail == len(self._positions):
+            live = slice(self._head, self._tail)
+            size = max(64, 2 * (self._tail - self._head))
+            for name in ("_lefts", "_positions", "_heights"):
+                old = getattr(self, name)
+                new = np.empty(size, dtype=old.dtype)
+                new[: self._tail - self._head] = old[live]
+                setattr(self, name, new)
+            self._head, self._tail = 0, self._tail - self._head
+        self._lefts[self._tail] = left
+        self._positions[self._tail] = position
+        self._heights[self._tail] = height
+        self._tail += 1
+        self._stale = True
+
+    def update(self, bar_date, high: float, close: float) -> Dict[str, Any]:
+        """
+        Append a bar and return its trendline event.
+
+        The event holds the date, trendline_value, breakout_percentage,
+        consecutive_days_above and trendline_accuracy (None without a
+        trendline), and `breakout`, which is True on the first close above
+        the trendline.
+        """
+        bar_date = (
+            _to_date(bar_date) if self.window_bars is None else _to_datetime(bar_date)
+        )
+        if self.dates and bar_date <= self.dates[-1]:
+            raise ValueError(
+                f"Bar for {bar_date} is not after the last bar ({self.dates[-1]})."
+            )
+        if self.count:
+            # The previous bar now has a successor, so it joins the peak search
+            self._add_high(self.count - 1, self.highs[-1])
+        self.dates.append(bar_date)
+        self.highs.append(float(high))
+        self.closes.append(float(close))
+        self.count += 1
+
+        start = self.start
+        if self.period is not None or self.window_bars is not None:
+            if self.period is not None:
+                window_start = months_before(bar_date, self.period).item()
+                while self.dates[0] < window_start:
+                    self._drop_first()
+            else:
+                while len(self.dates) > self.window_bars:
+                    self._drop_first()
+            # A peak needs its rising edge inside the window
+            expired = self._head
+            while expired < self._tail and self._lefts[expired] <= self.start:
+                expired += 1
+            if expired > self._head:
+                self._head = expired
+                self._stale = True
+
+        # Trendline values are computed in window positions, as analyse_stock
+        # does, so a moved window start changes their rounding, and with it
+        # which peaks are within tolerance and which closes are above
+        refitted = self._stale or self.start != start
+        if self._stale:
+            self._fit()
+        elif refitted and self.slope is not None:
+            self._score()
+
+        event = {
+            "date": (
+                bar_date.strftime("%Y-%m-%d")
+                if self.window_bars is None
+                else bar_date.isoformat(sep=" ")
+            ),
+            "trendline_value": None,
+            "breakout_percentage": None,
+            "consecutive_days_above": None,
+            "trendline_accuracy": None,
+            "breakout": False,
+        }
+        if self.slope is None:
+            self.consecutive_days_above = None
+            return event
+
+        intercept = self._intercept()
+        trendline_value = self.slope * (len(self.closes) - 1) + intercept
+        if refitted or self.consecutive_days_above is None:
+            # Walk back only as far as the most recent close below the line
+            days_above = 0
+            for position in range(len(self.closes) - 1, -1, -1):
+                if not self.closes[position] > self.slope * position + intercept:
+                    break
+                days_above += 1
+            self.consecutive_days_above = days_above
+        elif close > trendline_value:
+            self.consecutive_days_above = min(
+                self.consecutive_days_above + 1, len(self.closes)
+            )
+        else:
+            self.consecutive_days_above = 0
+
+        event.update(
+            trendline_value=float(trendline_value),
+            breakout_percentage=(close - trendline_value) / trendline_value * 100,
+            consecutive_days_above=self.consecutive_days_above,
+            trendline_accuracy=self.accuracy,
+            breakout=self.consecutive_days_above == 1,
+        )
+        return event
+
+    def _drop_first(self):
+        self.dates.popleft()
+        self.highs.popleft()
+        self.closes.popleft()
+        self.start += 1
+
+    def _intercept(self) -> float:
+        # Same parametrisation as calculate_trendline, in window positions
+        highest = self.highest_peak - self.start
+        return self.highs[highest] - self.slope * highest
+
+    def _fit(self):
+        """Filter the candidates and refresh the highest peak, slope and accuracy."""
+        self._stale = False
+        self.highest_peak = self.slope = self.accuracy = None
+        self.consecutive_days_above = None
+        live = slice(self._head, self._tail)
+        kept = _select_by_peak_distance(
+            self._positions[live], self._heights[live], self.distance
+        )
+        self.peaks = self._positions[live][kept]
+        if len(self.peaks) == 0:
+            return
+        heights = self._peak_heights = self._heights[live][kept]
+
+        highest = int(np.argmax(heights))
+        self.highest_peak = int(self.peaks[highest])
+        if highest == len(self.peaks) - 1:
+            return
+        later = slice(highest + 1, None)
+        self.slope = float(
+            np.max(
+                (heights[later] - heights[highest])
+                / (self.peaks[later] - self.highest_peak)
+            )
+        )
+
+        self._score()
+
+    def _score(self):
+        """Accuracy of the fitted trendline over the kept peaks."""
+        trendline_at_peaks = self.slope * (self.peaks - self.start) + self._intercept()
+        within_tolerance = (
+            np.abs((self._peak_heights - trendline_at_peaks) / trendline_at_peaks)
+            <= 0.02
+        )
+        self.accuracy = int(np.mean(within_tolerance) * 100)